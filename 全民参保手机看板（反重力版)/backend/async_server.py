@@ -0,0 +1,193 @@
+"""
+async_server.py — asyncio 版 HTTP 服务（可选，python3 server.py --async）
+
+ThreadingHTTPServer 为每个连接新开一个线程：早高峰几百名网格员同时登录时线程数不设上限，
+也没有任何排队与拒绝机制。这里改由单个事件循环接收连接、解析请求，接口计算（含数据库访问）
+交给固定大小的线程池执行：
+  - 并发上限 = 线程池大小（ASYNC_WORKERS，默认与连接池 DB_POOL_SIZE 相同，线程不会空等连接）；
+  - 排队上限 = ASYNC_MAX_PENDING（排队 + 执行中的请求数），超出时立即返回 503 + Retry-After；
+  - 请求须在 ASYNC_HEADER_TIMEOUT 秒内收齐，慢连接不占用线程池；
+  - HTTP/1.1 长连接：响应均带 Content-Length，同一连接上顺序处理多个请求，
+    空闲超过 KEEPALIVE_TIMEOUT 秒（与 server.py 相同）后关闭；空闲连接只占事件循环，不占线程。
+接口处理与 Handler 共用 server.handle_request() / build_response()，路由、鉴权、ETag、
+压缩与响应头完全一致。
+仅依赖标准库。
+
+相关环境变量：
+  ASYNC_WORKERS          线程池大小，默认取 DB_POOL_SIZE（未设置时为 8）
+  ASYNC_MAX_PENDING      排队 + 执行中的请求上限，默认 256
+  ASYNC_HEADER_TIMEOUT   请求读取超时（秒），默认 10
+  KEEPALIVE_TIMEOUT      长连接空闲超时（秒），默认 15，0 = 每个响应后关闭连接
+"""
+import asyncio
+import email.parser
+import email.utils
+import http.client
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+WORKERS = int(os.getenv("ASYNC_WORKERS", "0")) or int(os.getenv("DB_POOL_SIZE", "8")) or 8
+MAX_PENDING = int(os.getenv("ASYNC_MAX_PENDING", "256"))
+HEADER_TIMEOUT = float(os.getenv("ASYNC_HEADER_TIMEOUT", "10"))
+KEEPALIVE_TIMEOUT = float(os.getenv("KEEPALIVE_TIMEOUT", "15"))
+# 请求头 / 请求体大小上限（只有登录接口带请求体）
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+METHODS = ("GET", "POST", "OPTIONS")
+SERVER_HEADER = f"dashboard-backend Python/{sys.version.split()[0]}"
+
+
+class BadRequest(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def _parse_head(head):
+    """请求行 + 头部 → (方法, 目标, 头部, 是否保持连接)。头部为 http.client.HTTPMessage（不区分大小写）。"""
+    line, _, rest = head.partition(b"\r\n")
+    parts = line.decode("iso-8859-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise BadRequest(400, "bad request line")
+    headers = email.parser.BytesParser(_class=http.client.HTTPMessage).parsebytes(rest)
+    # 与 BaseHTTPRequestHandler 相同：HTTP/1.1 默认保持，HTTP/1.0 需显式 keep-alive
+    connection = headers.get("Connection", "").lower()
+    if parts[2] >= "HTTP/1.1":
+        keep_alive = connection != "close"
+    else:
+        keep_alive = connection == "keep-alive"
+    return parts[0], parts[1], headers, keep_alive and KEEPALIVE_TIMEOUT > 0
+
+
+class AsyncServer:
+    """handle_request / build_response 即 server.py 中的同名函数。"""
+
+    def __init__(self, handle_request, build_response, workers=WORKERS, max_pending=MAX_PENDING):
+        self.handle_request = handle_request
+        self.build_response = build_response
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dashboard-api")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def _error(self, code, message):
+        return self.build_response(code, {"ok": False, "message": message})
+
+    async def _read_request(self, reader):
+        """读取一个请求，返回 (方法, 目标, 头部, 请求体, 是否保持连接)；连接在请求前关闭时返回 None。"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise BadRequest(400, "incomplete request") from None
+        except asyncio.LimitOverrunError:
+            raise BadRequest(431, "request header too large") from None
+        method, target, headers, keep_alive = _parse_head(head)
+        if headers.get("Transfer-Encoding"):
+            raise BadRequest(411, "length required")
+        try:
+            length = int(headers.get("Content-Length", "0"))
+        except ValueError:
+            raise BadRequest(400, "bad content-length") from None
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(413, "request body too large")
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method, target, headers, body, keep_alive
+
+    async def _respond(self, method, target, headers, body):
+        if method not in METHODS:
+            return self._error(501, "not implemented")
+        if self.pending >= self.max_pending:
+            code, out, payload = self._error(503, "服务繁忙，请稍后重试")
+            return code, out + [("Retry-After", "1")], payload
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, self.handle_request, method, target, headers, body
+            )
+        except Exception:
+            traceback.print_exc()
+            return self._error(500, "internal error")
+        finally:
+            self.pending -= 1
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        # 首个请求按 HEADER_TIMEOUT 收齐；之后在长连接上等待下一个请求，超时即关闭
+        timeout = HEADER_TIMEOUT
+        try:
+            keep_alive = True
+            while keep_alive:
+                requestline = "-"
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), timeout)
+                except BadRequest as e:
+                    keep_alive, response = False, self._error(e.code, str(e))
+                else:
+                    if request is None:
+                        return
+                    method, target, headers, body, keep_alive = request
+                    requestline = f"{method} {target}"
+                    response = await self._respond(method, target, headers, body)
+                    # 过载时关闭连接，让客户端重连时再排队
+                    keep_alive = keep_alive and response[0] != 503
+                await self._write(writer, *response, keep_alive=keep_alive)
+                _log(peer, requestline, response[0])
+                timeout = KEEPALIVE_TIMEOUT
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, code, headers, body, keep_alive=False):
+        try:
+            reason = HTTPStatus(code).phrase
+        except ValueError:
+            reason = ""
+        lines = [f"HTTP/1.1 {code} {reason}", f"Server: {SERVER_HEADER}", f"Date: {email.utils.formatdate(usegmt=True)}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        # build_response() 的响应都带 Content-Length（304 无响应体），可直接保持连接
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "strict") + body)
+        await writer.drain()
+
+    async def serve(self, host, port, sock=None):
+        """sock 为已在监听的 socket（pre-fork 模式由主进程创建）时直接使用，不再绑定 host / port。"""
+        if sock is not None:
+            srv = await asyncio.start_server(self.handle_connection, sock=sock, limit=MAX_HEADER_BYTES)
+        else:
+            srv = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"dashboard backend (asyncio, workers={self.workers}, max pending={self.max_pending}, pid={os.getpid()}) "
+              f"listening on http://{host}:{port}")
+        async with srv:
+            await srv.serve_forever()
+
+
+def _log(peer, requestline, code):
+    """与 BaseHTTPRequestHandler.log_message 相同格式的访问日志（stderr）。"""
+    host = peer[0] if peer else "-"
+    stamp = time.strftime("%d/%b/%Y %H:%M:%S")
+    sys.stderr.write(f'{host} - - [{stamp}] "{requestline}" {code} -\n')
+
+
+def run(host, port, handle_request, build_response, sock=None):
+    app = AsyncServer(handle_request, build_response)
+    try:
+        asyncio.run(app.serve(host, port, sock))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    import server
+
+    run(server.HOST, server.PORT, server.handle_request, server.build_response)
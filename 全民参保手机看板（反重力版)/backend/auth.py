@@ -6,6 +6,8 @@ import os
 import sys
 import time
 
+from ttl_cache import TTLCache
+
 _secret = os.getenv("DASHBOARD_SECRET", "")
 if not _secret:
     print(
@@ -16,6 +18,11 @@ if not _secret:
     sys.exit(1)
 SECRET = _secret
 TOKEN_TTL = int(os.getenv("DASHBOARD_TOKEN_TTL", "28800"))
+# 已验证 token 的载荷缓存（LRU）：命中时免去 base64 解码、HMAC 重算与 JSON 解析。
+# 条目最长保留一个 TOKEN_TTL，每次命中仍检查 exp；验证失败的 token 不缓存。
+# 以 token 的 SHA-256 摘要为键，进程内存里不留下 token 原文。
+# AUTH_TOKEN_CACHE_SIZE=0 关闭。
+_verified = TTLCache(maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096")), ttl=TOKEN_TTL)
 
 
 def _b64(data: bytes) -> str:
@@ -40,6 +47,21 @@ def issue_token(user_id: str, role: str, unit_id: str) -> str:
 
 
 def verify_token(token: str):
+    """返回 token 载荷（各请求共享，调用方不得修改）；签名不符或已过期时返回 None。"""
+    key = hashlib.sha256(token.encode("utf-8", "surrogatepass")).digest()
+    payload = _verified.get(key)
+    if payload is None:
+        payload = _verify(token)
+        if payload is not None:
+            _verified.set(key, payload)
+        return payload
+    if int(payload.get("exp", 0)) < int(time.time()):
+        _verified.pop(key)
+        return None
+    return payload
+
+
+def _verify(token: str):
     try:
         a, b = token.split(".", 1)
         raw = _ub64(a)
@@ -0,0 +1,201 @@
+"""
+bitmap_index.py — 居民 / 企业标签维度的位图索引（可选）
+
+抽屉筛选与列表接口的标签筛选都是低基数列上的等值条件之交。这里按 (表, 年度)
+把行按 id 升序编号，为每个 (列, 取值) 和每个组织单元各建一个位图（Python int，
+第 i 位 = 第 i 行），于是：
+  - 范围 = 范围内各单元位图之或（按范围缓存），全部单元时直接取全 1；
+  - 筛选 = 范围位图与各条件位图逐个相与，总数 = 结果位图中 1 的个数；
+  - 分页 = 从 after 游标对应的位置（或 offset）起依次取出置位的行号，行号即 id 顺序。
+“本区户籍 ∧ 未参保 ∧ 可动员”这类组合在区级范围内只需几次大整数位运算。
+
+维度为 TAG_COLUMNS，居民另加 this_year_paid（列表接口不提供该筛选，供 count() 直接调用）。
+字典编码存储的列在建索引时还原为文字，查询一律用文字取值。
+
+刷新：按 BITMAP_CHECK_INTERVAL 探测 data_versions 版本号（与 org_tree.py 相同），
+调用方传入已读到的版本号（列表接口传计算 ETag 时读到的版本）时不等探测间隔；
+版本变化时整表重建（低基数列借助 bytes.translate 一次生成整列位串；重建耗时以取数为主，
+五十万行约数秒，数据频繁写入时不宜启用）。
+版本表不可用（旧库）时 page() / count() 返回 None，调用方改走 SQL。
+
+相关环境变量：
+  BITMAP_INDEX             1 = 启用（默认 0）
+  BITMAP_CHECK_INTERVAL    版本探测间隔（秒），默认 1，0 = 每次访问都探测
+"""
+import bisect
+import os
+import threading
+import time
+
+from db import fetch_tuples, read_data_version
+from services_metrics import TAG_COLUMNS
+from tag_codes import get_codec
+
+ENABLED = os.getenv("BITMAP_INDEX", "0").strip() != "0"
+CHECK_INTERVAL = float(os.getenv("BITMAP_CHECK_INTERVAL", "1"))
+
+DIMENSIONS = {
+    "residents": TAG_COLUMNS["residents"] + ("this_year_paid",),
+    "enterprises": TAG_COLUMNS["enterprises"],
+}
+# 每个快照缓存的范围位图个数
+SCOPE_CACHE_SIZE = 64
+# 单页行数超过此值（或不限条数）时不走位图分页
+PAGE_MAX = 1000
+
+
+if hasattr(int, "bit_count"):
+    def _popcount(bits):
+        return bits.bit_count()
+else:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count("1")
+
+
+def _bitmaps(values):
+    """{取值: 位图}。不同取值不超过 255 个时用 bytes.translate 一次生成整列位串。"""
+    n = len(values)
+    distinct = list(dict.fromkeys(values))
+    if not n:
+        return {}
+    if len(distinct) < 256:
+        codes = {v: i for i, v in enumerate(distinct)}
+        stream = bytes(map(codes.__getitem__, values))
+        out = {}
+        for v, i in codes.items():
+            table = bytearray(b"0" * 256)
+            table[i] = ord("1")
+            out[v] = int(stream.translate(table)[::-1], 2)
+        return out
+    buffers = {}
+    for pos, v in enumerate(values):
+        buf = buffers.get(v)
+        if buf is None:
+            buf = buffers[v] = bytearray((n + 7) // 8)
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return {v: int.from_bytes(buf, "little") for v, buf in buffers.items()}
+
+
+class TagBitmaps:
+    """一个 (表, 年度) 的位图快照；构造后只读（范围缓存除外），刷新时整体替换。"""
+
+    def __init__(self, table, year, version, rows, codec):
+        self.table = table
+        self.year = year
+        self.version = version
+        cols = list(zip(*rows)) if rows else [()] * (2 + len(DIMENSIONS[table]))
+        self.ids = list(cols[0])
+        self.all = (1 << len(self.ids)) - 1
+        self.units = _bitmaps(cols[1])
+        self.bitmaps = {}
+        for column, values in zip(DIMENSIONS[table], cols[2:]):
+            for stored, bits in _bitmaps(values).items():
+                text = str(codec.decode(table, column, stored))
+                # 编码存储时不同存储值可能还原为同一文字（如补录的重复取值），按或合并
+                self.bitmaps[(column, text)] = self.bitmaps.get((column, text), 0) | bits
+        self._scopes = {}
+        self._scope_lock = threading.Lock()
+
+    def scope(self, unit_ids):
+        wanted = frozenset(unit_ids)
+        if wanted.issuperset(self.units):
+            return self.all
+        bits = self._scopes.get(wanted)
+        if bits is None:
+            bits = 0
+            for u in wanted:
+                bits |= self.units.get(u, 0)
+            with self._scope_lock:
+                if len(self._scopes) >= SCOPE_CACHE_SIZE:
+                    self._scopes.clear()
+                self._scopes[wanted] = bits
+        return bits
+
+    def match(self, unit_ids, filters):
+        bits = self.scope(unit_ids)
+        for column, value in filters.items():
+            if not bits:
+                break
+            bits &= self.bitmaps.get((column, str(value)), 0)
+        return bits
+
+    def page(self, bits, after=None, offset=0, limit=100):
+        """从 after 之后（或跳过 offset 个）取至多 limit 个 id。"""
+        start = bisect.bisect_right(self.ids, after) if after is not None else 0
+        bits >>= start
+        if not bits or limit == 0:
+            return []
+        # 低位在前的位串，str.find 逐个定位置位的行
+        s = format(bits, "b")[::-1]
+        out, pos = [], s.find("1")
+        while pos >= 0 and offset:
+            offset -= 1
+            pos = s.find("1", pos + 1)
+        while pos >= 0 and len(out) < limit:
+            out.append(self.ids[start + pos])
+            pos = s.find("1", pos + 1)
+        return out
+
+
+def _load(conn, table, year, version):
+    columns = ("id", "unit_id") + DIMENSIONS[table]
+    rows = fetch_tuples(conn, f"SELECT {', '.join(columns)} FROM {table} WHERE year=? ORDER BY id", [year])
+    return TagBitmaps(table, year, version, rows, get_codec(conn))
+
+
+_lock = threading.Lock()
+_snapshots = {}
+_checked = {}
+
+
+def get_bitmaps(conn, table, year, version=None):
+    """
+    当前版本的位图快照；未启用或 data_versions 不可用时返回 None。
+    version 为调用方已读到的版本号（如计算 ETag 时读取的）：快照比它旧时立即重建，
+    不等探测间隔，保证响应内容不落后于 ETag 所对应的版本。
+    """
+    if not ENABLED:
+        return None
+    key = (table, int(year))
+    snap = _snapshots.get(key)
+    now = time.monotonic()
+    if snap is not None:
+        if version is not None and snap.version >= version:
+            return snap
+        if version is None and now - _checked.get(key, 0.0) < CHECK_INTERVAL:
+            return snap
+    current = read_data_version(conn, table)
+    if current is None:
+        return None
+    if snap is None or snap.version != current:
+        with _lock:
+            snap = _snapshots.get(key)
+            if snap is None or snap.version != current:
+                snap = _snapshots[key] = _load(conn, table, int(year), current)
+    _checked[key] = now
+    return snap
+
+
+def count(conn, table, unit_ids, year, filters, version=None):
+    """标签等值条件之交的精确总数；位图不可用时返回 None。version 同 get_bitmaps()。"""
+    snap = get_bitmaps(conn, table, year, version)
+    if snap is None:
+        return None
+    return _popcount(snap.match(unit_ids, filters))
+
+
+def page(conn, table, unit_ids, year, filters, after=None, offset=0, limit=100, version=None):
+    """返回 (本页 id 列表, 总数)；位图不可用或页太大时返回 None。version 同 get_bitmaps()。"""
+    if limit < 0 or limit > PAGE_MAX or offset < 0:
+        return None
+    snap = get_bitmaps(conn, table, year, version)
+    if snap is None:
+        return None
+    bits = snap.match(unit_ids, filters)
+    return snap.page(bits, after, offset, limit), _popcount(bits)
+
+
+def clear():
+    with _lock:
+        _snapshots.clear()
+        _checked.clear()
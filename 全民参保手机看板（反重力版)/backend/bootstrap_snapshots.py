@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bootstrap_snapshots.py — /api/bootstrap 看板数据快照
+
+_build_bootstrap 为每个居民 / 企业生成的地址、家庭、雇主、村居归属都由
+_stable_hash / _seeded_rand 决定，结果只随数据变化。这里把序列化后的 JSON
+按 (根单元, 年度, 数据版本) 落盘，请求直接返回文件字节。
+
+每份快照是一个目录，内含若干命名部分（part）：v1 只有 dashboard 一个部分；
+v2 为层级汇总 summary 加每个村居的居民 / 企业记录。
+
+数据版本取自 data_versions 中 org_units / residents / enterprises 三项（由触发器递增）：
+  - 当前版本的快照存在：直接返回；
+  - 只有旧版本快照：先返回旧快照，同时在后台线程重建；
+  - 没有任何快照：当场构建并落盘；
+  - 版本表缺失（未执行 migrate_add_data_versions.py）：每次现算，不落盘。
+
+相关环境变量：
+  BOOTSTRAP_SNAPSHOTS=0       关闭快照，每次现算
+  BOOTSTRAP_SNAPSHOT_DIR      快照目录，默认 backend/data/snapshots
+
+使用方法（预热，可选）：
+    cd backend
+    python3 bootstrap_snapshots.py warm             # 为全部启用用户的根单元构建快照
+    python3 bootstrap_snapshots.py warm --year 2025
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from db import connection, read_data_versions
+from org_tree import get_org_tree
+
+ENABLED = os.getenv("BOOTSTRAP_SNAPSHOTS", "1").strip() != "0"
+SNAPSHOT_DIR = Path(os.getenv("BOOTSTRAP_SNAPSHOT_DIR", str(Path(__file__).parent / "data" / "snapshots")))
+VERSION_TABLES = ("org_units", "residents", "enterprises")
+
+
+def snapshot_root(tree, unit_id):
+    """bootstrap 的根单元：网格员看所属村居，其余角色看本单元。"""
+    unit = tree.by_id.get(unit_id)
+    if unit is not None and unit["level"] == "grid":
+        return unit["parent_id"]
+    return unit_id
+
+
+def serialize(dashboard):
+    return json.dumps(dashboard, ensure_ascii=False).encode("utf-8")
+
+
+def safe_name(value):
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", str(value))
+
+
+def clear_snapshots(directory=SNAPSHOT_DIR):
+    """删除全部快照（重建数据库后版本号从头计数，旧快照可能与新版本号撞名）。"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return 0
+    n = 0
+    for p in directory.iterdir():
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+            n += 1
+    return n
+
+
+class Snapshot(NamedTuple):
+    """一次读取的结果：data 为所请求部分的 JSON 字节（不存在时为 None）。"""
+
+    data: Optional[bytes]
+    version: Optional[str]
+    fresh: bool
+
+
+class SnapshotStore:
+    """
+    按 (根单元, 年度, 数据版本) 保存快照目录；build_fn(conn, root_id, year) 现算并返回
+    {part: JSON 字节}。子目录用于区分不同种类的快照（如 v2）。
+    """
+
+    def __init__(self, directory, build_fn):
+        self.directory = Path(directory)
+        self.build_fn = build_fn
+        self._lock = threading.Lock()
+        self._inflight = set()
+
+    def _prefix(self, root_id, year):
+        return f"{safe_name(root_id)}_{int(year)}_"
+
+    def _path(self, root_id, year, version):
+        return self.directory / f"{self._prefix(root_id, year)}{version}"
+
+    def _existing(self, root_id, year):
+        if not self.directory.is_dir():
+            return []
+        found = [p for p in self.directory.glob(f"{self._prefix(root_id, year)}*") if p.is_dir() and not p.name.endswith(".tmp")]
+        return sorted(found, key=lambda p: p.stat().st_mtime)
+
+    @staticmethod
+    def _read(snapshot_dir, part):
+        try:
+            return (snapshot_dir / f"{safe_name(part)}.json").read_bytes()
+        except OSError:
+            return None
+
+    def get(self, conn, root_id, year, part):
+        """读取当前版本快照的某一部分；只有旧版本时返回旧快照（fresh=False）并在后台重建。"""
+        versions = read_data_versions(conn, VERSION_TABLES)
+        if versions is None:
+            parts = self.build_fn(conn, root_id, year)
+            return Snapshot(parts.get(part), None, True)
+        version = "-".join(str(v) for v in versions)
+
+        current = self._path(root_id, year, version)
+        if current.is_dir():
+            return Snapshot(self._read(current, part), version, True)
+
+        stale = self._existing(root_id, year)
+        if stale:
+            self._schedule(root_id, year)
+            latest = stale[-1]
+            return Snapshot(self._read(latest, part), latest.name[len(self._prefix(root_id, year)):], False)
+
+        parts = self.rebuild(conn, root_id, year, version)
+        return Snapshot(parts.get(part), version, True)
+
+    def get_version(self, root_id, year, version, part):
+        """读取指定版本快照的某一部分（游标分页沿用首页的版本）；该版本已被替换时返回 None。"""
+        return self._read(self._path(root_id, year, safe_name(version)), part)
+
+    def rebuild(self, conn, root_id, year, version=None):
+        """现算并原子落盘，删除同一 (根单元, 年度) 的旧快照，返回 {part: JSON 字节}。"""
+        if version is None:
+            versions = read_data_versions(conn, VERSION_TABLES)
+            if versions is None:
+                return self.build_fn(conn, root_id, year)
+            version = "-".join(str(v) for v in versions)
+        # 版本号在读取数据之前确定：构建期间若有新写入，版本号会继续前进，下次请求再重建
+        parts = self.build_fn(conn, root_id, year)
+        path = self._path(root_id, year, version)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        for part, data in parts.items():
+            (tmp / f"{safe_name(part)}.json").write_bytes(data)
+        try:
+            os.rename(tmp, path)
+        except OSError:  # 并发重建时目标目录已存在，保留先写完的那份
+            shutil.rmtree(tmp, ignore_errors=True)
+        for old in self._existing(root_id, year):
+            if old != path:
+                shutil.rmtree(old, ignore_errors=True)
+        return parts
+
+    def _schedule(self, root_id, year):
+        key = (root_id, int(year))
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._inflight.add(key)
+        threading.Thread(target=self._background, args=key, daemon=True).start()
+
+    def _background(self, root_id, year):
+        try:
+            with connection() as conn:
+                self.rebuild(conn, root_id, year)
+        except Exception as e:  # 后台重建失败不影响请求，下次请求会再次尝试
+            print(f"bootstrap snapshot rebuild failed ({root_id}, {year}): {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard((root_id, year))
+
+
+def main():
+    from server import bootstrap_store, bootstrap_v2_store
+
+    parser = argparse.ArgumentParser(description="预热 /api/bootstrap 快照")
+    parser.add_argument("command", choices=["warm"])
+    parser.add_argument("--year", type=int, default=2026)
+    args = parser.parse_args()
+
+    with connection() as conn:
+        tree = get_org_tree(conn)
+        units = [r["unit_id"] for r in conn.execute("SELECT DISTINCT unit_id FROM users WHERE enabled=1").fetchall()]
+        roots = sorted({snapshot_root(tree, u) for u in units if u in tree.by_id})
+        for root_id in roots:
+            data = bootstrap_store.rebuild(conn, root_id, args.year)["dashboard"]
+            parts = bootstrap_v2_store.rebuild(conn, root_id, args.year)
+            print(f"snapshot ok: {root_id} {args.year} (v1 {len(data)} bytes, v2 {len(parts)} parts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+check_query_plans.py — 热点查询执行计划回归检查（SQLite）
+
+按真实调用路径执行各热点查询（指标计算、列表分页 / 续读、列表总数、汇总增量刷新），
+记录实际发出的 SQL，逐条 EXPLAIN QUERY PLAN：
+  - 居民 / 企业表出现 SCAN（全表或全索引扫描）即判失败；
+  - 居民 / 企业表的访问既不是按 (year, unit_id) 定位、也不是按检索索引给出的 rowid 或
+    位图索引给出的 id 回表，判失败（例如优化器改用某个标签列索引扫遍全库）；约束列从计划行的
+    “(a=? AND b=?)” 中解析后按集合比较，索引列顺序不同（unit_id, year）不影响判定；
+  - 标记为“应覆盖”的查询（只读指标 / 标签列的部分）没有用上 COVERING INDEX 也判失败。
+任一失败时退出码为 1，可直接放进上线前的检查步骤。汇总刷新产生的写入最后回滚，不改动数据。
+
+使用方法：
+    cd backend
+    python3 check_query_plans.py          # 使用 DASHBOARD_DB 指向的库
+    python3 check_query_plans.py -v       # 同时打印每条查询的执行计划
+"""
+import argparse
+import re
+import sys
+
+import bitmap_index
+import list_counts
+from db import DB_ENGINE, get_conn
+from metric_rollups import refresh_units
+from services_metrics import (
+    _fetch_enterprises,
+    _fetch_residents,
+    compute_metrics_sql,
+    encode_cursor,
+    fetch_metric_rows,
+    filter_hash,
+    query_enterprises,
+    query_residents,
+)
+
+HOT_TABLES = ("residents", "enterprises")
+_SCAN = re.compile(r"\bSCAN (\w+)")
+_ACCESS = re.compile(r"\b(?:SEARCH|SCAN) (residents|enterprises)\b")
+_CONSTRAINT = re.compile(r"\(([^()]*[=<>]\?[^()]*)\)\s*$")
+_TERM = re.compile(r"^(\w+)\s*(=|>=|<=|>|<)")
+
+
+def _scoped(step):
+    """
+    计划行的索引约束是否按 (year, unit_id) 定位，或按 rowid / id 回表。
+    约束列从末尾的 "(a=? AND b>?)" 中解析，按列集合比较，与索引列顺序无关。
+    """
+    m = _CONSTRAINT.search(step)
+    if not m:
+        return False
+    equal = set()
+    for term in m.group(1).split(" AND "):
+        t = _TERM.match(term.strip())
+        if t and t.group(2) == "=":
+            equal.add(t.group(1))
+    return {"year", "unit_id"} <= equal or "rowid" in equal or "id" in equal
+
+
+def _sample_scope(conn):
+    """取数据最多的 (年度, 单元) 所在年度，以及该年度下的前几个单元作为查询范围。"""
+    row = conn.execute(
+        "SELECT year, unit_id, COUNT(1) c FROM residents GROUP BY year, unit_id ORDER BY c DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None, []
+    year = int(row["year"])
+    units = [r["unit_id"] for r in conn.execute(
+        "SELECT DISTINCT unit_id FROM residents WHERE year=? ORDER BY unit_id LIMIT 5", [year]
+    ).fetchall()]
+    return year, units
+
+
+def _scenarios(conn, year, units):
+    """[(名称, 应覆盖, 调用)]；应覆盖的查询只读索引内的列。"""
+    first = conn.execute("SELECT MIN(id) i FROM residents WHERE year=?", [year]).fetchone()["i"] or ""
+    tag = conn.execute(
+        "SELECT household, this_year_type, name FROM residents WHERE year=? LIMIT 1", [year]
+    ).fetchone()
+    tags = {"household": tag["household"], "this_year_type": tag["this_year_type"]} if tag else {}
+    after = encode_cursor(first, filter_hash("residents", units, year, tags), 0)
+    return [
+        ("指标取数 fetch_metric_rows(residents)", True, lambda: fetch_metric_rows(conn, "residents", units, year)),
+        ("指标取数 fetch_metric_rows(enterprises)", True, lambda: fetch_metric_rows(conn, "enterprises", units, year)),
+        ("SQL 下推 compute_metrics_sql", True, lambda: compute_metrics_sql(conn, units, year)),
+        ("逐行引擎 _fetch_residents", False, lambda: _fetch_residents(conn, units, year)),
+        ("逐行引擎 _fetch_enterprises", False, lambda: _fetch_enterprises(conn, units, year)),
+        ("居民列表首页 + 总数", False, lambda: query_residents(conn, units, year, dict(tags))),
+        ("居民列表游标续读", False, lambda: query_residents(conn, units, year, dict(tags, after=after))),
+        ("居民列表姓名检索", False, lambda: query_residents(conn, units, year, {"name": tag["name"] if tag else ""})),
+        ("企业列表首页 + 总数", False, lambda: query_enterprises(conn, units, year, {"risk": "高", "offset": 0})),
+        ("汇总增量刷新 refresh_units", True, lambda: refresh_units(conn, [(u, year) for u in units])),
+    ]
+
+
+def _plan(conn, sql):
+    return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+
+
+def check(conn, verbose=False):
+    """返回失败说明列表；为空表示全部通过。"""
+    year, units = _sample_scope(conn)
+    if not units:
+        return ["residents 表为空，无法检查执行计划（先执行 seed_db.py）"]
+
+    # 位图索引（BITMAP_INDEX=1）按整年装载是一次性开销，先装好，不计入热点查询
+    for table in HOT_TABLES:
+        bitmap_index.get_bitmaps(conn, table, year)
+
+    failures = []
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        for name, covering, call in _scenarios(conn, year, units):
+            list_counts.clear()
+            statements.clear()
+            call()
+            for sql in list(statements):
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                if not any(re.search(rf"\b(FROM|JOIN) {t}\b", sql) for t in HOT_TABLES):
+                    continue
+                plan = _plan(conn, sql)
+                if verbose:
+                    print(f"[{name}] {sql[:120]}")
+                    for step in plan:
+                        print(f"    {step}")
+                scans = [step for step in plan if (m := _SCAN.search(step)) and m.group(1) in HOT_TABLES]
+                unscoped = [step for step in plan if _ACCESS.search(step) and not _scoped(step)]
+                if scans:
+                    failures.append(f"{name}: {scans[0]}")
+                elif unscoped:
+                    failures.append(f"{name}: 未按 year / unit_id 定位 — {unscoped[0]}")
+                elif covering and not any(
+                    "COVERING INDEX" in step for step in plan if re.search(r"\b(residents|enterprises)\b", step)
+                ):
+                    failures.append(f"{name}: 未使用覆盖索引 — {' | '.join(plan)}")
+    finally:
+        conn.set_trace_callback(None)
+        conn.rollback()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点查询执行计划回归检查")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印每条查询的执行计划")
+    args = parser.parse_args()
+
+    if DB_ENGINE == "mysql":
+        print("check_query_plans.py 只检查 SQLite 的 EXPLAIN QUERY PLAN；MySQL 请在库上用 EXPLAIN 核对 type 不为 ALL")
+        sys.exit(2)
+
+    conn = get_conn()
+    try:
+        failures = check(conn, args.verbose)
+    finally:
+        conn.close()
+    for f in failures:
+        print(f"FAIL {f}")
+    if failures:
+        sys.exit(1)
+    print("query plans ok")
+
+
+if __name__ == "__main__":
+    main()
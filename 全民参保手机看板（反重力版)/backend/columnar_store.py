@@ -0,0 +1,452 @@
+"""
+columnar_store.py — 进程内列式数据（NumPy，可选）
+
+看板流量读多写少：按 (表, 年度) 把 residents / enterprises 装入 NumPy 列数组，常驻进程内，
+各处理线程共享，之后的指标计算与列表计数不再回库取行。
+  - 标签列存为小整数编码（每列一张取值表，取值按首次出现顺序编号），数值列存为 int8 / int16；
+  - 行按 (unit_id, id) 排列，与单遍内核的扫描顺序一致，职工参保分类计数的键顺序因而相同；
+  - 范围（unit_ids）先换成单元掩码，再按行展开为布尔掩码；范围覆盖全部单元时直接用整列。
+compute_metrics_columnar() 用掩码、count_nonzero 与 bincount 算出全部计数器，交给
+metrics_from_counters 组装，输出与其它引擎逐字节一致；scope_view() 给出的 ColumnarView
+可代替行列表直接传给 services_metrics 的 compute_*_metrics。count() 为列表接口的标签筛选
+给出精确总数。字典编码存储（tag_codes.py）的列在装载时还原为文字。
+
+刷新：访问时按 COLUMNAR_CHECK_INTERVAL 探测 data_versions 版本号（与 org_tree.py 相同），
+调用方传入已读到的版本号（接口传计算 ETag 时读到的版本）时不等探测间隔；
+版本变化时按 unit_data_versions（触发器记录的各 (表, 单元, 年度) 最近变更版本）只重载
+发生变化的单元，变化单元超过一半或该表不存在时整表重载。
+
+NumPy 为可选依赖（pip3 install numpy）；未安装时 available() 为 False，调用方退回单遍内核。
+
+相关环境变量：
+  METRICS_ENGINE=columnar       启用（见 server.py）
+  COLUMNAR_CHECK_INTERVAL       版本探测间隔（秒），默认 1，0 = 每次访问都探测
+"""
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+from db import DB_ENGINE, fetch_tuples, read_data_version
+from services_metrics import (
+    AGE_GROUPS,
+    CONFIRMED_LOSSES,
+    ENTERPRISE_METRIC_COLUMNS,
+    METRIC_PARTS,
+    PAUSE_FLOWS,
+    RESIDENT_METRIC_COLUMNS,
+    TAG_COLUMNS,
+    metrics_from_counters,
+)
+from tag_codes import get_codec
+
+CHECK_INTERVAL = float(os.getenv("COLUMNAR_CHECK_INTERVAL", "1"))
+
+# 数值列及其 dtype；其余指标列 / 标签列按分类列编码
+NUMERIC_COLUMNS = {
+    "residents": {"this_year_paid": "int8", "last_year_local_paid": "int8", "age": "int16"},
+    "enterprises": {"staff_insured": "int8", "last_month_staff_insured": "int8"},
+}
+_METRIC_COLUMNS = {"residents": RESIDENT_METRIC_COLUMNS, "enterprises": ENTERPRISE_METRIC_COLUMNS}
+CATEGORICAL_COLUMNS = {
+    table: tuple(dict.fromkeys(
+        c for c in _METRIC_COLUMNS[table] + TAG_COLUMNS[table] if c not in NUMERIC_COLUMNS[table]
+    ))
+    for table in _METRIC_COLUMNS
+}
+# 变化单元占比超过此值时整表重载，比逐单元合并更省
+DELTA_MAX_FRACTION = 0.5
+
+# ── 单元变更版本表 DDL（供迁移脚本使用，与 schema.sql / schema_mysql.sql 保持一致）──
+_DDL_SQLITE = """
+CREATE TABLE IF NOT EXISTS unit_data_versions (
+  table_name TEXT NOT NULL,
+  unit_id TEXT NOT NULL,
+  year INTEGER NOT NULL,
+  version INTEGER NOT NULL,
+  PRIMARY KEY (table_name, year, unit_id)
+);
+"""
+_DDL_MYSQL = """
+CREATE TABLE IF NOT EXISTS unit_data_versions (
+    table_name VARCHAR(32) NOT NULL,
+    unit_id    VARCHAR(64) NOT NULL,
+    year       INT         NOT NULL,
+    version    BIGINT      NOT NULL,
+    PRIMARY KEY (table_name, year, unit_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+"""
+for _table in ("residents", "enterprises"):
+    _DDL_SQLITE += f"""CREATE TRIGGER IF NOT EXISTS trg_{_table}_unit_version_i AFTER INSERT ON {_table}
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = '{_table}';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{_table}_unit_version_u AFTER UPDATE ON {_table}
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = '{_table}';
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = '{_table}';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_{_table}_unit_version_d AFTER DELETE ON {_table}
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = '{_table}';
+END;
+"""
+    _DDL_MYSQL += f"""DROP TRIGGER IF EXISTS trg_{_table}_unit_version_i;
+CREATE TRIGGER trg_{_table}_unit_version_i AFTER INSERT ON {_table} FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', NEW.unit_id, NEW.year, d.version FROM data_versions d WHERE d.name = '{_table}'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_{_table}_unit_version_u;
+CREATE TRIGGER trg_{_table}_unit_version_u AFTER UPDATE ON {_table} FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', u.unit_id, u.year, d.version
+    FROM data_versions d, (SELECT OLD.unit_id AS unit_id, OLD.year AS year UNION SELECT NEW.unit_id, NEW.year) u
+    WHERE d.name = '{_table}'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_{_table}_unit_version_d;
+CREATE TRIGGER trg_{_table}_unit_version_d AFTER DELETE ON {_table} FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT '{_table}', OLD.unit_id, OLD.year, d.version FROM data_versions d WHERE d.name = '{_table}'
+    ON DUPLICATE KEY UPDATE version = d.version;
+"""
+
+DDL = _DDL_MYSQL if DB_ENGINE == "mysql" else _DDL_SQLITE
+
+
+def available():
+    return np is not None
+
+
+# ── 列式快照 ───────────────────────────────────────────────────────────────────
+class ColumnTable:
+    """
+    一个 (表, 年度) 的列式快照；构造后只读，可在线程间共享，刷新时整体替换。
+    columns 中分类列为 int32 编码，vocabs[列][编码] 为对应文字。
+    """
+
+    def __init__(self, table, year, version, units, unit_codes, columns, vocabs):
+        self.table = table
+        self.year = year
+        self.version = version
+        self.units = units
+        self.unit_codes = unit_codes
+        self.columns = columns
+        self.vocabs = vocabs
+        self.unit_index = {u: i for i, u in enumerate(units)}
+        self.vocab_index = {col: {v: i for i, v in enumerate(vocab)} for col, vocab in vocabs.items()}
+        self.rows = len(unit_codes)
+
+    def code(self, column, value):
+        """文字 → 编码；没有该取值时为 -1（与任何行都不相等）。"""
+        return self.vocab_index[column].get(value, -1)
+
+    def codes(self, column, values):
+        return np.array([self.code(column, v) for v in values], dtype=np.int32)
+
+    def selector(self, unit_ids):
+        """范围内的行：覆盖全部单元时为整列切片，否则为布尔掩码。"""
+        wanted = [self.unit_index[u] for u in set(unit_ids) if u in self.unit_index]
+        if len(wanted) == len(self.units):
+            return slice(None)
+        unit_mask = np.zeros(len(self.units), dtype=bool)
+        unit_mask[wanted] = True
+        return unit_mask[self.unit_codes]
+
+
+def _load_rows(conn, table, year, unit_ids=None):
+    """按 (unit_id, id) 顺序取回列式快照所需的列（元组列表）。"""
+    columns = ("unit_id",) + tuple(NUMERIC_COLUMNS[table]) + CATEGORICAL_COLUMNS[table]
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE year=?"
+    params = [year]
+    if unit_ids is not None:
+        sql += f" AND unit_id IN ({','.join(['?'] * len(unit_ids))})"
+        params.extend(unit_ids)
+    return fetch_tuples(conn, sql + " ORDER BY unit_id, id", params)
+
+
+def _encode(values, vocab, index, decode):
+    """把一列取值换成编码数组；新出现的文字追加到 vocab / index。每个不同取值只解码一次。"""
+    mapping = {}
+    for raw in set(values):
+        text = decode(raw)
+        code = index.get(text)
+        if code is None:
+            code = index[text] = len(vocab)
+            vocab.append(text)
+        mapping[raw] = code
+    return np.fromiter(map(mapping.__getitem__, values), dtype=np.int32, count=len(values))
+
+
+def _columnize(table, rows, units, unit_index, vocabs, codec):
+    """行 → (单元编码, {列: 数组})；units / unit_index / vocabs 原地扩充。"""
+    n = len(rows)
+    cols = list(zip(*rows)) if rows else [()] * (1 + len(NUMERIC_COLUMNS[table]) + len(CATEGORICAL_COLUMNS[table]))
+    unit_codes = _encode(cols[0], units, unit_index, lambda u: u)
+    arrays = {}
+    for i, (name, dtype) in enumerate(NUMERIC_COLUMNS[table].items(), start=1):
+        arrays[name] = np.fromiter(cols[i], dtype=dtype, count=n)
+    offset = 1 + len(NUMERIC_COLUMNS[table])
+    for i, name in enumerate(CATEGORICAL_COLUMNS[table], start=offset):
+        vocab = vocabs.setdefault(name, [])
+        index = {v: j for j, v in enumerate(vocab)}
+        arrays[name] = _encode(cols[i], vocab, index, lambda v, name=name: codec.decode(table, name, v))
+    return unit_codes, arrays
+
+
+def build_table(conn, table, year, version):
+    """整表装载。"""
+    units, vocabs = [], {}
+    unit_codes, columns = _columnize(table, _load_rows(conn, table, year), units, {}, vocabs, get_codec(conn))
+    return ColumnTable(table, year, version, units, unit_codes, columns, vocabs)
+
+
+def merge_units(conn, base, unit_ids, version):
+    """只重载 unit_ids 这些单元的行，其余单元沿用 base 的数组。"""
+    units, vocabs = list(base.units), {col: list(v) for col, v in base.vocabs.items()}
+    unit_index = dict(base.unit_index)
+    unit_ids = sorted(unit_ids)
+    new_codes, new_columns = _columnize(
+        base.table, _load_rows(conn, base.table, base.year, unit_ids), units, unit_index, vocabs, get_codec(conn)
+    )
+    changed = np.zeros(len(units), dtype=bool)
+    changed[[unit_index[u] for u in unit_ids if u in unit_index]] = True
+    keep = ~changed[base.unit_codes]
+    unit_codes = np.concatenate([base.unit_codes[keep], new_codes])
+    columns = {name: np.concatenate([base.columns[name][keep], new_columns[name]]) for name in base.columns}
+    # 单元按 unit_id 排序；各单元的行整体来自同一来源且已按 id 排列，稳定排序即可恢复 (unit_id, id) 顺序
+    rank = np.empty(len(units), dtype=np.int64)
+    rank[np.argsort(np.array(units, dtype=object), kind="stable")] = np.arange(len(units))
+    order = np.argsort(rank[unit_codes], kind="stable")
+    return ColumnTable(
+        base.table, base.year, version, units, unit_codes[order],
+        {name: arr[order] for name, arr in columns.items()}, vocabs,
+    )
+
+
+def changed_units(conn, table, year, since):
+    """版本号 since 之后（含）发生变化的单元；unit_data_versions 不存在时返回 None。"""
+    try:
+        rows = conn.execute(
+            "SELECT unit_id FROM unit_data_versions WHERE table_name=? AND year=? AND version>=?",
+            [table, year, since],
+        ).fetchall()
+    except Exception:
+        return None
+    return [r["unit_id"] for r in rows]
+
+
+class ColumnarStore:
+    """进程级列式快照集合，按 (表, 年度) 懒加载。"""
+
+    def __init__(self):
+        self.enabled = False
+        self._tables = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """启用列式数据（NumPy 未安装时返回 False）。"""
+        self.enabled = available()
+        return self.enabled
+
+    def table(self, conn, table, year, version=None):
+        """
+        当前版本的 ColumnTable；data_versions 不可用（旧库）时返回 None。
+        version 为调用方已读到的版本号（如计算 ETag 时读取的）：快照比它旧时立即刷新，
+        不等探测间隔，保证响应内容不落后于 ETag 所对应的版本。
+        """
+        key = (table, int(year))
+        snap = self._tables.get(key)
+        now = time.monotonic()
+        if snap is not None:
+            if version is not None and snap.version >= version:
+                return snap
+            if version is None and now - self._checked.get(key, 0.0) < CHECK_INTERVAL:
+                return snap
+        current = read_data_version(conn, table)
+        if current is None:
+            return None
+        if snap is None or snap.version != current:
+            with self._lock:
+                snap = self._tables.get(key)
+                if snap is None or snap.version != current:
+                    snap = self._tables[key] = self._reload(conn, table, int(year), snap, current)
+        self._checked[key] = now
+        return snap
+
+    def _reload(self, conn, table, year, base, version):
+        if base is not None:
+            units = changed_units(conn, table, year, base.version)
+            if units is not None and len(units) <= DELTA_MAX_FRACTION * max(len(base.units), 1):
+                return merge_units(conn, base, units, version)
+        return build_table(conn, table, year, version)
+
+    def count(self, conn, table, unit_ids, year, tag_filters, version=None):
+        """标签列等值筛选的精确总数；未启用或取值无法比较时返回 None（调用方改走 SQL）。version 同 table()。"""
+        if not self.enabled or not unit_ids:
+            return None
+        snap = self.table(conn, table, year, version)
+        if snap is None:
+            return None
+        sel = snap.selector(unit_ids)
+        mask = np.ones(snap.rows, dtype=bool)[sel]
+        for column, value in tag_filters.items():
+            arr = snap.columns[column][sel]
+            if column in NUMERIC_COLUMNS[table]:
+                try:
+                    mask &= arr == int(value)
+                except (TypeError, ValueError):
+                    return None
+            else:
+                mask &= arr == snap.code(column, str(value))
+        return int(np.count_nonzero(mask))
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._checked.clear()
+
+
+store = ColumnarStore()
+
+
+# ── 向量化指标 ─────────────────────────────────────────────────────────────────
+def _count(mask):
+    return int(np.count_nonzero(mask))
+
+
+def _first_seen_counts(vocab, codes):
+    """{文字: 数量}，按首次出现顺序排列，跳过空取值（与内核的 `if big:` 一致）。"""
+    if not len(codes):
+        return {}
+    uniq, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    out = {}
+    for j in np.argsort(first, kind="stable"):
+        key = vocab[uniq[j]]
+        if key:
+            out[key] = int(counts[j])
+    return out
+
+
+def _resident_counters(t, unit_ids):
+    sel = t.selector(unit_ids)
+
+    def col(name):
+        return t.columns[name][sel]
+
+    paid, ytype, stock, loss = col("this_year_paid"), col("this_year_type"), col("stock_change_type"), col("loss_reason")
+    is_paid = paid == 1
+    is_staff = ytype == t.code("this_year_type", "职工保")
+    free = (
+        (paid == 0)
+        & ~np.isin(stock, t.codes("stock_change_type", CONFIRMED_LOSSES))
+        & ~np.isin(loss, t.codes("loss_reason", CONFIRMED_LOSSES))
+    )
+    local = (col("household") == t.code("household", "本区户籍")) | (col("residence") == t.code("residence", "本区居住"))
+    c = {
+        "total_pop": len(paid),
+        "done_total": _count(is_paid),
+        "done_staff": _count(is_paid & is_staff),
+        "done_resident": _count(is_paid & (ytype == t.code("this_year_type", "居民保"))),
+        "mobilizable_stock": _count(free & (stock == t.code("stock_change_type", "可动员"))),
+        "mobilizable_increment": _count(free & (col("last_year_local_paid") == 0) & local),
+        "staff_people": _count(is_staff),
+    }
+
+    age = col("age")
+    male = col("gender") == t.code("gender", "男")
+    for i, (_, lo, hi) in enumerate(AGE_GROUPS):
+        group = np.ones(len(age), dtype=bool)
+        if lo is not None:
+            group &= age >= lo
+        if hi is not None:
+            group &= age <= hi
+        c[f"age{i}_count"] = _count(group)
+        c[f"age{i}_insured"] = _count(group & is_paid)
+        c[f"age{i}_male"] = _count(group & male)
+
+    flows = np.bincount(col("pause_flow"), minlength=len(t.vocabs["pause_flow"]))
+    for i, name in enumerate(PAUSE_FLOWS):
+        code = t.code("pause_flow", name)
+        c[f"pause{i}"] = int(flows[code]) if code >= 0 else 0
+
+    staff_big = _first_seen_counts(t.vocabs["staff_big_type"], col("staff_big_type")[is_staff])
+    staff_detail = _first_seen_counts(t.vocabs["staff_detail_type"], col("staff_detail_type")[is_staff])
+    return c, staff_big, staff_detail
+
+
+def _enterprise_counters(t, unit_ids):
+    if t is None:
+        return dict.fromkeys(("units_total", "units_insured", "units_last", "risk_high", "risk_mid"), 0)
+    sel = t.selector(unit_ids)
+    risk = t.columns["risk"][sel]
+    return {
+        "units_total": len(risk),
+        "units_insured": _count(t.columns["staff_insured"][sel] == 1),
+        "units_last": _count(t.columns["last_month_staff_insured"][sel] == 1),
+        "risk_high": _count(risk == t.code("risk", "高")),
+        "risk_mid": _count(risk == t.code("risk", "中")),
+    }
+
+
+class ColumnarView:
+    """
+    一个范围的列式数据视图，可代替行列表直接传给 services_metrics 的 compute_*_metrics：
+    compute_core_metrics(view)、compute_staff_metrics(view, view) 等与传入行列表时结果一致。
+    计数器在首次使用时算一次，同一视图上算多个部分不再重复扫描。
+    """
+
+    def __init__(self, residents, enterprises, unit_ids):
+        self.residents = residents
+        # 只算 core / age 时可为 None
+        self.enterprises = enterprises
+        self.unit_ids = unit_ids
+        self._counters = None
+
+    def columnar_metrics(self, parts=METRIC_PARTS):
+        """返回 {part: payload}。"""
+        if self.enterprises is None and ("staff" in parts or "risk" in parts):
+            raise ValueError("视图未装载企业数据，不能计算 staff / risk")
+        if self._counters is None:
+            c, staff_big, staff_detail = _resident_counters(self.residents, self.unit_ids)
+            if self.enterprises is not None:
+                c.update(_enterprise_counters(self.enterprises, self.unit_ids))
+            self._counters = (c, staff_big, staff_detail)
+        return metrics_from_counters(*self._counters, parts)
+
+
+def scope_view(conn, unit_ids, year, parts=METRIC_PARTS, versions=None):
+    """
+    范围 unit_ids 的 ColumnarView；parts 含 staff / risk 时连同企业数据。
+    versions 为 {表名: 已读到的数据版本}（见 ColumnarStore.table()）。
+    NumPy 未安装或版本表不可用时返回 None，调用方应退回其它引擎。
+    """
+    if np is None:
+        return None
+    versions = versions or {}
+    residents = store.table(conn, "residents", year, versions.get("residents"))
+    if residents is None:
+        return None
+    enterprises = None
+    if "staff" in parts or "risk" in parts:
+        enterprises = store.table(conn, "enterprises", year, versions.get("enterprises"))
+        if enterprises is None:
+            return None
+    return ColumnarView(residents, enterprises, unit_ids)
+
+
+def compute_metrics_columnar(conn, unit_ids, year, parts=METRIC_PARTS, versions=None):
+    """
+    用列式快照计算范围内的指标，返回 {part: payload}，与单遍内核逐字节一致。
+    NumPy 未安装或版本表不可用时返回 None，调用方应退回其它引擎。
+    """
+    view = scope_view(conn, unit_ids, year, parts, versions)
+    return None if view is None else view.columnar_metrics(parts)
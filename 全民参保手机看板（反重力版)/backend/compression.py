@@ -0,0 +1,80 @@
+"""
+compression.py — JSON 响应压缩（gzip，安装了 brotli 时优先 br）
+
+按请求头 Accept-Encoding 协商编码（支持 q 值，q=0 表示拒绝）。带 ETag 的响应
+按 (ETag, 编码) 缓存压缩结果，同一份数据重复打开看板时不再重复压缩。
+
+相关环境变量：
+  COMPRESS_MIN_BYTES   小于该字节数的响应不压缩，默认 1024
+  COMPRESS_CACHE_SIZE  压缩结果缓存条数，默认 32，0 = 不缓存
+"""
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli  # 可选依赖：pip3 install brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", "32"))
+
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding):
+    """返回客户端可接受且服务端支持的最优编码，无则返回 None。"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for enc in supported_encodings():
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def compress(body, encoding, cache_key=None):
+    """压缩响应体；cache_key（通常为 ETag）非空时复用缓存的压缩结果。"""
+    if cache_key is None or CACHE_SIZE <= 0:
+        return _compress(body, encoding)
+    key = (cache_key, encoding)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+    out = _compress(body, encoding)
+    with _lock:
+        _cache[key] = out
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return out
@@ -8,10 +8,16 @@ db.py — 数据库连接模块，支持 SQLite（本地开发）和 MySQL（生
 其他相关环境变量（详见 .env.example）：
   SQLite: DASHBOARD_DB  — db 文件路径，默认 backend/data/dashboard.db
   MySQL:  DB_HOST / DB_PORT / DB_USER / DB_PASSWORD / DB_NAME
+  连接池: DB_POOL_SIZE / DB_POOL_IDLE_TIMEOUT / DB_POOL_TIMEOUT
+  MySQL 结果读取: DB_FETCH_BATCH / DB_ROW_TYPE
 """
 import os
 import re
 import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # ── 读取同目录 .env ────────────────────────────────────────────────────────────
@@ -33,6 +39,9 @@ def _load_dotenv():
 
 _load_dotenv()
 
+# 埋点模块在导入时读取环境变量，须在 .env 载入之后导入
+import instrumentation  # noqa: E402
+
 # ── 引擎选择 ───────────────────────────────────────────────────────────────────
 DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").strip().lower()  # "sqlite" | "mysql"
 
@@ -43,27 +52,126 @@ def _q2pct(sql: str) -> str:
     return sql.replace("?", "%s")
 
 
+# 流式读取每批行数；DB_ROW_TYPE=row 时行以 CompatRow（元组）返回，默认 dict
+FETCH_BATCH = int(os.getenv("DB_FETCH_BATCH", "500"))
+ROW_TYPE = os.getenv("DB_ROW_TYPE", "dict").strip().lower()
+
+
+class CompatRow(tuple):
+    """轻量行对象：本身是元组，额外支持 row["col"]、row.col、keys() 与 dict(row)。
+
+    列名到下标的映射存放在按列集合缓存的子类上，每行不再单独保存列名。
+    """
+
+    __slots__ = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def keys(self):
+        return list(self._index)
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+
+_row_classes = {}
+
+
+def _row_class(cols):
+    cls = _row_classes.get(cols)
+    if cls is None:
+        cls = type("CompatRow", (CompatRow,), {"__slots__": (), "_index": {c: i for i, c in enumerate(cols)}})
+        _row_classes[cols] = cls
+    return cls
+
+
 class _CompatResult:
-    """将 MySQL cursor 包装成支持 fetchall / fetchone 的对象，行以 dict 返回。"""
+    """将 MySQL cursor 包装成支持 fetchall / fetchone / 迭代的惰性结果。
 
-    def __init__(self, cursor):
-        cols = [d[0] for d in (cursor.description or [])]
-        raw = cursor.fetchall() if cursor.description else []
-        self._rows = [dict(zip(cols, row)) for row in raw]
+    按 FETCH_BATCH 分批 fetchmany，逐批转换成行对象，不会同时持有全部原始元组
+    和全部转换结果。同一连接执行下一条语句前，未读完的结果会被读空并关闭，
+    丢弃了行时在 stderr 打印警告（通常是调用方漏读了结果）。
+    """
+
+    def __init__(self, cursor, batch_size=FETCH_BATCH, sql=""):
+        self.sql = sql
+        self._cursor = cursor if cursor.description else None
+        self._batch_size = max(1, batch_size)
+        self._buf = []
         self._pos = 0
+        if self._cursor is not None:
+            cols = tuple(d[0] for d in cursor.description)
+            if ROW_TYPE == "row":
+                self._make = _row_class(cols)
+            else:
+                self._make = lambda raw, cols=cols: dict(zip(cols, raw))
+        else:
+            cursor.close()
 
-    def fetchall(self):
-        return self._rows
+    def _next_batch(self):
+        if self._cursor is None:
+            return False
+        raw = self._cursor.fetchmany(self._batch_size)
+        if not raw:
+            self.close()
+            return False
+        make = self._make
+        self._buf = [make(r) for r in raw]
+        self._pos = 0
+        return True
 
     def fetchone(self):
-        if self._pos < len(self._rows):
-            row = self._rows[self._pos]
-            self._pos += 1
-            return row
-        return None
+        if self._pos >= len(self._buf) and not self._next_batch():
+            return None
+        row = self._buf[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchall(self):
+        out = self._buf[self._pos:]
+        self._buf, self._pos = [], 0
+        while self._next_batch():
+            out.extend(self._buf)
+        self._buf = []
+        return out
 
     def __iter__(self):
-        return iter(self._rows)
+        while True:
+            if self._pos >= len(self._buf) and not self._next_batch():
+                return
+            row = self._buf[self._pos]
+            self._pos += 1
+            yield row
+
+    def close(self):
+        """
+        读空剩余结果并关闭游标（非缓冲游标未读完时连接不能执行下一条语句），
+        返回被丢弃的未读行数。
+        """
+        cur, self._cursor = self._cursor, None
+        discarded = len(self._buf) - self._pos
+        self._buf, self._pos = [], 0
+        if cur is None:
+            return discarded
+        try:
+            while True:
+                raw = cur.fetchmany(self._batch_size)
+                if not raw:
+                    return discarded
+                discarded += len(raw)
+        finally:
+            cur.close()
 
 
 class MySQLCompatConn:
@@ -71,21 +179,49 @@ class MySQLCompatConn:
 
     def __init__(self, raw_conn):
         self._conn = raw_conn
+        self._active = None
+
+    def _drain(self):
+        """关闭上一条语句未读完的结果；确有未读的行被丢弃时打印警告。"""
+        if self._active is not None:
+            active, self._active = self._active, None
+            discarded = active.close()
+            if discarded:
+                print(f"[WARN] 上一条查询结果未读完，已丢弃 {discarded} 行：{' '.join(active.sql.split())[:200]}",
+                      file=sys.stderr)
+
+    def _cursor(self):
+        self._drain()
+        return self._conn.cursor()
 
     def execute(self, sql: str, params=None):
-        cur = self._conn.cursor()
+        instrumentation.count_query()
+        cur = self._cursor()
         cur.execute(_q2pct(sql), params or [])
-        return _CompatResult(cur)
+        self._active = _CompatResult(cur, sql=sql)
+        return self._active
+
+    def execute_tuples(self, sql: str, params=None):
+        """执行查询并直接返回原始元组列表，跳过 dict 转换。"""
+        instrumentation.count_query()
+        cur = self._cursor()
+        try:
+            cur.execute(_q2pct(sql), params or [])
+            return cur.fetchall() if cur.description else []
+        finally:
+            cur.close()
 
     def executemany(self, sql: str, rows):
         if not rows:
             return
-        cur = self._conn.cursor()
+        instrumentation.count_query()
+        cur = self._cursor()
         cur.executemany(_q2pct(sql), list(rows))
+        cur.close()
 
     def executescript(self, sql: str):
         """按分号切割并逐条执行 DDL/DML 语句。"""
-        cur = self._conn.cursor()
+        cur = self._cursor()
         cleaned = re.sub(r"--[^\n]*", "", sql)
         cleaned = re.sub(r"/\*.*?\*/", "", cleaned, flags=re.DOTALL)
         for stmt in (s.strip() for s in cleaned.split(";") if s.strip()):
@@ -93,20 +229,26 @@ class MySQLCompatConn:
         self._conn.commit()
 
     def commit(self):
+        self._drain()
         self._conn.commit()
 
+    def rollback(self):
+        self._drain()
+        self._conn.rollback()
+
+    def ping(self):
+        """连接健康检查，断开时抛出异常。"""
+        self._drain()
+        self._conn.ping(reconnect=False)
+
     def close(self):
+        self._drain()
         self._conn.close()
 
 
 # ── 统一入口 ───────────────────────────────────────────────────────────────────
-def get_conn():
-    """
-    根据 DB_ENGINE 返回对应的数据库连接。
-
-    SQLite（默认）：直接返回 sqlite3 原生连接，row_factory = sqlite3.Row。
-    MySQL         ：返回 MySQLCompatConn 包装对象，接口与 SQLite 完全一致。
-    """
+def _connect(shared=False):
+    """新建一条物理连接；shared=True 时 SQLite 连接允许被连接池在线程间交接。"""
     if DB_ENGINE == "mysql":
         try:
             import mysql.connector
@@ -131,6 +273,217 @@ def get_conn():
     BASE_DIR = Path(__file__).resolve().parent
     db_path = os.getenv("DASHBOARD_DB", str(BASE_DIR / "data" / "dashboard.db"))
     (Path(db_path).parent).mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, check_same_thread=not shared)
     conn.row_factory = sqlite3.Row
+    # REPLACE 删除旧行时也触发 DELETE 触发器，保证汇总表等派生数据的增量标记完整
+    conn.execute("PRAGMA recursive_triggers = ON")
+    if shared and instrumentation.ENABLED:
+        # 连接池连接（服务进程）计数请求内执行的语句；脚本批量写入时不挂回调
+        conn.set_trace_callback(instrumentation.count_query)
     return conn
+
+
+def get_conn():
+    """
+    根据 DB_ENGINE 返回一条新的数据库连接（调用方负责 close）。
+
+    SQLite（默认）：直接返回 sqlite3 原生连接，row_factory = sqlite3.Row。
+    MySQL         ：返回 MySQLCompatConn 包装对象，接口与 SQLite 完全一致。
+
+    长驻服务请改用 connection()，从连接池借还连接。
+    """
+    return _connect()
+
+
+# ── 连接池 ─────────────────────────────────────────────────────────────────────
+class PoolExhausted(RuntimeError):
+    """等待超时仍借不到连接。"""
+
+
+class ConnectionPool:
+    """
+    有界、线程安全的连接池。
+
+    - size：同时借出的连接上限，超出时阻塞等待，最多 acquire_timeout 秒
+    - idle_timeout：空闲超过该秒数的连接在下次借出时关闭重建
+    - 借出前做健康检查（SQLite: SELECT 1；MySQL: ping），失败则重建
+    - 线程亲和：优先把当前线程上次归还的连接再借给它（SQLite 页缓存更热）
+    - 归还时回滚未提交事务，避免请求之间互相泄漏状态
+    """
+
+    def __init__(self, size=8, idle_timeout=300.0, acquire_timeout=10.0, factory=None):
+        self.size = max(int(size), 1)
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self._factory = factory or (lambda: _connect(shared=True))
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle = []  # [(conn, last_used, owner_thread_id)]
+
+    def _take_idle(self):
+        me = threading.get_ident()
+        now = time.monotonic()
+        with self._lock:
+            expired = [e for e in self._idle if now - e[1] > self.idle_timeout]
+            self._idle = [e for e in self._idle if now - e[1] <= self.idle_timeout]
+            entry = next((e for e in reversed(self._idle) if e[2] == me), None)
+            if entry is None and self._idle:
+                entry = self._idle[-1]
+            if entry is not None:
+                self._idle.remove(entry)
+        for conn, _, _ in expired:
+            _close_quietly(conn)
+        return entry[0] if entry else None
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            if isinstance(conn, MySQLCompatConn):
+                conn.ping()
+            else:
+                conn.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolExhausted(f"数据库连接池已满（{self.size}），等待 {self.acquire_timeout}s 超时")
+        try:
+            while True:
+                conn = self._take_idle()
+                if conn is None:
+                    return self._factory()
+                if self._healthy(conn):
+                    return conn
+                _close_quietly(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        try:
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+            if discard:
+                _close_quietly(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic(), threading.get_ident()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        with instrumentation.span("db.acquire"):
+            conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """进程级连接池（首次调用时按 DB_POOL_* 环境变量创建）。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    size=int(os.getenv("DB_POOL_SIZE", "8")),
+                    idle_timeout=float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+                    acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                )
+    return _pool
+
+
+def close_pool():
+    """关闭连接池中的空闲连接（pre-fork 模式在 fork 前调用，工作进程不继承主进程的连接）。"""
+    if _pool is not None:
+        _pool.close_all()
+
+
+@contextmanager
+def connection():
+    """
+    借用一条连接，with 块结束自动归还：
+
+        with connection() as conn:
+            conn.execute(...)
+
+    DB_POOL_SIZE=0 时不启用连接池，每次新建并关闭连接。
+    """
+    if os.getenv("DB_POOL_SIZE", "8").strip() == "0":
+        with instrumentation.span("db.acquire"):
+            conn = get_conn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def fetch_tuples(conn, sql: str, params=None):
+    """
+    执行查询并以普通元组列表返回结果（列顺序即 SELECT 顺序）。
+
+    供热点循环按位置解包使用，省去 sqlite3.Row / dict 的按名取值开销。
+    """
+    if isinstance(conn, MySQLCompatConn):
+        return conn.execute_tuples(sql, params)
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params or []).fetchall()
+
+
+def read_data_version(conn, name: str):
+    """
+    读取 data_versions 中某张表的版本号（由该表上的触发器在每次变更时递增）。
+
+    旧库尚未执行 migrate_add_data_versions.py 时返回 None，调用方应视为“版本未知”。
+    """
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE name=?", [name]).fetchone()
+    except Exception:
+        return None
+    return int(row["version"]) if row else None
+
+
+def read_data_versions(conn, names):
+    """
+    一次读取多张表的版本号，返回与 names 对应的元组；任一表缺少版本号时返回 None。
+    """
+    names = list(names)
+    try:
+        rows = conn.execute(
+            f"SELECT name, version FROM data_versions WHERE name IN ({','.join(['?'] * len(names))})",
+            names,
+        ).fetchall()
+    except Exception:
+        return None
+    found = {r["name"]: int(r["version"]) for r in rows}
+    if any(n not in found for n in names):
+        return None
+    return tuple(found[n] for n in names)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+index_advisor.py — 按实际查询形状推导居民 / 企业表的复合覆盖索引
+
+热点查询的形状都是 WHERE year=? AND unit_id IN (...)：
+  - 指标计算（fetch_metric_rows / compute_metrics_sql）只读 *_METRIC_COLUMNS；
+  - 列表接口在此基础上叠加标签列等值筛选（TAG_COLUMNS），按 id 排序 / 续读；
+  - 列表总数、unit_tag_counts 增量刷新只读标签列。
+原有的 (unit_id, year) 索引只能定位到行，之后每一行都要回表取列。这里按
+  等值前缀 year → 范围 unit_id → 排序键 id → 指标列 → 其余标签列
+推导一条覆盖索引：指标查询与计数只读索引，列表的标签筛选在索引内完成，只有
+最终返回的那一页回表。
+
+MySQL 的单个索引最多 16 列、3072 字节（utf8mb4 每字符按 4 字节计），超出部分
+按上面的顺序截断；列宽取自 schema_mysql.sql。
+
+以标签列开头的旧索引 idx_residents_type / idx_enterprises_risk 没有任何查询按它们的形状
+（不带范围的全库标签筛选）访问；未做 ANALYZE 时 SQLite 反而会在列表查询里选中它们，
+按标签扫遍全库再逐行核对范围，因此迁移时一并删除（SUPERSEDED）。(unit_id, year) 索引保留，
+删除 / 按单元查询及外键仍会用到。
+
+使用方法：
+    cd backend
+    python3 index_advisor.py show       # 打印两种引擎的建索引语句
+    python3 index_advisor.py audit      # 对比当前库的索引与推荐索引
+    python3 index_advisor.py check      # schema.sql / schema_mysql.sql 与推导结果不一致时退出码为 1
+"""
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from db import DB_ENGINE, get_conn
+from services_metrics import ENTERPRISE_METRIC_COLUMNS, RESIDENT_METRIC_COLUMNS, TAG_COLUMNS
+
+BASE = Path(__file__).parent
+SCOPE_COLUMNS = ("year", "unit_id", "id")
+METRIC_COLUMNS = {"residents": RESIDENT_METRIC_COLUMNS, "enterprises": ENTERPRISE_METRIC_COLUMNS}
+INDEX_NAMES = {table: f"idx_{table}_scope_cover" for table in METRIC_COLUMNS}
+# 被覆盖索引取代、会误导优化器的旧索引
+SUPERSEDED = {"residents": ("idx_residents_type",), "enterprises": ("idx_enterprises_risk",)}
+MYSQL_MAX_KEY_PARTS = 16
+MYSQL_MAX_KEY_BYTES = 3072
+
+
+def covering_columns(table):
+    """推荐索引的列顺序：year、unit_id、id，其后指标列，再后其余标签列（去重）。"""
+    cols = list(SCOPE_COLUMNS)
+    for c in METRIC_COLUMNS[table] + TAG_COLUMNS[table]:
+        if c not in cols:
+            cols.append(c)
+    return tuple(cols)
+
+
+def _mysql_column_bytes(table):
+    """从 schema_mysql.sql 解析各列的索引字节宽度。"""
+    text = (BASE / "schema_mysql.sql").read_text(encoding="utf-8")
+    m = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \((.*?)\n\) ENGINE", text, re.S)
+    widths = {}
+    for line in m.group(1).splitlines():
+        col = re.match(r"\s+(\w+)\s+([A-Z]+)(?:\((\d+)\))?", line)
+        if not col or col.group(1) in ("PRIMARY", "INDEX", "FULLTEXT", "FOREIGN", "CONSTRAINT", "UNIQUE"):
+            continue
+        name, kind, length = col.groups()
+        if kind in ("VARCHAR", "CHAR"):
+            widths[name] = 4 * int(length)
+        else:
+            widths[name] = {"TINYINT": 1, "SMALLINT": 2, "INT": 4, "BIGINT": 8, "DOUBLE": 8}.get(kind, 8)
+    return widths
+
+
+def mysql_covering_columns(table):
+    """MySQL 版列集合：按推荐顺序依次加入，超出列数或字节上限的列跳过。"""
+    widths = _mysql_column_bytes(table)
+    cols, used = [], 0
+    for c in covering_columns(table):
+        if len(cols) >= MYSQL_MAX_KEY_PARTS:
+            break
+        if used + widths[c] > MYSQL_MAX_KEY_BYTES:
+            continue
+        cols.append(c)
+        used += widths[c]
+    return tuple(cols)
+
+
+# ── 建索引 DDL（供迁移脚本使用，与 schema.sql / schema_mysql.sql 保持一致）──────
+def sqlite_statements():
+    return [
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(covering_columns(table))});"
+        for table, name in INDEX_NAMES.items()
+    ]
+
+
+def sqlite_drop_statements():
+    return [f"DROP INDEX IF EXISTS {name};" for names in SUPERSEDED.values() for name in names]
+
+
+def mysql_index_clause(table):
+    """schema_mysql.sql 建表语句中的索引子句。"""
+    return f"INDEX {INDEX_NAMES[table]} ({', '.join(mysql_covering_columns(table))})"
+
+
+def mysql_statements():
+    """MySQL 补建索引的语句 [(索引名, 表名, ALTER 语句)]。"""
+    return [
+        (name, table, f"ALTER TABLE {table} ADD {mysql_index_clause(table)}")
+        for table, name in INDEX_NAMES.items()
+    ]
+
+
+def mysql_drop_statements():
+    """MySQL 删除旧索引的语句 [(索引名, 表名, ALTER 语句)]。"""
+    return [
+        (name, table, f"ALTER TABLE {table} DROP INDEX {name}")
+        for table, names in SUPERSEDED.items() for name in names
+    ]
+
+
+DDL = "" if DB_ENGINE == "mysql" else "\n".join(sqlite_statements() + sqlite_drop_statements()) + "\n"
+
+
+def existing_indexes(conn, table):
+    """当前库中该表的普通索引 {索引名: (列, ...)}（不含主键、FULLTEXT）。"""
+    out = {}
+    if DB_ENGINE == "mysql":
+        rows = conn.execute(
+            "SELECT index_name AS index_name, column_name AS column_name FROM information_schema.statistics "
+            "WHERE table_schema=DATABASE() AND table_name=? AND index_name<>'PRIMARY' AND index_type='BTREE' "
+            "ORDER BY index_name, seq_in_index",
+            [table],
+        ).fetchall()
+        for r in rows:
+            out.setdefault(r["index_name"], []).append(r["column_name"])
+    else:
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", [table]
+        ).fetchall():
+            out[r["name"]] = [c["name"] for c in conn.execute(f"PRAGMA index_info({r['name']})").fetchall()]
+    return {name: tuple(cols) for name, cols in out.items()}
+
+
+def audit(conn):
+    """返回 [(表, 索引名, 说明)]：缺失的推荐索引、应删除的旧索引，以及热点查询不再使用的索引。"""
+    notes = []
+    for table, name in INDEX_NAMES.items():
+        existing = existing_indexes(conn, table)
+        if name not in existing:
+            notes.append((table, name, "缺失（执行 migrate_add_covering_indexes.py 补建）"))
+        for other, cols in existing.items():
+            if other == name:
+                continue
+            if other in SUPERSEDED[table]:
+                notes.append((table, other, "已被覆盖索引取代且会误导优化器，应删除（执行 migrate_add_covering_indexes.py）"))
+            elif set(cols) == {"unit_id", "year"}:
+                notes.append((table, other, "热点查询已改走覆盖索引；保留供外键 / 按单元查询使用"))
+            elif cols and cols[0] not in SCOPE_COLUMNS:
+                notes.append((table, other, "热点查询均以 year / unit_id 定位，未使用该索引"))
+    return notes
+
+
+def check_schema():
+    """schema 文件中的索引定义与推导结果不一致时返回差异说明列表。"""
+    problems = []
+    sqlite_text = (BASE / "schema.sql").read_text(encoding="utf-8")
+    for stmt in sqlite_statements():
+        if stmt not in sqlite_text:
+            problems.append(f"schema.sql 缺少或不同于：{stmt}")
+    mysql_text = (BASE / "schema_mysql.sql").read_text(encoding="utf-8")
+    for table in INDEX_NAMES:
+        clause = mysql_index_clause(table)
+        if clause not in mysql_text:
+            problems.append(f"schema_mysql.sql 缺少或不同于：{clause}")
+    for names in SUPERSEDED.values():
+        for name in names:
+            for fname, text in (("schema.sql", sqlite_text), ("schema_mysql.sql", mysql_text)):
+                if re.search(rf"\b{name}\b", text):
+                    problems.append(f"{fname} 仍包含应删除的旧索引：{name}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按热点查询形状推导覆盖索引")
+    parser.add_argument("command", choices=["show", "audit", "check"])
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print("-- SQLite")
+        for stmt in sqlite_statements() + sqlite_drop_statements():
+            print(stmt)
+        print("-- MySQL")
+        for _, _, stmt in mysql_statements() + mysql_drop_statements():
+            print(stmt + ";")
+    elif args.command == "check":
+        problems = check_schema()
+        for p in problems:
+            print(p)
+        if problems:
+            sys.exit(1)
+        print("schema indexes ok")
+    else:
+        conn = get_conn()
+        try:
+            for table, name, note in audit(conn):
+                print(f"{table}.{name}: {note}")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+instrumentation.py — 请求级分阶段耗时埋点，Prometheus 文本格式导出（/api/metrics-internal）
+
+每个请求在 server.handle_request() 中 begin() / finish()，期间各阶段用 span(名称) 计时：
+  db.acquire   从连接池借连接（或新建连接）
+  auth         token 校验 + 用户查询
+  scope        权限范围解析
+  etag         data_versions 查询与 ETag 计算
+  handler      接口函数整体（含下面的 fetch / compute）
+  fetch        按范围装载数据集（两条全范围 SELECT 等），同时累计取回行数
+  compute      指标计算
+  serialize    json.dumps
+  compress     gzip / br 压缩
+同一请求内同名阶段累加后记一次。请求结束时按路由记入直方图：总耗时、各阶段耗时、
+SQL 语句数、取回行数、响应字节数，另按 (路由, 状态码) 计数。
+
+开销：每个阶段两次 perf_counter，请求结束时取一次锁批量记入，单请求约十微秒，可常开。
+SQL 语句数：SQLite 用 set_trace_callback 计数，MySQL 在 MySQLCompatConn 中计数。
+统计在进程内；pre-fork 模式下每次抓取落到哪个工作进程不确定，各进程计数独立（见 pid 标签）。
+
+相关环境变量：
+  INSTRUMENTATION          0 = 关闭埋点（默认 1）
+  METRICS_INTERNAL_TOKEN   设置后 /api/metrics-internal 须带 Authorization: Bearer <该值>
+"""
+import bisect
+import os
+import threading
+import time
+
+ENABLED = os.getenv("INSTRUMENTATION", "1").strip() != "0"
+TOKEN = os.getenv("METRICS_INTERNAL_TOKEN", "")
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50, 100)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_HELP = {
+    "dashboard_request_seconds": ("histogram", "请求处理耗时（秒，不含网络读写）"),
+    "dashboard_phase_seconds": ("histogram", "请求各阶段耗时（秒）"),
+    "dashboard_db_queries": ("histogram", "每个请求执行的 SQL 语句数"),
+    "dashboard_db_rows": ("histogram", "每个请求装载数据集取回的行数"),
+    "dashboard_response_bytes": ("histogram", "响应体字节数（压缩后）"),
+    "dashboard_requests_total": ("counter", "请求数"),
+}
+_STARTED = time.time()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Request:
+    __slots__ = ("route", "started", "phases", "queries", "rows")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.rows = 0
+
+
+class _RouteStats:
+    """一个路由的全部统计；只在 _lock 内修改。"""
+    __slots__ = ("seconds", "phases", "queries", "rows", "bytes", "codes")
+
+    def __init__(self):
+        self.seconds = Histogram(SECONDS_BUCKETS)
+        self.phases = {}
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.rows = Histogram(ROW_BUCKETS)
+        self.bytes = Histogram(BYTE_BUCKETS)
+        self.codes = {}
+
+
+_local = threading.local()
+_lock = threading.Lock()
+_routes = {}
+
+
+def begin(route):
+    """开始记录一个请求；route 须是有限集合（未知路径请归为 "other"）。"""
+    if ENABLED:
+        _local.request = _Request(route)
+
+
+class span:
+    """with span("阶段名"): ... —— 计入当前请求；不在请求内时什么也不做。"""
+    __slots__ = ("name", "req", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.req = req = getattr(_local, "request", None)
+        if req is not None:
+            self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        req = self.req
+        if req is not None:
+            req.phases[self.name] = req.phases.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+
+def add_rows(n):
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req.rows += n
+
+
+def count_query(statement=None):
+    """记一条 SQL；签名兼容 sqlite3 的 set_trace_callback。"""
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req.queries += 1
+
+
+def finish(code, nbytes):
+    req = getattr(_local, "request", None)
+    if req is None:
+        return
+    _local.request = None
+    elapsed = time.perf_counter() - req.started
+    with _lock:
+        stats = _routes.get(req.route)
+        if stats is None:
+            stats = _routes[req.route] = _RouteStats()
+        stats.seconds.observe(elapsed)
+        for phase, seconds in req.phases.items():
+            hist = stats.phases.get(phase)
+            if hist is None:
+                hist = stats.phases[phase] = Histogram(SECONDS_BUCKETS)
+            hist.observe(seconds)
+        stats.queries.observe(req.queries)
+        stats.rows.observe(req.rows)
+        stats.bytes.observe(nbytes)
+        stats.codes[code] = stats.codes.get(code, 0) + 1
+
+
+def _labels(pairs):
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render():
+    """Prometheus 文本格式（version 0.0.4）。"""
+    series = []
+    with _lock:
+        for route, st in sorted(_routes.items()):
+            r = (("route", route),)
+            series.append(("dashboard_request_seconds", r, st.seconds))
+            for phase, hist in sorted(st.phases.items()):
+                series.append(("dashboard_phase_seconds", r + (("phase", phase),), hist))
+            series.append(("dashboard_db_queries", r, st.queries))
+            series.append(("dashboard_db_rows", r, st.rows))
+            series.append(("dashboard_response_bytes", r, st.bytes))
+            for code, n in sorted(st.codes.items()):
+                series.append(("dashboard_requests_total", r + (("code", code),), n))
+        # 直方图在锁内取快照
+        series = [(name, labels, (h.buckets, list(h.counts), h.sum, h.count) if isinstance(h, Histogram) else h)
+                  for name, labels, h in series]
+    # 同名指标须连续输出
+    series.sort(key=lambda item: item[0])
+    pid = (("pid", os.getpid()),)
+    lines = [
+        "# HELP dashboard_process_start_time_seconds 进程启动时间（Unix 时间戳）",
+        "# TYPE dashboard_process_start_time_seconds gauge",
+        f"dashboard_process_start_time_seconds{_labels(pid)} {_num(_STARTED)}",
+    ]
+    declared = set()
+
+    def declare(name):
+        if name not in declared:
+            declared.add(name)
+            kind, text = _HELP[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for name, labels, value in series:
+        declare(name)
+        labels = pid + labels
+        if not isinstance(value, tuple):
+            lines.append(f"{name}{_labels(labels)} {value}")
+            continue
+        buckets, counts, total, count = value
+        cumulative = 0
+        for bound, n in zip(buckets + ("+Inf",), counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def reset():
+    with _lock:
+        _routes.clear()
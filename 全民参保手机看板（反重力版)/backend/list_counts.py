@@ -0,0 +1,105 @@
+"""
+list_counts.py — 列表接口的筛选总数服务
+
+/api/list/* 每翻一页都要回答“共多少条”。精确总数按
+(表, 范围 + 年度 + 筛选条件哈希, 该表数据版本) 缓存在进程内的 LRU + TTL 缓存中，
+各处理线程共享；数据变更后版本号递增，旧条目自然失效。
+
+近似总数（total=approx，可选）：筛选条件只涉及标签列时，直接用 unit_tag_counts
+的分单元计数回答——单个条件时是精确值，多个条件时按各条件相互独立估算。
+范围内有尚未刷新的脏单元时不用计数表，改走精确 COUNT；此路径从不写库。
+
+位图索引（BITMAP_INDEX=1，见 bitmap_index.py）或列式数据（METRICS_ENGINE=columnar，
+见 columnar_store.py）已启用时，只涉及标签列的筛选直接在进程内数出精确总数，不再执行 COUNT。
+
+相关环境变量：
+  LIST_COUNT_CACHE_SIZE   缓存条数，默认 512，0 = 不缓存
+  LIST_COUNT_CACHE_TTL    缓存有效期（秒），默认 60
+"""
+import os
+
+from db import read_data_version
+from ttl_cache import TTLCache
+
+_cache = TTLCache(
+    maxsize=int(os.getenv("LIST_COUNT_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("LIST_COUNT_CACHE_TTL", "60")),
+)
+
+
+def count_total(conn, table, unit_ids, year, sql, params, fhash, tag_filters=None, approx=False):
+    """
+    返回筛选结果总数。tag_filters 为全部条件都是标签列时的 {列: 值}（否则为 None），
+    可用位图索引 / 列式数据精确计数；approx=True 时还允许用 unit_tag_counts 近似回答。
+    """
+    import bitmap_index
+    from columnar_store import store
+
+    version = read_data_version(conn, table)
+    exact_key = (table, fhash, version)
+    if version is not None:
+        hit = _cache.get(exact_key)
+        if hit is not None:
+            return hit
+
+    if tag_filters is not None:
+        total = bitmap_index.count(conn, table, unit_ids, year, tag_filters, version=version)
+        if total is None and store.enabled:
+            total = store.count(conn, table, unit_ids, year, tag_filters, version=version)
+        if total is not None:
+            return total
+
+    if tag_filters is not None and approx:
+        approx_key = (table, fhash, version, "approx")
+        if version is not None:
+            hit = _cache.get(approx_key)
+            if hit is not None:
+                return hit
+        total = approx_total(conn, table, unit_ids, year, tag_filters)
+        if total is not None:
+            if version is not None:
+                _cache.set(approx_key, total)
+            return total
+
+    total = conn.execute("SELECT COUNT(1) c FROM (" + sql + ")", params).fetchone()["c"]
+    if version is not None:
+        _cache.set(exact_key, total)
+    return total
+
+
+def approx_total(conn, table, unit_ids, year, tag_filters):
+    """
+    按 unit_tag_counts 估算总数。只读：范围内有单元带脏标记（计数尚未刷新）或计数表不存在时
+    返回 None，调用方改走精确 COUNT；脏单元由 metric_rollups.py refresh 定时刷新。
+    """
+    if not unit_ids:
+        return 0
+    marks = ",".join(["?"] * len(unit_ids))
+    tags = ["*"] + sorted(tag_filters)
+    try:
+        # 与 compute_metrics_rollup 相同：先读脏标记再读计数行
+        if conn.execute(
+            f"SELECT 1 FROM unit_metric_rollup_dirty WHERE year=? AND unit_id IN ({marks}) LIMIT 1",
+            [year] + list(unit_ids),
+        ).fetchone() is not None:
+            return None
+        rows = conn.execute(
+            "SELECT tag, value, SUM(cnt) AS cnt FROM unit_tag_counts "
+            f"WHERE table_name=? AND year=? AND unit_id IN ({marks}) "
+            f"AND tag IN ({','.join(['?'] * len(tags))}) GROUP BY tag, value",
+            [table, year] + list(unit_ids) + tags,
+        ).fetchall()
+    except Exception:
+        return None
+    counts = {(r["tag"], r["value"]): int(r["cnt"]) for r in rows}
+    base = counts.get(("*", ""), 0)
+    if not base:
+        return 0
+    estimate = float(base)
+    for tag, value in tag_filters.items():
+        estimate *= counts.get((tag, str(value)), 0) / base
+    return int(round(estimate))
+
+
+def clear():
+    _cache.clear()
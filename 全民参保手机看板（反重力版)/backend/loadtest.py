@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+loadtest.py — 看板 API 压测脚本（可重复运行，结果 JSON 可在两次提交之间比对）
+
+一次 run 的流程：
+  1. 按规模生成 SQLite 数据集（seed_db.generate）：组织树为 区 → 街道 → 社区 → 网格，
+     居民落在网格，企业落在社区 / 街道。数据集按参数缓存在 data/loadtest/ 下，再次运行直接复用；
+  2. 在本机空闲端口另起一个 server.py 子进程（服务模式、引擎等通过参数 / 环境变量指定），
+     等 /api/health 就绪；
+  3. seed_db.seed_users 的四个角色（区 / 街道 / 社区 / 网格）各起 N 个模拟用户，
+     每人登录后用一条长连接按固定权重轮流请求 /api/bootstrap、/api/metrics/*、/api/list/*；
+     预热阶段的请求不计入结果；
+  4. 汇总吞吐量、各接口与各角色的 p50 / p95 / p99 延迟、响应大小、服务进程峰值内存（RSS），
+     打印表格并写出 JSON。
+
+模拟用户与服务进程在同一台机器上运行，压测端也占 CPU；比较两次结果时应保持机器、
+规模与参数一致。峰值内存读取 /proc（Linux），其他平台记为 null。
+
+使用方法：
+    cd backend
+    python3 loadtest.py run --scale 100k --users 4 --duration 30 --out before.json
+    python3 loadtest.py run --scale 100k --server-args=--async --env METRICS_ENGINE=columnar --out after.json
+    python3 loadtest.py compare before.json after.json
+    python3 loadtest.py seed --scale 1m        # 只生成数据集
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+
+BASE = Path(__file__).resolve().parent
+DATA_DIR = BASE / "data" / "loadtest"
+PASSWORD = "123456"
+ROLES = ("district", "street", "village", "grid")
+
+# 预设规模：居民数、企业数、街道数、每街道社区数、每社区网格数
+SCALES = {
+    "10k": dict(residents=10_000, enterprises=1_600, streets=3, villages=4, grids=3),
+    "100k": dict(residents=100_000, enterprises=16_000, streets=6, villages=8, grids=4),
+    "1m": dict(residents=1_000_000, enterprises=50_000, streets=12, villages=12, grids=6),
+}
+
+# 请求组合：(名称, 路径, 权重)。列表页按前端抽屉的典型筛选取值
+MIX = (
+    ("bootstrap", "/api/bootstrap", 2),
+    ("metrics.core", "/api/metrics/core", 2),
+    ("metrics.age", "/api/metrics/age", 1),
+    ("metrics.staff", "/api/metrics/staff", 1),
+    ("metrics.risk", "/api/metrics/risk", 1),
+    ("list.residents", "/api/list/residents?limit=20", 2),
+    ("list.residents.filtered",
+     "/api/list/residents?limit=20&household=" + quote("本区户籍") + "&stock_change_type=" + quote("可动员"), 1),
+    ("list.enterprises", "/api/list/enterprises?limit=20&risk=" + quote("高"), 1),
+)
+
+
+# ── 数据集 ────────────────────────────────────────────────────────────────────
+def dataset_path(spec):
+    key = "r{residents}-e{enterprises}-t{streets}x{villages}x{grids}".format(**spec)
+    return DATA_DIR / f"{key}.db"
+
+
+def seed_dataset(spec):
+    """在当前进程中生成数据集（DASHBOARD_DB 须已指向目标文件，见 main() 的 seed --db）。"""
+    import seed_db
+
+    # 多核机器上留一个核给写入进程，其余并行生成行
+    seed_db.generate(residents=spec["residents"], enterprises=spec["enterprises"], streets=spec["streets"],
+                     villages=spec["villages"], grids=spec["grids"], workers=max((os.cpu_count() or 1) - 1, 0))
+
+
+def ensure_dataset(spec, rebuild=False):
+    """返回数据集路径；不存在时在子进程中生成（避免本进程读到压测库的环境变量）。"""
+    path = dataset_path(spec)
+    if path.exists() and not rebuild:
+        return path
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".building")
+    if tmp.exists():
+        tmp.unlink()
+    env = dict(os.environ, DB_ENGINE="sqlite", DASHBOARD_DB=str(tmp),
+               BOOTSTRAP_SNAPSHOT_DIR=str(path.with_suffix(".snapshots")))
+    env.setdefault("DASHBOARD_SECRET", "loadtest-only-secret")
+    print(f"生成数据集 {path.name} …", flush=True)
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, __file__, "seed", "--db", str(tmp), *_spec_args(spec)],
+                   cwd=BASE, env=env, check=True)
+    tmp.replace(path)
+    print(f"数据集就绪（{time.perf_counter() - t0:.1f}s）：{path}", flush=True)
+    return path
+
+
+def _spec_args(spec):
+    return [f"--{k}={v}" for k, v in spec.items()]
+
+
+# ── 服务进程 ──────────────────────────────────────────────────────────────────
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, port, server_args, extra_env, log_path):
+    env = dict(os.environ, DB_ENGINE="sqlite", DASHBOARD_DB=str(db_path),
+               BOOTSTRAP_SNAPSHOT_DIR=str(Path(db_path).with_suffix(".snapshots")))
+    env.setdefault("DASHBOARD_SECRET", "loadtest-only-secret")
+    env.update(extra_env)
+    log = open(log_path, "w", encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, "server.py", "--port", str(port), *server_args],
+                            cwd=BASE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server.py 启动失败，见 {log_path}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server.py 60 秒内未就绪，见 {log_path}")
+
+
+def _process_tree(pid):
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        try:
+            stack.extend(int(c) for c in Path(f"/proc/{p}/task/{p}/children").read_text().split())
+        except OSError:
+            pass
+    return pids
+
+
+def peak_rss(pid):
+    """服务进程及其子进程（pre-fork 工作进程）的峰值 RSS（VmHWM）之和，字节；无 /proc 时返回 None。"""
+    total, found = 0, False
+    for p in _process_tree(pid):
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+                    found = True
+        except OSError:
+            pass
+    return total if found else None
+
+
+# ── 模拟用户 ──────────────────────────────────────────────────────────────────
+class VirtualUser(threading.Thread):
+    def __init__(self, port, role, index, start_at, record_from, stop_at, gzip=True, etag=False, think=0.0):
+        super().__init__(daemon=True)
+        self.port = port
+        self.role = role
+        self.rng = random.Random(f"{role}-{index}")
+        self.start_at = start_at
+        self.record_from = record_from
+        self.stop_at = stop_at
+        self.gzip = gzip
+        self.etag = etag
+        self.think = think
+        self.samples = []
+        self.errors = []
+        self._etags = {}
+        self._conn = None
+        names, paths, weights = zip(*MIX)
+        self._choices = list(zip(names, paths))
+        self._weights = weights
+
+    def _request(self, method, path, body=None, headers=None):
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            try:
+                self._conn.request(method, path, body=body, headers=headers or {})
+                resp = self._conn.getresponse()
+                data = resp.read()
+                if resp.will_close:
+                    self._conn.close()
+                    self._conn = None
+                return resp, data
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                # 服务端关闭了空闲长连接时重连重试一次
+                if attempt == 2:
+                    raise
+
+    def _login(self):
+        body = json.dumps({"username": self.role, "password": PASSWORD})
+        resp, data = self._request("POST", "/api/auth/login", body, {"Content-Type": "application/json"})
+        if resp.status != 200:
+            raise RuntimeError(f"{self.role} 登录失败：{resp.status} {data[:200]!r}")
+        return json.loads(data)["token"]
+
+    def run(self):
+        time.sleep(max(0.0, self.start_at - time.monotonic()))
+        try:
+            token = self._login()
+        except Exception as e:
+            self.errors.append(("login", repr(e)))
+            return
+        headers = {"Authorization": f"Bearer {token}"}
+        if self.gzip:
+            headers["Accept-Encoding"] = "gzip"
+        while True:
+            now = time.monotonic()
+            if now >= self.stop_at:
+                break
+            name, path = self.rng.choices(self._choices, self._weights)[0]
+            h = dict(headers)
+            if self.etag and path in self._etags:
+                h["If-None-Match"] = self._etags[path]
+            t0 = time.perf_counter()
+            try:
+                resp, data = self._request("GET", path, headers=h)
+            except Exception as e:
+                if now >= self.record_from:
+                    self.errors.append((name, repr(e)))
+                continue
+            elapsed = time.perf_counter() - t0
+            if resp.getheader("ETag"):
+                self._etags[path] = resp.getheader("ETag")
+            if now >= self.record_from:
+                self.samples.append((name, elapsed, len(data), resp.status))
+            if self.think:
+                time.sleep(self.think)
+        if self._conn is not None:
+            self._conn.close()
+
+
+# ── 统计 ──────────────────────────────────────────────────────────────────────
+def _pct(sorted_values, p):
+    """最近秩百分位。"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 2)
+
+
+def _summarize(samples, errors, seconds):
+    lat = sorted(s[1] for s in samples)
+    ok = [s for s in samples if s[3] < 400]
+    return {
+        "requests": len(samples),
+        "errors": len(errors) + len(samples) - len(ok),
+        "rps": round(len(samples) / seconds, 2) if seconds else None,
+        "p50_ms": _ms(_pct(lat, 50)),
+        "p95_ms": _ms(_pct(lat, 95)),
+        "p99_ms": _ms(_pct(lat, 99)),
+        "mean_ms": _ms(sum(lat) / len(lat)) if lat else None,
+        "max_ms": _ms(lat[-1]) if lat else None,
+        "mean_bytes": round(sum(s[2] for s in samples) / len(samples)) if samples else None,
+        "not_modified": sum(1 for s in samples if s[3] == 304),
+    }
+
+
+def _git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                             capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no", "--", "."], cwd=BASE,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return rev or None, bool(dirty)
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+
+
+def _spec(args):
+    spec = dict(SCALES[args.scale])
+    for key in spec:
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    return spec
+
+
+def run_load(args):
+    spec = _spec(args)
+    db_path = ensure_dataset(spec, rebuild=args.rebuild)
+    port = args.port or _free_port()
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    log_path = DATA_DIR / "server.log"
+    server = start_server(db_path, port, args.server_args.split(), extra_env, log_path)
+    try:
+        start = time.monotonic() + 0.5
+        record_from = start + args.warmup
+        stop_at = record_from + args.duration
+        users = [
+            VirtualUser(port, role, i, start + 0.05 * i, record_from, stop_at,
+                        gzip=not args.no_gzip, etag=args.etag, think=args.think / 1000.0)
+            for role in ROLES for i in range(args.users)
+        ]
+        print(f"压测 {len(users)} 个模拟用户，预热 {args.warmup}s + 计时 {args.duration}s，端口 {port} …", flush=True)
+        for u in users:
+            u.start()
+        for u in users:
+            u.join()
+        rss = peak_rss(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    samples = [s for u in users for s in u.samples]
+    errors = [e for u in users for e in u.errors]
+    rev, dirty = _git_revision()
+    result = {
+        "meta": {
+            "commit": rev,
+            "dirty": dirty,
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "dataset": spec,
+            "users_per_role": args.users,
+            "warmup": args.warmup,
+            "duration": args.duration,
+            "think_ms": args.think,
+            "gzip": not args.no_gzip,
+            "etag": args.etag,
+            "server_args": args.server_args,
+            "env": extra_env,
+        },
+        "summary": dict(_summarize(samples, errors, args.duration), peak_rss_bytes=rss),
+        "endpoints": {
+            name: _summarize([s for s in samples if s[0] == name], [e for e in errors if e[0] == name],
+                             args.duration)
+            for name, _, _ in MIX
+        },
+        "roles": {
+            role: _summarize([s for u in users if u.role == role for s in u.samples],
+                             [e for u in users if u.role == role for e in u.errors], args.duration)
+            for role in ROLES
+        },
+        "error_samples": [f"{name}: {msg}" for name, msg in errors[:10]],
+    }
+    _print_result(result)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"结果已写入 {args.out}")
+    return 1 if result["summary"]["errors"] else 0
+
+
+def _print_result(result):
+    s = result["summary"]
+    rss = s["peak_rss_bytes"]
+    print(f"\n共 {s['requests']} 个请求，错误 {s['errors']}，吞吐 {s['rps']} req/s，"
+          f"p50 {s['p50_ms']} / p95 {s['p95_ms']} / p99 {s['p99_ms']} ms，"
+          f"峰值 RSS {'—' if rss is None else f'{rss / 1048576:.1f} MiB'}")
+    print(f"{'接口':<26}{'请求':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'字节':>10}")
+    for group in ("endpoints", "roles"):
+        for name, e in result[group].items():
+            print(f"{name:<26}{e['requests']:>8}{e['rps'] or 0:>9}{e['p50_ms'] or 0:>9}"
+                  f"{e['p95_ms'] or 0:>9}{e['p99_ms'] or 0:>9}{e['mean_bytes'] or 0:>10}")
+        print()
+
+
+# ── 结果比对 ──────────────────────────────────────────────────────────────────
+_COMPARE_FIELDS = ("rps", "p50_ms", "p95_ms", "p99_ms", "mean_bytes")
+
+
+def _change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100.0
+
+
+def compare(args):
+    old = json.loads(Path(args.old).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    print(f"{old['meta'].get('commit')} → {new['meta'].get('commit')}")
+    if old["config"] != new["config"]:
+        print("注意：两次运行的参数不同")
+    worst = 0.0
+    rows = [("summary", old["summary"], new["summary"])]
+    rows += [(name, e, new["endpoints"].get(name)) for name, e in old["endpoints"].items()]
+    print(f"{'接口':<26}" + "".join(f"{f:>22}" for f in _COMPARE_FIELDS))
+    for name, a, b in rows:
+        if b is None:
+            continue
+        cells = []
+        for field in _COMPARE_FIELDS:
+            pct = _change(a.get(field), b.get(field))
+            cells.append(f"{a.get(field)}→{b.get(field)}" + ("" if pct is None else f" {pct:+.0f}%"))
+            # 吞吐下降与延迟上升都算变差
+            if pct is not None and field in ("p95_ms", "p99_ms"):
+                worst = max(worst, pct)
+            elif pct is not None and field == "rps":
+                worst = max(worst, -pct)
+        print(f"{name:<26}" + "".join(f"{c:>22}" for c in cells))
+    a, b = old["summary"].get("peak_rss_bytes"), new["summary"].get("peak_rss_bytes")
+    if a and b:
+        print(f"峰值 RSS {a / 1048576:.1f} → {b / 1048576:.1f} MiB（{_change(a, b):+.0f}%）")
+    if args.fail_above is not None and worst > args.fail_above:
+        print(f"变差 {worst:.0f}% 超过阈值 {args.fail_above}%")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="看板 API 压测")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def dataset_options(p):
+        p.add_argument("--scale", choices=sorted(SCALES), default="10k", help="预设规模，默认 10k")
+        for key in ("residents", "enterprises", "streets", "villages", "grids"):
+            p.add_argument(f"--{key}", type=int, help="覆盖预设规模中的同名参数")
+
+    p_run = sub.add_parser("run", help="生成（或复用）数据集，启动服务并压测")
+    dataset_options(p_run)
+    p_run.add_argument("--rebuild", action="store_true", help="重新生成数据集")
+    p_run.add_argument("--users", type=int, default=2, help="每个角色的模拟用户数，默认 2")
+    p_run.add_argument("--duration", type=float, default=20, help="计时时长（秒），默认 20")
+    p_run.add_argument("--warmup", type=float, default=5, help="预热时长（秒），默认 5")
+    p_run.add_argument("--think", type=float, default=0, help="两次请求之间的停顿（毫秒），默认 0")
+    p_run.add_argument("--no-gzip", action="store_true", help="不发送 Accept-Encoding: gzip")
+    p_run.add_argument("--etag", action="store_true", help="携带上次的 ETag（If-None-Match），模拟浏览器缓存")
+    p_run.add_argument("--server-args", default="", help='传给 server.py 的参数，如 "--async --workers 4"')
+    p_run.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                       help="服务进程的额外环境变量，可重复，如 METRICS_ENGINE=columnar")
+    p_run.add_argument("--port", type=int, help="服务端口，默认取一个空闲端口")
+    p_run.add_argument("--out", help="结果 JSON 路径")
+
+    p_cmp = sub.add_parser("compare", help="比对两次压测结果")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--fail-above", type=float, help="p95 / p99 上升或吞吐下降超过该百分比时退出码为 1")
+
+    p_seed = sub.add_parser("seed", help="只生成数据集")
+    dataset_options(p_seed)
+    p_seed.add_argument("--db", help="写入该路径（内部使用；默认写入 data/loadtest/ 缓存）")
+
+    args = parser.parse_args()
+    if args.cmd == "run":
+        return run_load(args)
+    if args.cmd == "compare":
+        return compare(args)
+    spec = _spec(args)
+    if args.db:
+        os.environ.update(DB_ENGINE="sqlite", DASHBOARD_DB=args.db)
+        os.environ.setdefault("BOOTSTRAP_SNAPSHOT_DIR", str(Path(args.db).with_suffix(".snapshots")))
+        seed_dataset(spec)
+    else:
+        ensure_dataset(spec, rebuild=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
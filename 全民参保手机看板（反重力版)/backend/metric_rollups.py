@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metric_rollups.py — 按组织单元物化的指标汇总表（unit_metric_rollups）
+
+每个 (unit_id, year) 一行，保存 services_metrics 用到的全部可加计数器，
+以及职工参保大类 / 细类的分类计数（JSON，按首次出现顺序）。
+范围查询只需把 get_descendants 得到的几行汇总相加，耗时与人口规模无关。
+
+unit_tag_counts 按同样的粒度保存各标签列每个取值的人数 / 企业数（tag='*' 为总数），
+供列表接口的近似总数使用（见 list_counts.py）。
+
+增量刷新：residents / enterprises 上的触发器把发生变化的 (unit_id, year)
+写入 unit_metric_rollup_dirty。读取路径只读：带脏标记的单元直接从原表现算，不写回；
+由定时任务执行 refresh（refresh_dirty()）重算这些单元并清除标记，读请求从不争用写锁。
+
+使用方法：
+    cd backend
+    python3 metric_rollups.py rebuild            # 全量重建
+    python3 metric_rollups.py rebuild --year 2026
+    python3 metric_rollups.py refresh            # 只刷新脏单元（建议每分钟由定时任务执行）
+"""
+import argparse
+import json
+import time
+
+from db import DB_ENGINE, get_conn
+from tag_codes import get_codec
+from services_metrics import (
+    COUNTER_NAMES,
+    ENTERPRISE_COUNTERS,
+    METRIC_PARTS,
+    RESIDENT_COUNTERS,
+    TAG_COLUMNS,
+    counter_defs,
+    metrics_from_counters,
+    ordered_counts,
+    sum_case_columns,
+)
+
+RESIDENT_COUNTER_NAMES = tuple(name for name, _, _ in RESIDENT_COUNTERS)
+ENTERPRISE_COUNTER_NAMES = tuple(name for name, _, _ in ENTERPRISE_COUNTERS)
+
+
+# ── 读取 ───────────────────────────────────────────────────────────────────────
+def compute_metrics_rollup(conn, unit_ids, year, parts=METRIC_PARTS):
+    """
+    汇总范围内各单元的物化计数器，返回 {part: payload}，与逐行引擎逐字节一致。
+    只读：带脏标记的单元不用其汇总行，改从原表现算（不写回），汇总表由 refresh 统一刷新。
+    """
+    counters = dict.fromkeys(COUNTER_NAMES, 0)
+    staff_big, staff_detail = {}, {}
+    unit_ids = sorted(unit_ids)
+    if unit_ids:
+        marks = ",".join(["?"] * len(unit_ids))
+        # 先读脏标记再读汇总行：刷新在同一事务内清标记并重算，看不到标记时汇总行必已更新
+        dirty = {r["unit_id"] for r in conn.execute(
+            f"SELECT unit_id FROM unit_metric_rollup_dirty WHERE year=? AND unit_id IN ({marks})",
+            [year] + unit_ids,
+        ).fetchall()}
+        units = {}
+        for r in conn.execute(
+            f"SELECT * FROM unit_metric_rollups WHERE year=? AND unit_id IN ({marks})",
+            [year] + unit_ids,
+        ).fetchall():
+            if r["unit_id"] not in dirty:
+                units[r["unit_id"]] = (r, json.loads(r["staff_big"]), json.loads(r["staff_detail"]))
+        if dirty:
+            for (unit_id, _), c in _compute_unit_rows(conn, year=year, unit_ids=sorted(dirty)).items():
+                units[unit_id] = (c, ordered_counts(c["_groups"], 0), ordered_counts(c["_groups"], 1))
+        # 单元按 unit_id 升序合并，分类计数的键顺序与逐行引擎的 (unit_id, id) 扫描顺序一致
+        for unit_id in sorted(units):
+            c, big, detail = units[unit_id]
+            for name in COUNTER_NAMES:
+                counters[name] += int(c[name])
+            for target, counts in ((staff_big, big), (staff_detail, detail)):
+                for k, v in counts.items():
+                    target[k] = target.get(k, 0) + v
+    return metrics_from_counters(counters, staff_big, staff_detail, parts)
+
+
+# ── 重建 / 增量刷新 ────────────────────────────────────────────────────────────
+def _where(year, unit_ids):
+    sql, params = " WHERE 1=1", []
+    if year is not None:
+        sql += " AND year=?"
+        params.append(year)
+    if unit_ids is not None:
+        sql += f" AND unit_id IN ({','.join(['?'] * len(unit_ids))})"
+        params.extend(unit_ids)
+    return sql, params
+
+
+def _compute_unit_rows(conn, year=None, unit_ids=None):
+    """按 (unit_id, year) 分组计算计数器，返回 {(unit_id, year): row_dict}。"""
+    out = {}
+
+    def slot(unit_id, y):
+        key = (unit_id, int(y))
+        if key not in out:
+            out[key] = dict.fromkeys(COUNTER_NAMES, 0)
+            out[key]["_groups"] = []
+        return out[key]
+
+    where, where_params = _where(year, unit_ids)
+    codec = get_codec(conn)
+    resident_defs, enterprise_defs, staff_type = counter_defs(codec)
+    cols, params = sum_case_columns(resident_defs)
+    sql = (
+        f"SELECT unit_id, year, staff_big_type, staff_detail_type, {cols}, "
+        "MIN(CASE WHEN this_year_type=? THEN id END) AS staff_first "
+        f"FROM residents{where} GROUP BY unit_id, year, staff_big_type, staff_detail_type"
+    )
+    for r in conn.execute(sql, params + [staff_type] + where_params).fetchall():
+        c = slot(r["unit_id"], r["year"])
+        for name in RESIDENT_COUNTER_NAMES:
+            c[name] += int(r[name] or 0)
+        if r["staff_people"]:
+            c["_groups"].append((
+                codec.decode("residents", "staff_big_type", r["staff_big_type"]),
+                codec.decode("residents", "staff_detail_type", r["staff_detail_type"]),
+                int(r["staff_people"]),
+                r["staff_first"],
+            ))
+
+    cols, params = sum_case_columns(enterprise_defs)
+    sql = f"SELECT unit_id, year, {cols} FROM enterprises{where} GROUP BY unit_id, year"
+    for r in conn.execute(sql, params + where_params).fetchall():
+        c = slot(r["unit_id"], r["year"])
+        for name in ENTERPRISE_COUNTER_NAMES:
+            c[name] = int(r[name] or 0)
+    return out
+
+
+def _json(counts):
+    return json.dumps(counts, ensure_ascii=False)
+
+
+def _write_rows(conn, computed):
+    cols = ("unit_id", "year") + COUNTER_NAMES + ("staff_big", "staff_detail", "updated_at")
+    now = int(time.time())
+    rows = []
+    for (unit_id, y), c in computed.items():
+        rows.append(
+            (unit_id, y)
+            + tuple(c[name] for name in COUNTER_NAMES)
+            + (_json(ordered_counts(c["_groups"], 0)), _json(ordered_counts(c["_groups"], 1)), now)
+        )
+    conn.executemany(
+        f"REPLACE INTO unit_metric_rollups({','.join(cols)}) VALUES({','.join(['?'] * len(cols))})",
+        rows,
+    )
+
+
+def _write_tag_counts(conn, year=None, unit_ids=None):
+    """重算 unit_tag_counts（范围同 _where），先删后写。取值一律存文字（字典编码存储时先还原）。"""
+    where, params = _where(year, unit_ids)
+    codec = get_codec(conn)
+    conn.execute(f"DELETE FROM unit_tag_counts{where}", params)
+    rows = []
+    for table, columns in TAG_COLUMNS.items():
+        for r in conn.execute(f"SELECT unit_id, year, COUNT(1) AS cnt FROM {table}{where} GROUP BY unit_id, year", params).fetchall():
+            rows.append((table, r["unit_id"], int(r["year"]), "*", "", int(r["cnt"])))
+        for col in columns:
+            sql = f"SELECT unit_id, year, {col} AS value, COUNT(1) AS cnt FROM {table}{where} GROUP BY unit_id, year, {col}"
+            for r in conn.execute(sql, params).fetchall():
+                if r["value"] is None or r["value"] == "":
+                    continue
+                value = codec.decode(table, col, r["value"])
+                rows.append((table, r["unit_id"], int(r["year"]), col, str(value), int(r["cnt"])))
+    conn.executemany(
+        "INSERT INTO unit_tag_counts(table_name, unit_id, year, tag, value, cnt) VALUES(?,?,?,?,?,?)",
+        rows,
+    )
+
+
+def rebuild_rollups(conn, year=None):
+    """全量重建（可限定年度），并清空对应的脏标记。返回写入的汇总行数。"""
+    where, params = _where(year, None)
+    conn.execute(f"DELETE FROM unit_metric_rollup_dirty{where}", params)
+    conn.execute(f"DELETE FROM unit_metric_rollups{where}", params)
+    computed = _compute_unit_rows(conn, year=year)
+    _write_rows(conn, computed)
+    _write_tag_counts(conn, year=year)
+    conn.commit()
+    return len(computed)
+
+
+def refresh_units(conn, pairs):
+    """重算指定的 (unit_id, year) 汇总行；单元已无数据时删除其汇总行。"""
+    by_year = {}
+    for unit_id, y in pairs:
+        by_year.setdefault(int(y), set()).add(unit_id)
+    for y, units in by_year.items():
+        units = sorted(units)
+        computed = _compute_unit_rows(conn, year=y, unit_ids=units)
+        marks = ",".join(["?"] * len(units))
+        conn.execute(f"DELETE FROM unit_metric_rollups WHERE year=? AND unit_id IN ({marks})", [y] + units)
+        _write_rows(conn, computed)
+        _write_tag_counts(conn, year=y, unit_ids=units)
+
+
+def refresh_dirty(conn):
+    """刷新触发器标记的脏单元；无脏单元时只有一次小表查询。返回刷新的单元数。"""
+    pairs = [(r["unit_id"], r["year"]) for r in conn.execute("SELECT unit_id, year FROM unit_metric_rollup_dirty").fetchall()]
+    if not pairs:
+        return 0
+    # 先删脏标记再重算：重算期间的新写入会重新打标，下次读取时再刷新
+    for unit_id, y in pairs:
+        conn.execute("DELETE FROM unit_metric_rollup_dirty WHERE unit_id=? AND year=?", [unit_id, y])
+    refresh_units(conn, pairs)
+    conn.commit()
+    return len(pairs)
+
+
+# ── 建表 DDL（供迁移脚本使用，与 schema.sql / schema_mysql.sql 保持一致）────────
+def _ddl_sqlite():
+    counters = "".join(f"  {name} INTEGER NOT NULL DEFAULT 0,\n" for name in COUNTER_NAMES)
+    triggers = []
+    for table in ("residents", "enterprises"):
+        for event, refs in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+            body = "".join(
+                f"  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES ({ref}.unit_id, {ref}.year);\n"
+                for ref in refs
+            )
+            triggers.append(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_{event[0].lower()} AFTER {event} ON {table}\n"
+                f"BEGIN\n{body}END;\n"
+            )
+    return (
+        "CREATE TABLE IF NOT EXISTS unit_metric_rollups (\n"
+        "  unit_id TEXT NOT NULL,\n"
+        "  year INTEGER NOT NULL,\n"
+        f"{counters}"
+        "  staff_big TEXT NOT NULL,\n"
+        "  staff_detail TEXT NOT NULL,\n"
+        "  updated_at INTEGER NOT NULL,\n"
+        "  PRIMARY KEY (unit_id, year)\n"
+        ");\n"
+        "CREATE TABLE IF NOT EXISTS unit_metric_rollup_dirty (\n"
+        "  unit_id TEXT NOT NULL,\n"
+        "  year INTEGER NOT NULL,\n"
+        "  PRIMARY KEY (unit_id, year)\n"
+        ");\n"
+        "CREATE TABLE IF NOT EXISTS unit_tag_counts (\n"
+        "  table_name TEXT NOT NULL,\n"
+        "  unit_id TEXT NOT NULL,\n"
+        "  year INTEGER NOT NULL,\n"
+        "  tag TEXT NOT NULL,\n"
+        "  value TEXT NOT NULL,\n"
+        "  cnt INTEGER NOT NULL DEFAULT 0,\n"
+        "  PRIMARY KEY (table_name, year, unit_id, tag, value)\n"
+        ");\n"
+        + "".join(triggers)
+    )
+
+
+def _ddl_mysql():
+    counters = "".join(f"    {name:<22} INT NOT NULL DEFAULT 0,\n" for name in COUNTER_NAMES)
+    triggers = []
+    for table in ("residents", "enterprises"):
+        for event, refs in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+            name = f"trg_{table}_rollup_{event[0].lower()}"
+            values = ", ".join(f"({ref}.unit_id, {ref}.year)" for ref in refs)
+            triggers.append(
+                f"DROP TRIGGER IF EXISTS {name};\n"
+                f"CREATE TRIGGER {name} AFTER {event} ON {table} FOR EACH ROW\n"
+                f"    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES {values};\n"
+            )
+    return (
+        "CREATE TABLE IF NOT EXISTS unit_metric_rollups (\n"
+        "    unit_id                VARCHAR(64) NOT NULL,\n"
+        "    year                   INT NOT NULL,\n"
+        f"{counters}"
+        "    staff_big              TEXT NOT NULL,\n"
+        "    staff_detail           TEXT NOT NULL,\n"
+        "    updated_at             BIGINT NOT NULL,\n"
+        "    PRIMARY KEY (unit_id, year)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;\n"
+        "CREATE TABLE IF NOT EXISTS unit_metric_rollup_dirty (\n"
+        "    unit_id VARCHAR(64) NOT NULL,\n"
+        "    year    INT NOT NULL,\n"
+        "    PRIMARY KEY (unit_id, year)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;\n"
+        "CREATE TABLE IF NOT EXISTS unit_tag_counts (\n"
+        "    table_name VARCHAR(32)  NOT NULL,\n"
+        "    unit_id    VARCHAR(64)  NOT NULL,\n"
+        "    year       INT          NOT NULL,\n"
+        "    tag        VARCHAR(64)  NOT NULL,\n"
+        "    value      VARCHAR(128) NOT NULL,\n"
+        "    cnt        INT          NOT NULL DEFAULT 0,\n"
+        "    PRIMARY KEY (table_name, year, unit_id, tag, value)\n"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;\n"
+        + "".join(triggers)
+    )
+
+
+DDL = _ddl_mysql() if DB_ENGINE == "mysql" else _ddl_sqlite()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="维护 unit_metric_rollups 指标汇总表")
+    parser.add_argument("command", choices=["rebuild", "refresh"])
+    parser.add_argument("--year", type=int, default=None, help="仅重建指定年度（rebuild 时有效）")
+    args = parser.parse_args()
+
+    conn = get_conn()
+    try:
+        if args.command == "rebuild":
+            n = rebuild_rollups(conn, year=args.year)
+            print(f"rollup rebuild ok: {n} 个单元")
+        else:
+            n = refresh_dirty(conn)
+            print(f"rollup refresh ok: {n} 个脏单元")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+microbench.py — 指标计算与 bootstrap 组装热点函数的微基准（标准库计时，带基线与回归判定）
+
+被测函数（均按当前代码直接调用，不经 HTTP）：
+  compute_core_metrics / compute_age_metrics / compute_staff_metrics / compute_risk_metrics
+  compute_all_metrics（单遍内核，作对照）
+  _extract_address_parts（对数据集中全部居民 / 企业地址各解析一次）
+  _enrich_bootstrap_payload（输入为 _map_resident / _map_enterprise 的结果，每轮重新拷贝，拷贝不计时）
+  _build_bootstrap（区级账号，含两条全范围 SELECT）
+
+数据集与 loadtest.py 共用（data/loadtest/ 下按规模缓存，首次运行时生成），组织树固定，
+只改变行数，便于看出各函数随行数的伸缩。每个 (函数, 规模) 执行 --repeat 轮，
+计时期间关闭 GC，取最快一轮（best）作比较依据，同时记录中位数。
+
+基线：--save 把本次结果写入基线文件；不带 --save 时与基线比对，best 比基线慢超过
+--threshold（默认 15%）的项标为 REGRESSION，存在回归时退出码为 1。基线与机器相关，
+默认保存在 data/microbench/（不入库），换机器后请重新 --save。
+
+使用方法：
+    cd backend
+    python3 microbench.py --save                      # 记录基线
+    python3 microbench.py                             # 与基线比对
+    python3 microbench.py --sizes 10k --only compute_core_metrics,_build_bootstrap --repeat 9
+"""
+import argparse
+import gc
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+BASELINE = BASE / "data" / "microbench" / "baseline.json"
+
+# 被测模块在导入时读取环境变量：鉴权密钥、快照目录都不能碰到正式配置
+os.environ.setdefault("DASHBOARD_SECRET", "microbench-only-secret")
+os.environ["BOOTSTRAP_SNAPSHOT_DIR"] = os.path.join(tempfile.gettempdir(), "dashboard-microbench-snapshots")
+os.environ["INSTRUMENTATION"] = "0"
+
+import loadtest  # noqa: E402
+
+# 组织树固定为 3 个街道 × 4 个社区 × 3 个网格，企业数取居民数的 1/6
+SIZES = {"1k": 1_000, "10k": 10_000, "50k": 50_000}
+TREE = dict(streets=3, villages=4, grids=3)
+
+
+def _dataset(n):
+    spec = dict(residents=n, enterprises=max(n // 6, 1), **TREE)
+    return loadtest.ensure_dataset(spec)
+
+
+def _connect(path):
+    # 与 db._connect 相同的 SQLite 连接设置；不经 DASHBOARD_DB，以便同一进程打开多个规模的库
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class Fixture:
+    """一个规模的输入数据：原始行（dict）、bootstrap 映射后的行、组织树与区级用户。"""
+
+    def __init__(self, conn):
+        import org_tree
+        import server
+        import tag_codes
+        from services_metrics import fetch_metric_rows
+
+        # 编解码表与组织树是进程级缓存，换库时须清掉
+        tag_codes.reset()
+        org_tree.invalidate()
+        self.conn = conn
+        codec = server.get_codec(conn)
+        unit_ids = [r[0] for r in conn.execute("SELECT id FROM org_units").fetchall()]
+        self.residents = [server.row_to_dict(r, "residents", codec)
+                          for r in conn.execute("SELECT * FROM residents WHERE year=2026").fetchall()]
+        self.enterprises = [server.row_to_dict(r, "enterprises", codec)
+                            for r in conn.execute("SELECT * FROM enterprises WHERE year=2026").fetchall()]
+        self.metric_residents = fetch_metric_rows(conn, "residents", unit_ids, 2026)
+        self.metric_enterprises = fetch_metric_rows(conn, "enterprises", unit_ids, 2026)
+        self.mapped_residents = [server._map_resident(r, codec) for r in
+                                 conn.execute("SELECT * FROM residents WHERE year=2026").fetchall()]
+        self.mapped_enterprises = [server._map_enterprise(r, codec) for r in
+                                   conn.execute("SELECT * FROM enterprises WHERE year=2026").fetchall()]
+        self.addresses = ([r["household_addr"] for r in self.residents]
+                          + [r["residence_addr"] for r in self.residents]
+                          + [e["address"] for e in self.enterprises])
+        self.by_id = server.get_org_tree(conn).by_id
+        self.codec = codec
+        self.user = dict(conn.execute("SELECT * FROM users WHERE username='district'").fetchone())
+
+
+def _benchmarks(fx):
+    """(名称, 每轮准备输入的函数, 被测调用)。准备函数的返回值作为被测调用的参数，不计时。"""
+    import server
+    from services_metrics import (
+        compute_age_metrics,
+        compute_all_metrics,
+        compute_core_metrics,
+        compute_risk_metrics,
+        compute_staff_metrics,
+    )
+
+    def no_setup():
+        return ()
+
+    def copy_mapped():
+        return [dict(r) for r in fx.mapped_residents], [dict(e) for e in fx.mapped_enterprises]
+
+    def parse_all():
+        for a in fx.addresses:
+            server._extract_address_parts(a)
+
+    return [
+        ("compute_core_metrics", no_setup, lambda: compute_core_metrics(fx.residents)),
+        ("compute_age_metrics", no_setup, lambda: compute_age_metrics(fx.residents)),
+        ("compute_staff_metrics", no_setup, lambda: compute_staff_metrics(fx.residents, fx.enterprises)),
+        ("compute_risk_metrics", no_setup, lambda: compute_risk_metrics(fx.residents, fx.enterprises)),
+        ("compute_all_metrics", no_setup,
+         lambda: compute_all_metrics(fx.metric_residents, fx.metric_enterprises, codec=fx.codec)),
+        ("_extract_address_parts", no_setup, parse_all),
+        ("_enrich_bootstrap_payload", copy_mapped,
+         lambda residents, enterprises: server._enrich_bootstrap_payload(residents, enterprises, fx.by_id)),
+        ("_build_bootstrap", no_setup, lambda: server._build_bootstrap(fx.conn, fx.user, 2026)),
+    ]
+
+
+def _time(setup, fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        args = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - t0)
+        finally:
+            gc.enable()
+    return min(samples), statistics.median(samples)
+
+
+def run(sizes, only, repeat):
+    results = {}
+    for size in sizes:
+        path = _dataset(SIZES[size])
+        conn = _connect(path)
+        try:
+            fx = Fixture(conn)
+            for name, setup, fn in _benchmarks(fx):
+                if only and name not in only:
+                    continue
+                best, median = _time(setup, fn, repeat)
+                results[f"{name}@{size}"] = {
+                    "best_ms": round(best * 1000, 3),
+                    "median_ms": round(median * 1000, 3),
+                    "rows": len(fx.residents),
+                }
+                print(f"  {name:<28}{size:>5}{best * 1000:>12.2f}{median * 1000:>12.2f}", flush=True)
+        finally:
+            conn.close()
+    return results
+
+
+def _meta():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                             capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    return {
+        "commit": rev,
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+    }
+
+
+def compare(results, baseline, threshold):
+    """打印与基线的对比，返回回归项列表。"""
+    regressions = []
+    print(f"\n与基线（{baseline['meta'].get('commit')}，{baseline['meta'].get('time')}）比对，阈值 {threshold:.0f}%：")
+    print(f"  {'函数@规模':<34}{'基线 ms':>12}{'本次 ms':>12}{'变化':>10}")
+    for key, cur in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            print(f"  {key:<34}{'—':>12}{cur['best_ms']:>12.2f}{'新增':>10}")
+            continue
+        change = (cur["best_ms"] - base["best_ms"]) / base["best_ms"] * 100.0 if base["best_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"  {key:<34}{base['best_ms']:>12.2f}{cur['best_ms']:>12.2f}{change:>+9.0f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点函数微基准")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"规模，逗号分隔，可选 {','.join(SIZES)}")
+    parser.add_argument("--only", default="", help="只跑这些函数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5, help="每项执行轮数，默认 5")
+    parser.add_argument("--baseline", default=str(BASELINE), help="基线文件路径")
+    parser.add_argument("--save", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--threshold", type=float, default=15.0, help="判为回归的变慢百分比，默认 15")
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"未知规模：{','.join(unknown)}")
+    only = {s for s in args.only.split(",") if s}
+
+    print(f"  {'函数':<28}{'规模':>5}{'best ms':>12}{'median ms':>12}")
+    results = run(sizes, only, args.repeat)
+    baseline_path = Path(args.baseline)
+
+    if args.save:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"meta": _meta(), "repeat": args.repeat, "results": results}
+        if baseline_path.exists():
+            # 只更新本次跑过的项，其余保留
+            old = json.loads(baseline_path.read_text(encoding="utf-8"))
+            data["results"] = {**old.get("results", {}), **results}
+        baseline_path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\n基线已写入 {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"\n没有基线文件 {baseline_path}，先用 --save 记录")
+        return 0
+    regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项变慢超过 {args.threshold:.0f}%：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_covering_indexes.py
+-------------------------------------------------------
+一次性迁移脚本：为已存在的数据库补建热点查询的覆盖索引
+idx_residents_scope_cover / idx_enterprises_scope_cover（列由 index_advisor.py 推导），
+并删除被取代、会误导优化器的旧索引 idx_residents_type / idx_enterprises_risk。
+
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——可重复执行，不影响已有数据。大表建索引需要一些时间，建议在低峰期执行。
+
+使用方法：
+    cd backend
+    python3 migrate_add_covering_indexes.py
+"""
+from db import get_conn, DB_ENGINE
+from index_advisor import DDL, audit, mysql_drop_statements, mysql_statements
+
+
+def migrate():
+    conn = get_conn()
+    try:
+        if DB_ENGINE == "mysql":
+            existing = {
+                r["index_name"]
+                for r in conn.execute(
+                    "SELECT DISTINCT index_name AS index_name FROM information_schema.statistics "
+                    "WHERE table_schema=DATABASE()"
+                ).fetchall()
+            }
+            added, dropped = [], []
+            for name, table, stmt in mysql_statements():
+                if name not in existing:
+                    conn.execute(stmt)
+                    added.append(name)
+            for name, table, stmt in mysql_drop_statements():
+                if name in existing:
+                    conn.execute(stmt)
+                    dropped.append(name)
+            conn.commit()
+            print("✅ 迁移完成（MySQL dashboard 数据库）")
+            print(f"   新建覆盖索引：{', '.join(added) if added else '无（均已存在）'}")
+            print(f"   删除旧索引：{', '.join(dropped) if dropped else '无'}")
+        else:
+            conn.executescript(DDL)
+            conn.commit()
+            print("✅ 迁移完成（SQLite）")
+            print("   覆盖索引：idx_residents_scope_cover / idx_enterprises_scope_cover")
+            print("   已删除旧索引：idx_residents_type / idx_enterprises_risk（如存在）")
+        for table, name, note in audit(conn):
+            print(f"   {table}.{name}：{note}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_data_versions.py
+-------------------------------------------------------
+一次性迁移脚本：为已存在的数据库补建 data_versions 版本表，
+并在 org_units / residents / enterprises / users 上挂载“变更即递增版本号”的触发器。
+
+进程内缓存（组织树、登录用户等）与 bootstrap 快照通过比对版本号判断是否需要重新加载。
+已执行过本脚本的库可再次执行，补建新增表（如 users）的触发器。
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——可重复执行，不影响已有数据。
+
+使用方法：
+    cd backend
+    python3 migrate_add_data_versions.py
+"""
+from db import get_conn, DB_ENGINE
+
+# SQLite 版 DDL
+_DDL_SQLITE = """
+CREATE TABLE IF NOT EXISTS data_versions (
+    name     TEXT    PRIMARY KEY,
+    version  INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('org_units', 0);
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_i AFTER INSERT ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_u AFTER UPDATE ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_d AFTER DELETE ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('residents', 0);
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_i AFTER INSERT ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_u AFTER UPDATE ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_d AFTER DELETE ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('enterprises', 0);
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_i AFTER INSERT ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_u AFTER UPDATE ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_d AFTER DELETE ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('users', 0);
+CREATE TRIGGER IF NOT EXISTS trg_users_version_i AFTER INSERT ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_version_u AFTER UPDATE ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_version_d AFTER DELETE ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+"""
+
+# MySQL 版 DDL
+_DDL_MYSQL = """
+CREATE TABLE IF NOT EXISTS data_versions (
+    name     VARCHAR(64) NOT NULL,
+    version  BIGINT      NOT NULL DEFAULT 0,
+    PRIMARY KEY (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+INSERT IGNORE INTO data_versions(name, version) VALUES ('org_units', 0);
+DROP TRIGGER IF EXISTS trg_org_units_version_i;
+CREATE TRIGGER trg_org_units_version_i AFTER INSERT ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+DROP TRIGGER IF EXISTS trg_org_units_version_u;
+CREATE TRIGGER trg_org_units_version_u AFTER UPDATE ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+DROP TRIGGER IF EXISTS trg_org_units_version_d;
+CREATE TRIGGER trg_org_units_version_d AFTER DELETE ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('residents', 0);
+DROP TRIGGER IF EXISTS trg_residents_version_i;
+CREATE TRIGGER trg_residents_version_i AFTER INSERT ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+DROP TRIGGER IF EXISTS trg_residents_version_u;
+CREATE TRIGGER trg_residents_version_u AFTER UPDATE ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+DROP TRIGGER IF EXISTS trg_residents_version_d;
+CREATE TRIGGER trg_residents_version_d AFTER DELETE ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('enterprises', 0);
+DROP TRIGGER IF EXISTS trg_enterprises_version_i;
+CREATE TRIGGER trg_enterprises_version_i AFTER INSERT ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+DROP TRIGGER IF EXISTS trg_enterprises_version_u;
+CREATE TRIGGER trg_enterprises_version_u AFTER UPDATE ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+DROP TRIGGER IF EXISTS trg_enterprises_version_d;
+CREATE TRIGGER trg_enterprises_version_d AFTER DELETE ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('users', 0);
+DROP TRIGGER IF EXISTS trg_users_version_i;
+CREATE TRIGGER trg_users_version_i AFTER INSERT ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+DROP TRIGGER IF EXISTS trg_users_version_u;
+CREATE TRIGGER trg_users_version_u AFTER UPDATE ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+DROP TRIGGER IF EXISTS trg_users_version_d;
+CREATE TRIGGER trg_users_version_d AFTER DELETE ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+"""
+
+DDL = _DDL_MYSQL if DB_ENGINE == "mysql" else _DDL_SQLITE
+
+
+def migrate():
+    conn = get_conn()
+    try:
+        conn.executescript(DDL)
+        conn.commit()
+
+        rows = conn.execute("SELECT name, version FROM data_versions ORDER BY name").fetchall()
+        print(f"✅ 迁移完成（{'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else 'SQLite'}）")
+        for r in rows:
+            print(f"   {r['name']}：version {r['version']}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate()
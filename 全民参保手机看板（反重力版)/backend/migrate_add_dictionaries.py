@@ -17,6 +17,7 @@ import os
 from pathlib import Path
 
 from db import get_conn, DB_ENGINE
+from tag_codes import dictionary_upsert_sql
 
 # SQLite 版建表 DDL
 _DDL_SQLITE = """
@@ -125,11 +126,8 @@ def migrate():
     try:
         # 建表（已存在则跳过）
         conn.executescript(DDL)
-        # 写入字典数据（幂等）
-        conn.executemany(
-            "REPLACE INTO dictionaries(category, value, sort_order) VALUES(?,?,?)",
-            DICT_DATA,
-        )
+        # 写入字典数据（幂等；保留已有 id，字典编码存储的数据依赖这些 id）
+        conn.executemany(dictionary_upsert_sql(), DICT_DATA)
         conn.commit()
 
         # 验证
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_metric_rollups.py
+-------------------------------------------------------
+一次性迁移脚本：为已存在的数据库补建 unit_metric_rollups 指标汇总表、
+unit_tag_counts 标签计数表、脏单元表及 residents / enterprises 上的增量刷新触发器，并全量重建汇总。
+
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——可重复执行，不影响已有居民/企业/用户数据。
+
+使用方法：
+    cd backend
+    python3 migrate_add_metric_rollups.py
+"""
+from db import get_conn, DB_ENGINE
+from metric_rollups import DDL, rebuild_rollups
+
+
+def migrate():
+    conn = get_conn()
+    try:
+        # 建表 + 触发器（已存在则跳过）
+        conn.executescript(DDL)
+        conn.commit()
+        # 全量重建汇总行
+        n = rebuild_rollups(conn)
+        print(f"✅ 迁移完成（{'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else 'SQLite'}）")
+        print(f"   指标汇总：{n} 个 (单元, 年度)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate()
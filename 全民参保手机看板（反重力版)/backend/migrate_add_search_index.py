@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_search_index.py
+-------------------------------------------------------
+一次性迁移脚本：为已存在的数据库补建居民 / 企业的子串检索索引。
+  SQLite: 建 residents_fts / enterprises_fts（FTS5 trigram）及同步触发器，并按现有数据重建；
+  MySQL:  补建 ngram 解析器的 FULLTEXT 索引（已存在的跳过）。
+
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——可重复执行，不影响已有数据。迁移后需重启后端服务才会启用索引。
+
+使用方法：
+    cd backend
+    python3 migrate_add_search_index.py
+"""
+from db import get_conn, DB_ENGINE
+from search_index import DDL, mysql_fulltext_statements, rebuild
+
+
+def migrate():
+    conn = get_conn()
+    try:
+        if DB_ENGINE == "mysql":
+            existing = {
+                r["index_name"]
+                for r in conn.execute(
+                    "SELECT DISTINCT index_name AS index_name FROM information_schema.statistics "
+                    "WHERE table_schema=DATABASE() AND index_type='FULLTEXT'"
+                ).fetchall()
+            }
+            added = []
+            for name, table, stmt in mysql_fulltext_statements():
+                if name not in existing:
+                    conn.execute(stmt)
+                    added.append(name)
+            conn.commit()
+            print("✅ 迁移完成（MySQL dashboard 数据库）")
+            print(f"   新建 FULLTEXT 索引：{', '.join(added) if added else '无（均已存在）'}")
+        else:
+            conn.executescript(DDL)
+            conn.commit()
+            # 外部内容表不会自动收录建表前已有的行，按原表内容整体重建
+            rebuild(conn)
+            print("✅ 迁移完成（SQLite）")
+            print("   检索索引：residents_fts / enterprises_fts 已重建")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate()
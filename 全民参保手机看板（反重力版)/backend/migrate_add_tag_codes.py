@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_tag_codes.py
+-------------------------------------------------------
+迁移脚本：把 residents / enterprises 的标签列（户籍、居住、参保类型、存量变化类型、
+减员原因、职工参保细类、企业风险等级等，见 tag_codes.ENCODED_COLUMNS）
+转换为字典编码存储——列中改存 dictionaries.id；--decode 还原为文字存储。
+
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——已编码的列跳过，可重复执行；接口输出不变。转换后需重启后端服务。
+转换会更新全部行：汇总表按脏单元增量刷新，bootstrap 快照随数据版本失效后重建。
+
+使用方法：
+    cd backend
+    python3 migrate_add_tag_codes.py            # 转换为字典编码
+    python3 migrate_add_tag_codes.py --decode   # 还原为文字
+"""
+import argparse
+
+from db import get_conn, DB_ENGINE
+from tag_codes import ENCODED_COLUMNS, decode_tables, encode_tables
+
+
+def _column_bytes(conn):
+    """各表标签列当前占用的字节数（SQLite 粗略统计，用于对比转换前后）。"""
+    out = {}
+    for table, columns in ENCODED_COLUMNS.items():
+        expr = " + ".join(f"LENGTH(CAST({c} AS BLOB))" for c in columns)
+        out[table] = int(conn.execute(f"SELECT COALESCE(SUM({expr}), 0) AS n FROM {table}").fetchone()["n"])
+    return out
+
+
+def migrate(decode=False):
+    conn = get_conn()
+    try:
+        before = _column_bytes(conn) if DB_ENGINE != "mysql" else None
+        changed = decode_tables(conn) if decode else encode_tables(conn)
+        print(f"✅ 迁移完成（{'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else 'SQLite'}）")
+        action = "还原为文字" if decode else "转换为字典编码"
+        print(f"   {action}：{', '.join(f'{t}.{c}' for t, c in changed) if changed else '无（均已完成）'}")
+        if before is not None and changed:
+            after = _column_bytes(conn)
+            for table in before:
+                print(f"   {table} 标签列：{before[table]} → {after[table]} 字节")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="标签列字典编码存储的转换 / 还原")
+    parser.add_argument("--decode", action="store_true", help="还原为文字存储")
+    migrate(parser.parse_args().decode)
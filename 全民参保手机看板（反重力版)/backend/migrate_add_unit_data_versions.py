@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+migrate_add_unit_data_versions.py
+-------------------------------------------------------
+一次性迁移脚本：为已存在的数据库补建 unit_data_versions 单元变更版本表，
+并在 residents / enterprises 上挂载“变更即记录 (单元, 年度) 当前版本号”的触发器。
+
+列式数据（METRICS_ENGINE=columnar，见 columnar_store.py）据此只重载发生变化的单元；
+未执行本脚本时，数据每次变更都整表重载。需先执行 migrate_add_data_versions.py。
+支持 SQLite 和 MySQL，通过 DB_ENGINE 环境变量自动识别。
+操作幂等——可重复执行，不影响已有数据。
+
+使用方法：
+    cd backend
+    python3 migrate_add_unit_data_versions.py
+"""
+from db import get_conn, DB_ENGINE
+from columnar_store import DDL
+
+
+def migrate():
+    conn = get_conn()
+    try:
+        conn.executescript(DDL)
+        conn.commit()
+        print(f"✅ 迁移完成（{'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else 'SQLite'}）")
+        print("   unit_data_versions 表及 residents / enterprises 触发器已就绪")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,104 @@
+"""
+org_tree.py — 进程级组织树缓存
+
+org_units 只有几十行且极少变动，却在每次请求中被反复读取（权限范围解析、
+bootstrap 层级、个人信息）。这里把整棵树连同各节点的后代集合、祖先链、
+层级一次性算好，缓存在进程内；请求中的范围解析与个人信息组装都变成字典查找。
+
+失效：org_units 上的触发器在每次变更时递增 data_versions 中 'org_units' 的版本号，
+get_org_tree() 通过一次单行查询比对版本，版本变化才重新加载。
+探测频率由 ORG_TREE_CHECK_INTERVAL（秒，默认 1）控制，设为 0 表示每次都探测。
+"""
+import os
+import threading
+import time
+
+from db import read_data_version
+
+CHECK_INTERVAL = float(os.getenv("ORG_TREE_CHECK_INTERVAL", "1"))
+
+
+class OrgTree:
+    """组织树快照（只读，可在线程间共享）。节点 dict 不可修改。"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.by_id = {}
+        self.children = {}
+        for r in rows:
+            d = dict(r)
+            self.by_id[d["id"]] = d
+            self.children.setdefault(d["parent_id"], []).append(d)
+        self._descendants = {uid: self._walk(uid) for uid in self.by_id}
+        self._descendant_sets = {uid: frozenset(ids) for uid, ids in self._descendants.items()}
+        self.ancestors = {uid: self._ancestor_chain(uid) for uid in self.by_id}
+
+    def _walk(self, root_id):
+        out = []
+        stack = [root_id]
+        while stack:
+            cur = stack.pop()
+            out.append(cur)
+            stack.extend(ch["id"] for ch in self.children.get(cur, []))
+        return out
+
+    def _ancestor_chain(self, unit_id):
+        chain = []
+        cur = self.by_id.get(unit_id)
+        while cur is not None and cur["id"] not in chain:
+            chain.append(cur["id"])
+            cur = self.by_id.get(cur["parent_id"])
+        return chain
+
+    def descendants(self, unit_id):
+        """unit_id 自身及全部后代（深度优先顺序）；未知单元只返回自身。"""
+        return list(self._descendants.get(unit_id) or [unit_id])
+
+    def descendant_set(self, unit_id):
+        return self._descendant_sets.get(unit_id) or frozenset([unit_id])
+
+    def level(self, unit_id):
+        u = self.by_id.get(unit_id)
+        return u["level"] if u else None
+
+    def unit_brief(self, unit_id):
+        """与 SELECT id,name,level FROM org_units WHERE id=? 的返回结构一致。"""
+        u = self.by_id.get(unit_id)
+        if u is None:
+            return None
+        return {"id": u["id"], "name": u["name"], "level": u["level"]}
+
+
+_lock = threading.Lock()
+_cached = None
+_checked_at = 0.0
+
+
+def load_org_tree(conn, version=None):
+    rows = conn.execute("SELECT id, parent_id, name, level FROM org_units").fetchall()
+    return OrgTree(rows, version)
+
+
+def get_org_tree(conn):
+    """返回当前进程缓存的组织树；版本号变化（或无法读取版本号）时重新加载。"""
+    global _cached, _checked_at
+    now = time.monotonic()
+    tree = _cached
+    if tree is not None and tree.version is not None and now - _checked_at < CHECK_INTERVAL:
+        return tree
+    version = read_data_version(conn, "org_units")
+    if tree is not None and version is not None and tree.version == version:
+        _checked_at = now
+        return tree
+    tree = load_org_tree(conn, version)
+    with _lock:
+        _cached = tree
+        _checked_at = now
+    return tree
+
+
+def invalidate():
+    """丢弃缓存，下次访问时重新加载（用于绕过触发器的批量导入之后）。"""
+    global _cached
+    with _lock:
+        _cached = None
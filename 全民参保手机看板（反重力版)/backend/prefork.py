@@ -0,0 +1,95 @@
+"""
+prefork.py — 多进程 pre-fork 模式（python3 server.py --workers N）
+
+指标计算、bootstrap 组装都是纯 Python 的 CPU 计算，单进程内受 GIL 限制只能用满一个核。
+这里由主进程（supervisor）创建监听 socket，预热进程内缓存后 fork 出 N 个工作进程：
+  - 各工作进程继承同一个监听 socket，由内核在它们之间分配新连接；
+  - 预热在 fork 之前完成（组织树、编解码表、已启用的列式数据 / 位图索引），并 gc.freeze()，
+    子进程以写时复制的方式共享这些内存页；数据变更后各进程按版本号各自刷新；
+  - 工作进程异常退出时 supervisor 立即补起一个（10 秒内频繁退出则每次间隔 1 秒，避免空转）；
+  - supervisor 收到 SIGTERM / SIGINT 时转发给全部工作进程并等待其退出。
+需要 os.fork（Linux / macOS）。
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+RESTART_WINDOW = 10.0
+RESTART_DELAY = 1.0
+
+
+def _describe(status):
+    if os.WIFSIGNALED(status):
+        return f"signal {os.WTERMSIG(status)}"
+    return f"exit {os.WEXITSTATUS(status)}"
+
+
+def run(host, port, workers, serve, warmup=None):
+    """
+    serve(sock) 在每个工作进程中运行，接收继承来的监听 socket 并一直服务下去；
+    warmup() 在 fork 之前于主进程中执行。
+    """
+    sock = socket.create_server((host, port), backlog=socket.SOMAXCONN)
+    if warmup is not None:
+        warmup()
+    gc.freeze()
+
+    children = {}
+    restarts = []
+    stopping = False
+
+    def spawn(slot):
+        # 先清空输出缓冲，否则子进程会把父进程尚未写出的内容再写一遍
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                serve(sock)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(workers):
+        spawn(slot)
+    print(f"dashboard backend supervisor {os.getpid()}: {workers} workers on http://{host}:{port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        print(f"worker {pid} exited ({_describe(status)}), restarting")
+        now = time.monotonic()
+        restarts = [t for t in restarts if now - t < RESTART_WINDOW] + [now]
+        if len(restarts) > workers:
+            time.sleep(RESTART_DELAY)
+        if not stopping:
+            spawn(slot)
+    sock.close()
@@ -67,9 +67,46 @@ CREATE TABLE IF NOT EXISTS enterprises (
 
 CREATE INDEX IF NOT EXISTS idx_residents_unit_year ON residents(unit_id, year);
 CREATE INDEX IF NOT EXISTS idx_residents_name ON residents(name);
-CREATE INDEX IF NOT EXISTS idx_residents_type ON residents(this_year_type, this_year_paid);
 CREATE INDEX IF NOT EXISTS idx_enterprises_unit_year ON enterprises(unit_id, year);
-CREATE INDEX IF NOT EXISTS idx_enterprises_risk ON enterprises(risk);
+-- 热点查询的覆盖索引：year → unit_id → id → 指标列 / 标签列（由 index_advisor.py 推导）
+CREATE INDEX IF NOT EXISTS idx_residents_scope_cover ON residents(year, unit_id, id, this_year_paid, this_year_type, stock_change_type, loss_reason, last_year_local_paid, household, residence, age, gender, staff_big_type, staff_detail_type, pause_flow, residence_detail, insured_place, key_group, hardship_type);
+CREATE INDEX IF NOT EXISTS idx_enterprises_scope_cover ON enterprises(year, unit_id, id, staff_insured, last_month_staff_insured, risk);
+
+-- 子串检索索引（FTS5 trigram 外部内容表，由触发器同步，见 search_index.py）
+CREATE VIRTUAL TABLE IF NOT EXISTS residents_fts USING fts5(
+  name, phone, household_addr, residence_addr,
+  content='residents', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS trg_residents_fts_i AFTER INSERT ON residents
+BEGIN
+  INSERT INTO residents_fts(rowid, name, phone, household_addr, residence_addr) VALUES (NEW.rowid, NEW.name, NEW.phone, NEW.household_addr, NEW.residence_addr);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_fts_u AFTER UPDATE ON residents
+BEGIN
+  INSERT INTO residents_fts(residents_fts, rowid, name, phone, household_addr, residence_addr) VALUES ('delete', OLD.rowid, OLD.name, OLD.phone, OLD.household_addr, OLD.residence_addr);
+  INSERT INTO residents_fts(rowid, name, phone, household_addr, residence_addr) VALUES (NEW.rowid, NEW.name, NEW.phone, NEW.household_addr, NEW.residence_addr);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_fts_d AFTER DELETE ON residents
+BEGIN
+  INSERT INTO residents_fts(residents_fts, rowid, name, phone, household_addr, residence_addr) VALUES ('delete', OLD.rowid, OLD.name, OLD.phone, OLD.household_addr, OLD.residence_addr);
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS enterprises_fts USING fts5(
+  name, contact_person, address,
+  content='enterprises', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_fts_i AFTER INSERT ON enterprises
+BEGIN
+  INSERT INTO enterprises_fts(rowid, name, contact_person, address) VALUES (NEW.rowid, NEW.name, NEW.contact_person, NEW.address);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_fts_u AFTER UPDATE ON enterprises
+BEGIN
+  INSERT INTO enterprises_fts(enterprises_fts, rowid, name, contact_person, address) VALUES ('delete', OLD.rowid, OLD.name, OLD.contact_person, OLD.address);
+  INSERT INTO enterprises_fts(rowid, name, contact_person, address) VALUES (NEW.rowid, NEW.name, NEW.contact_person, NEW.address);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_fts_d AFTER DELETE ON enterprises
+BEGIN
+  INSERT INTO enterprises_fts(enterprises_fts, rowid, name, contact_person, address) VALUES ('delete', OLD.rowid, OLD.name, OLD.contact_person, OLD.address);
+END;
 
 -- 字典表：存储所有可配置的枚举值，取代硬编码字段
 CREATE TABLE IF NOT EXISTS dictionaries (
@@ -84,3 +121,191 @@ CREATE UNIQUE INDEX IF NOT EXISTS idx_dict_cat_val
 CREATE INDEX IF NOT EXISTS idx_dict_category
     ON dictionaries(category, enabled, sort_order);
 
+-- 标签列字典编码标记：列出的 (表, 列) 存 dictionaries.id，空表 = 文字存储（见 tag_codes.py）
+CREATE TABLE IF NOT EXISTS tag_encodings (
+  table_name TEXT NOT NULL,
+  column_name TEXT NOT NULL,
+  category TEXT NOT NULL,
+  PRIMARY KEY (table_name, column_name)
+);
+
+-- 指标汇总表：每个 (unit_id, year) 一行可加计数器，由 metric_rollups.py 维护
+CREATE TABLE IF NOT EXISTS unit_metric_rollups (
+  unit_id TEXT NOT NULL,
+  year INTEGER NOT NULL,
+  total_pop INTEGER NOT NULL DEFAULT 0,
+  done_total INTEGER NOT NULL DEFAULT 0,
+  done_staff INTEGER NOT NULL DEFAULT 0,
+  done_resident INTEGER NOT NULL DEFAULT 0,
+  mobilizable_stock INTEGER NOT NULL DEFAULT 0,
+  mobilizable_increment INTEGER NOT NULL DEFAULT 0,
+  staff_people INTEGER NOT NULL DEFAULT 0,
+  age0_count INTEGER NOT NULL DEFAULT 0,
+  age0_insured INTEGER NOT NULL DEFAULT 0,
+  age0_male INTEGER NOT NULL DEFAULT 0,
+  age1_count INTEGER NOT NULL DEFAULT 0,
+  age1_insured INTEGER NOT NULL DEFAULT 0,
+  age1_male INTEGER NOT NULL DEFAULT 0,
+  age2_count INTEGER NOT NULL DEFAULT 0,
+  age2_insured INTEGER NOT NULL DEFAULT 0,
+  age2_male INTEGER NOT NULL DEFAULT 0,
+  age3_count INTEGER NOT NULL DEFAULT 0,
+  age3_insured INTEGER NOT NULL DEFAULT 0,
+  age3_male INTEGER NOT NULL DEFAULT 0,
+  age4_count INTEGER NOT NULL DEFAULT 0,
+  age4_insured INTEGER NOT NULL DEFAULT 0,
+  age4_male INTEGER NOT NULL DEFAULT 0,
+  pause0 INTEGER NOT NULL DEFAULT 0,
+  pause1 INTEGER NOT NULL DEFAULT 0,
+  pause2 INTEGER NOT NULL DEFAULT 0,
+  units_total INTEGER NOT NULL DEFAULT 0,
+  units_insured INTEGER NOT NULL DEFAULT 0,
+  units_last INTEGER NOT NULL DEFAULT 0,
+  risk_high INTEGER NOT NULL DEFAULT 0,
+  risk_mid INTEGER NOT NULL DEFAULT 0,
+  staff_big TEXT NOT NULL,
+  staff_detail TEXT NOT NULL,
+  updated_at INTEGER NOT NULL,
+  PRIMARY KEY (unit_id, year)
+);
+CREATE TABLE IF NOT EXISTS unit_metric_rollup_dirty (
+  unit_id TEXT NOT NULL,
+  year INTEGER NOT NULL,
+  PRIMARY KEY (unit_id, year)
+);
+CREATE TABLE IF NOT EXISTS unit_tag_counts (
+  table_name TEXT NOT NULL,
+  unit_id TEXT NOT NULL,
+  year INTEGER NOT NULL,
+  tag TEXT NOT NULL,
+  value TEXT NOT NULL,
+  cnt INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (table_name, year, unit_id, tag, value)
+);
+CREATE TRIGGER IF NOT EXISTS trg_residents_rollup_i AFTER INSERT ON residents
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_rollup_u AFTER UPDATE ON residents
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_rollup_d AFTER DELETE ON residents
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_rollup_i AFTER INSERT ON enterprises
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_rollup_u AFTER UPDATE ON enterprises
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_rollup_d AFTER DELETE ON enterprises
+BEGIN
+  INSERT OR IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+END;
+
+-- 数据版本表：各表变更时由触发器递增版本号，供进程内缓存判断失效
+CREATE TABLE IF NOT EXISTS data_versions (
+    name     TEXT    PRIMARY KEY,
+    version  INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('org_units', 0);
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_i AFTER INSERT ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_u AFTER UPDATE ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_org_units_version_d AFTER DELETE ON org_units
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('residents', 0);
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_i AFTER INSERT ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_u AFTER UPDATE ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_version_d AFTER DELETE ON residents
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('enterprises', 0);
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_i AFTER INSERT ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_u AFTER UPDATE ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_version_d AFTER DELETE ON enterprises
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+END;
+INSERT OR IGNORE INTO data_versions(name, version) VALUES ('users', 0);
+CREATE TRIGGER IF NOT EXISTS trg_users_version_i AFTER INSERT ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_version_u AFTER UPDATE ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_users_version_d AFTER DELETE ON users
+BEGIN
+  UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+END;
+
+-- 单元变更版本表：记录各 (表, 单元, 年度) 最近一次变更时的数据版本，供列式数据增量刷新
+CREATE TABLE IF NOT EXISTS unit_data_versions (
+  table_name TEXT NOT NULL,
+  unit_id TEXT NOT NULL,
+  year INTEGER NOT NULL,
+  version INTEGER NOT NULL,
+  PRIMARY KEY (table_name, year, unit_id)
+);
+CREATE TRIGGER IF NOT EXISTS trg_residents_unit_version_i AFTER INSERT ON residents
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_unit_version_u AFTER UPDATE ON residents
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = 'residents';
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_residents_unit_version_d AFTER DELETE ON residents
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = 'residents';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_unit_version_i AFTER INSERT ON enterprises
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_unit_version_u AFTER UPDATE ON enterprises
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = 'enterprises';
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', NEW.unit_id, NEW.year, version FROM data_versions WHERE name = 'enterprises';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_enterprises_unit_version_d AFTER DELETE ON enterprises
+BEGIN
+  INSERT OR REPLACE INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', OLD.unit_id, OLD.year, version FROM data_versions WHERE name = 'enterprises';
+END;
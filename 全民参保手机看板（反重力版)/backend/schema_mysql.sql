@@ -68,7 +68,11 @@ CREATE TABLE IF NOT EXISTS residents (
     FOREIGN KEY (unit_id) REFERENCES org_units(id),
     INDEX idx_residents_unit_year (unit_id, year),
     INDEX idx_residents_name (name),
-    INDEX idx_residents_type (this_year_type, this_year_paid)
+    -- 热点查询的覆盖索引（由 index_advisor.py 推导，受 16 列 / 3072 字节上限截断）
+    INDEX idx_residents_scope_cover (year, unit_id, id, this_year_paid, this_year_type, stock_change_type, loss_reason, last_year_local_paid, household, residence, age, gender, staff_big_type, staff_detail_type, pause_flow, residence_detail),
+    FULLTEXT INDEX ft_residents_name (name) WITH PARSER ngram,
+    FULLTEXT INDEX ft_residents_phone (phone) WITH PARSER ngram,
+    FULLTEXT INDEX ft_residents_address (household_addr, residence_addr) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ─── 企业参保数据 ───────────────────────────────────────────────────────────
@@ -89,7 +93,10 @@ CREATE TABLE IF NOT EXISTS enterprises (
     PRIMARY KEY (id),
     FOREIGN KEY (unit_id) REFERENCES org_units(id),
     INDEX idx_enterprises_unit_year (unit_id, year),
-    INDEX idx_enterprises_risk (risk)
+    INDEX idx_enterprises_scope_cover (year, unit_id, id, staff_insured, last_month_staff_insured, risk),
+    FULLTEXT INDEX ft_enterprises_name (name) WITH PARSER ngram,
+    FULLTEXT INDEX ft_enterprises_contact_person (contact_person) WITH PARSER ngram,
+    FULLTEXT INDEX ft_enterprises_address (address) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ─── 字典表 ─────────────────────────────────────────────────────────────────
@@ -104,4 +111,174 @@ CREATE TABLE IF NOT EXISTS dictionaries (
     INDEX idx_dict_category (category, enabled, sort_order)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ─── 标签列字典编码标记（tag_codes.py）───────────────────────────────────────
+CREATE TABLE IF NOT EXISTS tag_encodings (
+    table_name  VARCHAR(32) NOT NULL,
+    column_name VARCHAR(64) NOT NULL,
+    category    VARCHAR(64) NOT NULL,
+    PRIMARY KEY (table_name, column_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ─── 指标汇总表（metric_rollups.py 维护）─────────────────────────────────────
+CREATE TABLE IF NOT EXISTS unit_metric_rollups (
+    unit_id                VARCHAR(64) NOT NULL,
+    year                   INT NOT NULL,
+    total_pop              INT NOT NULL DEFAULT 0,
+    done_total             INT NOT NULL DEFAULT 0,
+    done_staff             INT NOT NULL DEFAULT 0,
+    done_resident          INT NOT NULL DEFAULT 0,
+    mobilizable_stock      INT NOT NULL DEFAULT 0,
+    mobilizable_increment  INT NOT NULL DEFAULT 0,
+    staff_people           INT NOT NULL DEFAULT 0,
+    age0_count             INT NOT NULL DEFAULT 0,
+    age0_insured           INT NOT NULL DEFAULT 0,
+    age0_male              INT NOT NULL DEFAULT 0,
+    age1_count             INT NOT NULL DEFAULT 0,
+    age1_insured           INT NOT NULL DEFAULT 0,
+    age1_male              INT NOT NULL DEFAULT 0,
+    age2_count             INT NOT NULL DEFAULT 0,
+    age2_insured           INT NOT NULL DEFAULT 0,
+    age2_male              INT NOT NULL DEFAULT 0,
+    age3_count             INT NOT NULL DEFAULT 0,
+    age3_insured           INT NOT NULL DEFAULT 0,
+    age3_male              INT NOT NULL DEFAULT 0,
+    age4_count             INT NOT NULL DEFAULT 0,
+    age4_insured           INT NOT NULL DEFAULT 0,
+    age4_male              INT NOT NULL DEFAULT 0,
+    pause0                 INT NOT NULL DEFAULT 0,
+    pause1                 INT NOT NULL DEFAULT 0,
+    pause2                 INT NOT NULL DEFAULT 0,
+    units_total            INT NOT NULL DEFAULT 0,
+    units_insured          INT NOT NULL DEFAULT 0,
+    units_last             INT NOT NULL DEFAULT 0,
+    risk_high              INT NOT NULL DEFAULT 0,
+    risk_mid               INT NOT NULL DEFAULT 0,
+    staff_big              TEXT NOT NULL,
+    staff_detail           TEXT NOT NULL,
+    updated_at             BIGINT NOT NULL,
+    PRIMARY KEY (unit_id, year)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+CREATE TABLE IF NOT EXISTS unit_metric_rollup_dirty (
+    unit_id VARCHAR(64) NOT NULL,
+    year    INT NOT NULL,
+    PRIMARY KEY (unit_id, year)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+CREATE TABLE IF NOT EXISTS unit_tag_counts (
+    table_name VARCHAR(32)  NOT NULL,
+    unit_id    VARCHAR(64)  NOT NULL,
+    year       INT          NOT NULL,
+    tag        VARCHAR(64)  NOT NULL,
+    value      VARCHAR(128) NOT NULL,
+    cnt        INT          NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, year, unit_id, tag, value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+DROP TRIGGER IF EXISTS trg_residents_rollup_i;
+CREATE TRIGGER trg_residents_rollup_i AFTER INSERT ON residents FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+DROP TRIGGER IF EXISTS trg_residents_rollup_u;
+CREATE TRIGGER trg_residents_rollup_u AFTER UPDATE ON residents FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year), (NEW.unit_id, NEW.year);
+DROP TRIGGER IF EXISTS trg_residents_rollup_d;
+CREATE TRIGGER trg_residents_rollup_d AFTER DELETE ON residents FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+DROP TRIGGER IF EXISTS trg_enterprises_rollup_i;
+CREATE TRIGGER trg_enterprises_rollup_i AFTER INSERT ON enterprises FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (NEW.unit_id, NEW.year);
+DROP TRIGGER IF EXISTS trg_enterprises_rollup_u;
+CREATE TRIGGER trg_enterprises_rollup_u AFTER UPDATE ON enterprises FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year), (NEW.unit_id, NEW.year);
+DROP TRIGGER IF EXISTS trg_enterprises_rollup_d;
+CREATE TRIGGER trg_enterprises_rollup_d AFTER DELETE ON enterprises FOR EACH ROW
+    INSERT IGNORE INTO unit_metric_rollup_dirty(unit_id, year) VALUES (OLD.unit_id, OLD.year);
+
+-- ─── 数据版本表（进程内缓存失效判断）─────────────────────────────────────────
+CREATE TABLE IF NOT EXISTS data_versions (
+    name     VARCHAR(64) NOT NULL,
+    version  BIGINT      NOT NULL DEFAULT 0,
+    PRIMARY KEY (name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+INSERT IGNORE INTO data_versions(name, version) VALUES ('org_units', 0);
+DROP TRIGGER IF EXISTS trg_org_units_version_i;
+CREATE TRIGGER trg_org_units_version_i AFTER INSERT ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+DROP TRIGGER IF EXISTS trg_org_units_version_u;
+CREATE TRIGGER trg_org_units_version_u AFTER UPDATE ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+DROP TRIGGER IF EXISTS trg_org_units_version_d;
+CREATE TRIGGER trg_org_units_version_d AFTER DELETE ON org_units FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'org_units';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('residents', 0);
+DROP TRIGGER IF EXISTS trg_residents_version_i;
+CREATE TRIGGER trg_residents_version_i AFTER INSERT ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+DROP TRIGGER IF EXISTS trg_residents_version_u;
+CREATE TRIGGER trg_residents_version_u AFTER UPDATE ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+DROP TRIGGER IF EXISTS trg_residents_version_d;
+CREATE TRIGGER trg_residents_version_d AFTER DELETE ON residents FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'residents';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('enterprises', 0);
+DROP TRIGGER IF EXISTS trg_enterprises_version_i;
+CREATE TRIGGER trg_enterprises_version_i AFTER INSERT ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+DROP TRIGGER IF EXISTS trg_enterprises_version_u;
+CREATE TRIGGER trg_enterprises_version_u AFTER UPDATE ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+DROP TRIGGER IF EXISTS trg_enterprises_version_d;
+CREATE TRIGGER trg_enterprises_version_d AFTER DELETE ON enterprises FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'enterprises';
+INSERT IGNORE INTO data_versions(name, version) VALUES ('users', 0);
+DROP TRIGGER IF EXISTS trg_users_version_i;
+CREATE TRIGGER trg_users_version_i AFTER INSERT ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+DROP TRIGGER IF EXISTS trg_users_version_u;
+CREATE TRIGGER trg_users_version_u AFTER UPDATE ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+DROP TRIGGER IF EXISTS trg_users_version_d;
+CREATE TRIGGER trg_users_version_d AFTER DELETE ON users FOR EACH ROW
+    UPDATE data_versions SET version = version + 1 WHERE name = 'users';
+
+-- ─── 单元变更版本表（列式数据增量刷新）─────────────────────────────────────
+CREATE TABLE IF NOT EXISTS unit_data_versions (
+    table_name VARCHAR(32) NOT NULL,
+    unit_id    VARCHAR(64) NOT NULL,
+    year       INT         NOT NULL,
+    version    BIGINT      NOT NULL,
+    PRIMARY KEY (table_name, year, unit_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+DROP TRIGGER IF EXISTS trg_residents_unit_version_i;
+CREATE TRIGGER trg_residents_unit_version_i AFTER INSERT ON residents FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', NEW.unit_id, NEW.year, d.version FROM data_versions d WHERE d.name = 'residents'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_residents_unit_version_u;
+CREATE TRIGGER trg_residents_unit_version_u AFTER UPDATE ON residents FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', u.unit_id, u.year, d.version
+    FROM data_versions d, (SELECT OLD.unit_id AS unit_id, OLD.year AS year UNION SELECT NEW.unit_id, NEW.year) u
+    WHERE d.name = 'residents'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_residents_unit_version_d;
+CREATE TRIGGER trg_residents_unit_version_d AFTER DELETE ON residents FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'residents', OLD.unit_id, OLD.year, d.version FROM data_versions d WHERE d.name = 'residents'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_enterprises_unit_version_i;
+CREATE TRIGGER trg_enterprises_unit_version_i AFTER INSERT ON enterprises FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', NEW.unit_id, NEW.year, d.version FROM data_versions d WHERE d.name = 'enterprises'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_enterprises_unit_version_u;
+CREATE TRIGGER trg_enterprises_unit_version_u AFTER UPDATE ON enterprises FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', u.unit_id, u.year, d.version
+    FROM data_versions d, (SELECT OLD.unit_id AS unit_id, OLD.year AS year UNION SELECT NEW.unit_id, NEW.year) u
+    WHERE d.name = 'enterprises'
+    ON DUPLICATE KEY UPDATE version = d.version;
+DROP TRIGGER IF EXISTS trg_enterprises_unit_version_d;
+CREATE TRIGGER trg_enterprises_unit_version_d AFTER DELETE ON enterprises FOR EACH ROW
+    INSERT INTO unit_data_versions(table_name, unit_id, year, version)
+    SELECT 'enterprises', OLD.unit_id, OLD.year, d.version FROM data_versions d WHERE d.name = 'enterprises'
+    ON DUPLICATE KEY UPDATE version = d.version;
+
 SET FOREIGN_KEY_CHECKS = 1;
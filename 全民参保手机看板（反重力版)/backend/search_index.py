@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+search_index.py — 居民 / 企业的姓名、电话、地址子串检索索引
+
+列表接口的模糊查询原先是 name LIKE '%x%' 之类的前导通配符，任何 B-Tree 索引都用不上，
+每次检索都是全表扫描。这里为检索列建立 n-gram 索引：
+  SQLite: FTS5 trigram 外部内容表 residents_fts / enterprises_fts，由触发器与原表同步；
+  MySQL:  ngram 解析器的 FULLTEXT 索引（ngram_token_size 默认 2）。
+
+search_clause() 返回“索引预筛 + 原 LIKE 复核”的条件片段：索引负责把候选行缩小到
+包含全部 n-gram 的少数行，LIKE 复核保证结果与原先逐字一致（含中文地址）。
+关键字短于 n-gram 长度（SQLite 3 个字符、MySQL 2 个字符）、含 LIKE 通配符，
+或索引尚未建立（未执行 migrate_add_search_index.py）时只用 LIKE。
+
+相关环境变量：
+  SEARCH_INDEX=0   关闭索引预筛，只用 LIKE
+
+使用方法（索引与数据不一致时重建）：
+    cd backend
+    python3 search_index.py rebuild
+"""
+import argparse
+import os
+
+from db import DB_ENGINE, get_conn
+
+ENABLED = os.getenv("SEARCH_INDEX", "1").strip() != "0"
+
+# 检索参数 → 对应列（多列时任一列命中即可）
+SEARCH_FIELDS = {
+    "residents": {
+        "name": ("name",),
+        "phone": ("phone",),
+        "address": ("household_addr", "residence_addr"),
+    },
+    "enterprises": {
+        "name": ("name",),
+        "contact_person": ("contact_person",),
+        "address": ("address",),
+    },
+}
+FTS_COLUMNS = {
+    "residents": ("name", "phone", "household_addr", "residence_addr"),
+    "enterprises": ("name", "contact_person", "address"),
+}
+# MySQL 的 MATCH(...) 列表必须与某个 FULLTEXT 索引的列完全一致，按检索参数各建一个
+MYSQL_FULLTEXT = {
+    (table, key): f"ft_{table}_{key}" for table, fields in SEARCH_FIELDS.items() for key in fields
+}
+MIN_CHARS = 2 if DB_ENGINE == "mysql" else 3
+
+_available = {}
+
+
+def _index_available(conn, table):
+    """索引是否已建立（结果按进程缓存；迁移后需重启服务才会启用）。"""
+    if table not in _available:
+        try:
+            if DB_ENGINE == "mysql":
+                row = conn.execute(
+                    "SELECT COUNT(DISTINCT index_name) c FROM information_schema.statistics "
+                    "WHERE table_schema=DATABASE() AND table_name=? AND index_type='FULLTEXT'",
+                    [table],
+                ).fetchone()
+                _available[table] = int(row["c"]) >= len(SEARCH_FIELDS[table])
+            else:
+                row = conn.execute(
+                    "SELECT COUNT(1) c FROM sqlite_master WHERE type='table' AND name=?", [f"{table}_fts"]
+                ).fetchone()
+                _available[table] = int(row["c"]) == 1
+        except Exception:
+            return False
+    return _available[table]
+
+
+def _like_clause(columns):
+    if len(columns) == 1:
+        return f"{columns[0]} LIKE ?"
+    return "(" + " OR ".join(f"{c} LIKE ?" for c in columns) + ")"
+
+
+def search_clause(conn, table, key, text):
+    """返回 (" AND ..." 条件片段, 参数列表)，语义与 LIKE '%text%' 相同。"""
+    columns = SEARCH_FIELDS[table][key]
+    like_sql = _like_clause(columns)
+    like_params = [f"%{text}%"] * len(columns)
+    usable = (
+        ENABLED
+        and len(text) >= MIN_CHARS
+        and not any(ch in text for ch in '%_"')
+        and _index_available(conn, table)
+    )
+    if not usable:
+        return f" AND {like_sql}", like_params
+    if DB_ENGINE == "mysql":
+        return (
+            f" AND MATCH({', '.join(columns)}) AGAINST(? IN BOOLEAN MODE) AND {like_sql}",
+            [f'"{text}"'] + like_params,
+        )
+    return (
+        f" AND rowid IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?) AND {like_sql}",
+        ["{" + " ".join(columns) + '} : "' + text + '"'] + like_params,
+    )
+
+
+# ── 建表 DDL（供迁移脚本使用，与 schema.sql / schema_mysql.sql 保持一致）────────
+def _ddl_sqlite():
+    out = []
+    for table, cols in FTS_COLUMNS.items():
+        fts = f"{table}_fts"
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"NEW.{c}" for c in cols)
+        old_vals = ", ".join(f"OLD.{c}" for c in cols)
+        out.append(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(\n"
+            f"  {col_list},\n"
+            f"  content='{table}', content_rowid='rowid', tokenize='trigram'\n"
+            ");\n"
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_i AFTER INSERT ON {table}\n"
+            "BEGIN\n"
+            f"  INSERT INTO {fts}(rowid, {col_list}) VALUES (NEW.rowid, {new_vals});\n"
+            "END;\n"
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_u AFTER UPDATE ON {table}\n"
+            "BEGIN\n"
+            f"  INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', OLD.rowid, {old_vals});\n"
+            f"  INSERT INTO {fts}(rowid, {col_list}) VALUES (NEW.rowid, {new_vals});\n"
+            "END;\n"
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_d AFTER DELETE ON {table}\n"
+            "BEGIN\n"
+            f"  INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', OLD.rowid, {old_vals});\n"
+            "END;\n"
+        )
+    return "".join(out)
+
+
+def mysql_fulltext_statements():
+    """MySQL 补建 FULLTEXT 索引的语句 [(索引名, 表名, ALTER 语句)]（新库已在 schema_mysql.sql 的建表语句中包含）。"""
+    out = []
+    for (table, key), name in MYSQL_FULLTEXT.items():
+        cols = ", ".join(SEARCH_FIELDS[table][key])
+        out.append((name, table, f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({cols}) WITH PARSER ngram"))
+    return out
+
+
+DDL = "" if DB_ENGINE == "mysql" else _ddl_sqlite()
+
+
+def rebuild(conn):
+    """按原表内容重建索引（SQLite FTS5 'rebuild'；MySQL 的 FULLTEXT 随表自动维护，无需重建）。"""
+    if DB_ENGINE == "mysql":
+        return
+    for table in FTS_COLUMNS:
+        conn.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="维护居民 / 企业检索索引")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    conn = get_conn()
+    try:
+        rebuild(conn)
+        print("search index rebuild ok")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
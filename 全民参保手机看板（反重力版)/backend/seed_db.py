@@ -1,12 +1,22 @@
+import argparse
+import multiprocessing
 import os
 import random
+import time
+from collections import deque
 from pathlib import Path
 
+from bootstrap_snapshots import clear_snapshots
 from db import get_conn, DB_ENGINE
+from metric_rollups import rebuild_rollups
+from search_index import rebuild as rebuild_search_index
+from tag_codes import decode_tables, dictionary_upsert_sql, encode_tables
 
 BASE = Path(__file__).resolve().parent
 # 根据引擎自动选择对应的 Schema 文件
 SCHEMA = BASE / ("schema_mysql.sql" if DB_ENGINE == "mysql" else "schema.sql")
+# TAG_STORAGE=codes：写完测试数据后把标签列转换为字典编码存储（见 tag_codes.py）
+TAG_STORAGE = os.getenv("TAG_STORAGE", "text").strip().lower()
 
 
 def ensure_dirs():
@@ -19,19 +29,22 @@ def exec_schema(conn):
     conn.executescript(SCHEMA.read_text(encoding="utf-8"))
 
 
-def seed_units(conn):
-    units = [
-        ("D001", "九龙坡区", "district", None),
-        ("S001", "杨家坪街道", "street", "D001"),
-        ("S002", "石桥铺街道", "street", "D001"),
-        ("S003", "西彭镇", "street", "D001"),
-        ("V001", "渝州路社区", "village", "S002"),
-        ("V002", "天兴路社区", "village", "S002"),
-        ("V003", "杨家坪正街社区", "village", "S001"),
-        ("V004", "西彭社区", "village", "S003"),
-        ("G001", "渝州路社区第3网格", "grid", "V001"),
-    ]
-    conn.executemany("REPLACE INTO org_units(id,name,level,parent_id) VALUES(?,?,?,?)", units)
+DEFAULT_UNITS = [
+    ("D001", "九龙坡区", "district", None),
+    ("S001", "杨家坪街道", "street", "D001"),
+    ("S002", "石桥铺街道", "street", "D001"),
+    ("S003", "西彭镇", "street", "D001"),
+    ("V001", "渝州路社区", "village", "S002"),
+    ("V002", "天兴路社区", "village", "S002"),
+    ("V003", "杨家坪正街社区", "village", "S001"),
+    ("V004", "西彭社区", "village", "S003"),
+    ("G001", "渝州路社区第3网格", "grid", "V001"),
+]
+
+
+def seed_units(conn, units=None):
+    """units 为 (id, name, level, parent_id) 列表，默认 DEFAULT_UNITS。"""
+    conn.executemany("REPLACE INTO org_units(id,name,level,parent_id) VALUES(?,?,?,?)", units or DEFAULT_UNITS)
 
 
 def seed_users(conn):
@@ -47,144 +60,149 @@ def seed_users(conn):
     )
 
 
-def rand_phone(i):
-    return f"13{5 + (i % 5)}{random.randint(1000,9999)}{random.randint(1000,9999)}"
+def rand_phone(i, rnd=random):
+    return f"13{5 + (i % 5)}{rnd.randint(1000,9999)}{rnd.randint(1000,9999)}"
 
 
 def mask_addr(base, i):
     return f"重庆市九龙坡区{base}{i}号"
 
 
-def seed_residents(conn, year=2026):
-    random.seed(20260222)
-    villages = ["V001", "V002", "V003", "V004"]
-    hardship_types = ["低保对象", "残疾对象", "特困对象", ""]
-    staff_details = ["在职职工", "单位退休人员", "灵活就业（一档）", "灵活就业（二档）", "个人退休（一档）", "个人退休（二档）"]
-
-    rows = []
-    n = 3200
-    for i in range(1, n + 1):
-        unit_id = villages[i % len(villages)]
-        age = random.randint(0, 80)
-        gender = "男" if i % 2 == 0 else "女"
-        household = "本区户籍" if i % 3 != 0 else "非本区户籍"
-        residence_detail = ["本辖区", "区内其他辖区", "市内外区", "市外"][i % 4]
-        residence = "本区居住" if residence_detail in ["本辖区", "区内其他辖区"] else "外区居住"
-
-        this_year_paid = 1 if random.random() < 0.78 else 0
-        this_year_type = "职工保" if (this_year_paid and age >= 18 and random.random() < 0.43) else ("居民保" if this_year_paid else "未参保")
-        if age < 18 and this_year_type == "职工保":
-            this_year_type = "居民保"
-
+RESIDENT_COLUMNS = (
+    "id,name,phone,gender,age,unit_id,household,residence,residence_detail,insured_place,"
+    "this_year_type,this_year_paid,last_year_paid,last_year_local_paid,stock_change_type,loss_reason,pause_flow,"
+    "key_group,is_hardship,hardship_type,staff_big_type,staff_detail_type,household_addr,residence_addr,year"
+)
+ENTERPRISE_COLUMNS = (
+    "id,name,legal_person,contact_person,phone,address,unit_id,risk,staff_insured,last_month_staff_insured,gap_rate,duration,year"
+)
+HARDSHIP_TYPES = ("低保对象", "残疾对象", "特困对象", "")
+STAFF_DETAILS = ("在职职工", "单位退休人员", "灵活就业（一档）", "灵活就业（二档）", "个人退休（一档）", "个人退休（二档）")
+RESIDENCE_DETAILS = ("本辖区", "区内其他辖区", "市内外区", "市外")
+INSURED_PLACES = ("本区县参保", "市内外区参保", "市外参保")
+LOSS_REASONS = ("死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）")
+
+
+def resident_row(rnd, i, unit_id, year):
+    """第 i 条居民（列顺序同 RESIDENT_COLUMNS）；rnd 为 random 模块或 random.Random 实例。"""
+    age = rnd.randint(0, 80)
+    gender = "男" if i % 2 == 0 else "女"
+    household = "本区户籍" if i % 3 != 0 else "非本区户籍"
+    residence_detail = RESIDENCE_DETAILS[i % 4]
+    residence = "本区居住" if residence_detail in ("本辖区", "区内其他辖区") else "外区居住"
+
+    this_year_paid = 1 if rnd.random() < 0.78 else 0
+    this_year_type = "职工保" if (this_year_paid and age >= 18 and rnd.random() < 0.43) else ("居民保" if this_year_paid else "未参保")
+    if age < 18 and this_year_type == "职工保":
+        this_year_type = "居民保"
+
+    insured_place = ""
+    if this_year_paid:
+        insured_place = INSURED_PLACES[i % 3]
+
+    last_year_paid = 1 if rnd.random() < 0.84 else 0
+    last_year_local_paid = 1 if (last_year_paid and rnd.random() < 0.75) else 0
+
+    if last_year_local_paid == 1 and this_year_paid == 1 and this_year_type == "居民保" and insured_place == "本区县参保":
+        stock_change_type = "存量续保"
+    elif last_year_local_paid == 1 and this_year_paid == 0:
+        stock_change_type = rnd.choice(["可动员", "停保", "死亡", "辖区外参保", "转职工保（含灵活就业参保）"])
+    elif last_year_local_paid == 1 and this_year_type == "职工保":
+        stock_change_type = "转职工保（含灵活就业参保）"
+    elif last_year_local_paid == 1 and this_year_paid == 1 and this_year_type == "居民保" and insured_place != "本区县参保":
+        stock_change_type = "辖区外参保"
+    else:
+        stock_change_type = ""
+
+    if stock_change_type in ("死亡", "停保", "可动员"):
+        this_year_paid = 0
+        this_year_type = "未参保"
         insured_place = ""
-        if this_year_paid:
-            insured_place = ["本区县参保", "市内外区参保", "市外参保"][i % 3]
-
-        last_year_paid = 1 if random.random() < 0.84 else 0
-        last_year_local_paid = 1 if (last_year_paid and random.random() < 0.75) else 0
-
-        if last_year_local_paid == 1 and this_year_paid == 1 and this_year_type == "居民保" and insured_place == "本区县参保":
-            stock_change_type = "存量续保"
-        elif last_year_local_paid == 1 and this_year_paid == 0:
-            stock_change_type = random.choice(["可动员", "停保", "死亡", "辖区外参保", "转职工保（含灵活就业参保）"])
-        elif last_year_local_paid == 1 and this_year_type == "职工保":
-            stock_change_type = "转职工保（含灵活就业参保）"
-        elif last_year_local_paid == 1 and this_year_paid == 1 and this_year_type == "居民保" and insured_place != "本区县参保":
-            stock_change_type = "辖区外参保"
-        else:
-            stock_change_type = ""
-
-        if stock_change_type in ["死亡", "停保", "可动员"]:
-            this_year_paid = 0
-            this_year_type = "未参保"
-            insured_place = ""
-        elif stock_change_type == "转职工保（含灵活就业参保）":
-            this_year_paid = 1
-            this_year_type = "职工保"
-            insured_place = insured_place or "本区县参保"
-
-        loss_reason = stock_change_type if stock_change_type in ["死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）"] else ""
-        pause_flow = random.choice(["转居民保", "申请停保", "跨区转出", ""]) if this_year_paid == 0 else ""
-
-        key_group = ""
-        if age <= 1:
-            key_group = "新生儿"
-        elif 6 <= age <= 18 and random.random() < 0.7:
-            key_group = "中小学生"
-        elif 16 <= age <= 30 and random.random() < 0.5:
-            key_group = "高校生"
-
-        is_hardship = 1 if random.random() < 0.14 else 0
-        if key_group == "" and is_hardship == 1:
-            key_group = "资助对象"
-        hardship_type = hardship_types[i % len(hardship_types)] if is_hardship else ""
-
+    elif stock_change_type == "转职工保（含灵活就业参保）":
+        this_year_paid = 1
+        this_year_type = "职工保"
+        insured_place = insured_place or "本区县参保"
+
+    loss_reason = stock_change_type if stock_change_type in LOSS_REASONS else ""
+    pause_flow = rnd.choice(["转居民保", "申请停保", "跨区转出", ""]) if this_year_paid == 0 else ""
+
+    key_group = ""
+    if age <= 1:
+        key_group = "新生儿"
+    elif 6 <= age <= 18 and rnd.random() < 0.7:
+        key_group = "中小学生"
+    elif 16 <= age <= 30 and rnd.random() < 0.5:
+        key_group = "高校生"
+
+    is_hardship = 1 if rnd.random() < 0.14 else 0
+    if key_group == "" and is_hardship == 1:
+        key_group = "资助对象"
+    hardship_type = HARDSHIP_TYPES[i % len(HARDSHIP_TYPES)] if is_hardship else ""
+
+    staff_big_type = ""
+    staff_detail_type = ""
+    if this_year_type == "职工保":
+        staff_big_type = "单位参保" if rnd.random() < 0.46 else "个人参保（灵活就业）"
+        staff_detail_type = rnd.choice(STAFF_DETAILS)
+
+    if age < 18 and this_year_type == "职工保":
+        this_year_type = "居民保" if this_year_paid == 1 else "未参保"
         staff_big_type = ""
         staff_detail_type = ""
-        if this_year_type == "职工保":
-            staff_big_type = "单位参保" if random.random() < 0.46 else "个人参保（灵活就业）"
-            staff_detail_type = random.choice(staff_details)
-
-        if age < 18 and this_year_type == "职工保":
-            this_year_type = "居民保" if this_year_paid == 1 else "未参保"
-            staff_big_type = ""
-            staff_detail_type = ""
-            if stock_change_type == "转职工保（含灵活就业参保）":
-                if last_year_local_paid == 1:
-                    stock_change_type = "存量续保" if (this_year_paid == 1 and insured_place == "本区县参保") else ("辖区外参保" if this_year_paid == 1 else "可动员")
-                else:
-                    stock_change_type = ""
-                loss_reason = stock_change_type if stock_change_type in ["死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）"] else ""
-
-        rows.append(
-            (
-                f"R{i:05d}", f"居民{i}", rand_phone(i), gender, age, unit_id, household, residence, residence_detail,
-                insured_place, this_year_type, this_year_paid, last_year_paid, last_year_local_paid, stock_change_type,
-                loss_reason, pause_flow, key_group, is_hardship, hardship_type, staff_big_type, staff_detail_type,
-                mask_addr("户籍地", i), mask_addr("居住地", i), year,
-            )
-        )
+        if stock_change_type == "转职工保（含灵活就业参保）":
+            if last_year_local_paid == 1:
+                stock_change_type = "存量续保" if (this_year_paid == 1 and insured_place == "本区县参保") else ("辖区外参保" if this_year_paid == 1 else "可动员")
+            else:
+                stock_change_type = ""
+            loss_reason = stock_change_type if stock_change_type in LOSS_REASONS else ""
+
+    return (
+        f"R{i:05d}", f"居民{i}", rand_phone(i, rnd), gender, age, unit_id, household, residence, residence_detail,
+        insured_place, this_year_type, this_year_paid, last_year_paid, last_year_local_paid, stock_change_type,
+        loss_reason, pause_flow, key_group, is_hardship, hardship_type, staff_big_type, staff_detail_type,
+        mask_addr("户籍地", i), mask_addr("居住地", i), year,
+    )
 
+
+def enterprise_row(rnd, i, unit_id, year):
+    """第 i 家企业（列顺序同 ENTERPRISE_COLUMNS）。"""
+    staff_insured = 1 if rnd.random() < 0.74 else 0
+    last_month = 1 if rnd.random() < 0.71 else 0
+    risk = "高" if rnd.random() < 0.12 else ("中" if rnd.random() < 0.24 else "低")
+    return (
+        f"E{i:04d}", f"企业{i}", f"法人{i}", f"联系人{i}", rand_phone(8000 + i, rnd),
+        f"重庆市九龙坡区企业路{i}号", unit_id, risk, staff_insured, last_month,
+        round(rnd.uniform(5, 35), 1), rnd.randint(0, 6), year,
+    )
+
+
+def seed_residents(conn, year=2026, n=3200, villages=None):
+    """n 条居民，按序号轮流分配到 villages（默认四个社区）。"""
+    random.seed(20260222)
+    villages = villages or ["V001", "V002", "V003", "V004"]
+    rows = [resident_row(random, i, villages[i % len(villages)], year) for i in range(1, n + 1)]
     conn.executemany(
-        """
-        REPLACE INTO residents(
-          id,name,phone,gender,age,unit_id,household,residence,residence_detail,insured_place,
-          this_year_type,this_year_paid,last_year_paid,last_year_local_paid,stock_change_type,loss_reason,pause_flow,
-          key_group,is_hardship,hardship_type,staff_big_type,staff_detail_type,household_addr,residence_addr,year
-        ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """,
+        f"REPLACE INTO residents({RESIDENT_COLUMNS}) VALUES({_marks(RESIDENT_COLUMNS)})",
         rows,
     )
 
 
-def seed_enterprises(conn, year=2026):
+def seed_enterprises(conn, year=2026, n=519, units=None):
     random.seed(20260223)
-    units = ["V001", "V002", "V003", "V004", "S001", "S002", "S003"]
-    rows = []
-    for i in range(1, 520):
-        unit = units[i % len(units)]
-        staff_insured = 1 if random.random() < 0.74 else 0
-        last_month = 1 if random.random() < 0.71 else 0
-        risk = "高" if random.random() < 0.12 else ("中" if random.random() < 0.24 else "低")
-        rows.append(
-            (
-                f"E{i:04d}", f"企业{i}", f"法人{i}", f"联系人{i}", rand_phone(8000 + i),
-                f"重庆市九龙坡区企业路{i}号", unit, risk, staff_insured, last_month,
-                round(random.uniform(5, 35), 1), random.randint(0, 6), year,
-            )
-        )
+    units = units or ["V001", "V002", "V003", "V004", "S001", "S002", "S003"]
+    rows = [enterprise_row(random, i, units[i % len(units)], year) for i in range(1, n + 1)]
     conn.executemany(
-        """
-        REPLACE INTO enterprises(
-          id,name,legal_person,contact_person,phone,address,unit_id,risk,staff_insured,last_month_staff_insured,gap_rate,duration,year
-        ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """,
+        f"REPLACE INTO enterprises({ENTERPRISE_COLUMNS}) VALUES({_marks(ENTERPRISE_COLUMNS)})",
         rows,
     )
 
 
+def _marks(columns):
+    return ",".join(["?"] * len(columns.split(",")))
+
+
 def seed_dictionaries(conn):
-    """将所有字典枚举值写入 dictionaries 表（INSERT OR REPLACE，幂等）"""
+    """将所有字典枚举值写入 dictionaries 表（按 (分类, 值) 更新，保留已有 id，幂等）"""
     DICT_DATA = [
         # (category, value, sort_order)
         ("对象类型",       "居民",                       0),
@@ -254,27 +272,273 @@ def seed_dictionaries(conn):
         ("居民性别",       "男",                         0),
         ("居民性别",       "女",                         1),
     ]
-    conn.executemany(
-        "REPLACE INTO dictionaries(category, value, sort_order) VALUES(?,?,?)",
-        DICT_DATA,
-    )
+    conn.executemany(dictionary_upsert_sql(), DICT_DATA)
+
+
+# ── 大规模生成（python3 seed_db.py generate …）─────────────────────────────────
+# 压测用：按参数生成 区 → 街道 → 社区 → 网格 组织树，居民落在网格、企业落在社区 / 街道，
+# 分块流式生成并批量写入。写入期间暂停 residents / enterprises 上的触发器（SQLite 连同二级索引），
+# 写完后恢复，再一次性补齐派生数据：数据版本号、单元版本、检索索引、指标汇总表。
+# 会清空 residents / enterprises 两张表，只应对新库或专用的压测库使用。
+CHUNK_ROWS = 20000
+MYSQL_BATCH_ROWS = 1000
+BULK_TABLES = ("residents", "enterprises")
+
+
+def generate_units(streets, villages, grids):
+    """
+    区 → streets 个街道 → 每街道 villages 个社区 → 每社区 grids 个网格。
+    编号与 seed_users 的单元（D001 / S002 / V001 / G001）对得上，返回
+    (units, 网格 id 列表, 社区 + 街道 id 列表)。
+    """
+    if streets < 2:
+        raise ValueError("至少需要 2 个街道（街道账号所在单元为 S002）")
+    units = [("D001", "九龙坡区", "district", None)]
+    grid_ids, carrier_ids = [], []
+    v_no = g_no = 0
+    for s in range(1, streets + 1):
+        sid = f"S{s:03d}"
+        units.append((sid, f"第{s}街道", "street", "D001"))
+        carrier_ids.append(sid)
+        for _ in range(villages):
+            v_no += 1
+            vid = f"V{v_no:03d}"
+            units.append((vid, f"第{v_no}社区", "village", sid))
+            carrier_ids.append(vid)
+            for k in range(1, grids + 1):
+                g_no += 1
+                gid = f"G{g_no:03d}"
+                units.append((gid, f"第{v_no}社区第{k}网格", "grid", vid))
+                grid_ids.append(gid)
+    return units, grid_ids, carrier_ids
+
+
+def _resident_chunk(task):
+    start, stop, units, year = task
+    rnd = random.Random(f"residents:{start}")
+    n = len(units)
+    return [resident_row(rnd, i, units[i % n], year) for i in range(start, stop)]
+
+
+def _enterprise_chunk(task):
+    start, stop, units, year = task
+    rnd = random.Random(f"enterprises:{start}")
+    n = len(units)
+    return [enterprise_row(rnd, i, units[i % n], year) for i in range(start, stop)]
+
+
+def _chunks(make, n, units, year, chunk, pool, window):
+    """
+    按序号分块生成。每块的随机数种子只取决于块起点，同样的参数（含块大小）生成的数据
+    与是否多进程、进程数无关。多进程时最多 window 块在途，内存不随总行数增长。
+    """
+    tasks = ((start, min(start + chunk, n + 1), units, year) for start in range(1, n + 1, chunk))
+    if pool is None:
+        yield from map(make, tasks)
+        return
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(make, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _insert(conn, table, columns, rows):
+    if DB_ENGINE == "mysql":
+        # 多行 INSERT，每条语句 MYSQL_BATCH_ROWS 行；每块单独提交，避免大事务撑满 undo
+        row_marks = f"({_marks(columns)})"
+        for k in range(0, len(rows), MYSQL_BATCH_ROWS):
+            batch = rows[k:k + MYSQL_BATCH_ROWS]
+            conn.execute(
+                f"INSERT INTO {table}({columns}) VALUES {','.join([row_marks] * len(batch))}",
+                [v for row in batch for v in row],
+            )
+        conn.commit()
+    else:
+        conn.executemany(f"INSERT INTO {table}({columns}) VALUES({_marks(columns)})", rows)
+
+
+def _load(conn, table, columns, chunks, total):
+    t0 = time.perf_counter()
+    done = 0
+    step = max(total // 10, 1)
+    for rows in chunks:
+        _insert(conn, table, columns, rows)
+        before, done = done, done + len(rows)
+        if done // step != before // step or done == total:
+            elapsed = time.perf_counter() - t0
+            print(f"  {table}: {done}/{total}（{elapsed:.1f}s，{done / max(elapsed, 1e-9):,.0f} 行/秒）", flush=True)
+
+
+def _suspend_maintenance(conn):
+    """
+    删除 residents / enterprises 上的触发器（SQLite 连同二级索引），省去逐行维护。
+    返回 _resume_maintenance 所需的信息：SQLite 为原建表语句，MySQL 为 None（重新执行 schema_mysql.sql）。
+    """
+    if DB_ENGINE == "mysql":
+        names = [r[0] for r in conn.execute(
+            "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS "
+            "WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE IN ('residents', 'enterprises')"
+        ).fetchall()]
+        for name in names:
+            conn.execute(f"DROP TRIGGER {name}")
+        return None
+    objects = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE type IN ('index', 'trigger') AND tbl_name IN ('residents', 'enterprises') AND sql IS NOT NULL"
+    ).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+    return [sql for _, _, sql in objects]
+
+
+def _resume_maintenance(conn, saved):
+    if saved is None:
+        exec_schema(conn)
+        return
+    for sql in saved:
+        conn.execute(sql)
+    conn.commit()
+
+
+def _prune_units(conn, units):
+    """删除不在新组织树中的旧单元（居民 / 企业表已清空）；自下而上删，满足 parent_id 外键。"""
+    keep = [u[0] for u in units]
+    marks = ",".join(["?"] * len(keep))
+    for level in ("grid", "village", "street", "district"):
+        conn.execute(f"DELETE FROM org_units WHERE level = ? AND id NOT IN ({marks})", [level] + keep)
+
+
+def _bump_versions(conn):
+    """补记触发器暂停期间的写入：表版本号 +1，各单元（含被清空的旧单元）的变更版本取新版本号。"""
+    for table in BULK_TABLES:
+        conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = ?", (table,))
+        version = conn.execute("SELECT version FROM data_versions WHERE name = ?", (table,)).fetchone()[0]
+        conn.execute("UPDATE unit_data_versions SET version = ? WHERE table_name = ?", (version, table))
+        conn.execute(
+            "REPLACE INTO unit_data_versions(table_name, unit_id, year, version) "
+            f"SELECT DISTINCT ?, unit_id, year, ? FROM {table}",
+            (table, version),
+        )
+    conn.commit()
 
 
-def main():
+def generate(residents=1_000_000, enterprises=20_000, streets=10, villages=12, grids=8,
+             year=2026, workers=0, chunk=CHUNK_ROWS):
+    """
+    生成大规模测试数据。workers > 0 时由 workers 个子进程并行生成行，本进程只负责写入
+    （SQLite 只有一个写入者；单核机器上请保持 0）。
+    """
     ensure_dirs()
+    units, grid_ids, carrier_ids = generate_units(streets, villages, grids)
+    t0 = time.perf_counter()
+    pool = multiprocessing.Pool(workers) if workers > 0 else None
     conn = get_conn()
     try:
         exec_schema(conn)
-        seed_units(conn)
+        journal_mode = None
+        if DB_ENGINE != "mysql":
+            # 压测库可重建：写入期间不落盘同步，回滚日志放内存
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            conn.execute("PRAGMA journal_mode = MEMORY")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA cache_size = -262144")
+            conn.execute("PRAGMA temp_store = MEMORY")
+        saved = _suspend_maintenance(conn)
+        try:
+            for table in BULK_TABLES:
+                conn.execute(f"TRUNCATE TABLE {table}" if DB_ENGINE == "mysql" else f"DELETE FROM {table}")
+            # 表已清空，这里只是撤销编码登记；数据按文字写入
+            decode_tables(conn)
+            _prune_units(conn, units)
+            seed_units(conn, units)
+            seed_users(conn)
+            seed_dictionaries(conn)
+            conn.commit()
+            window = 2 * workers
+            _load(conn, "residents", RESIDENT_COLUMNS,
+                  _chunks(_resident_chunk, residents, grid_ids, year, chunk, pool, window), residents)
+            _load(conn, "enterprises", ENTERPRISE_COLUMNS,
+                  _chunks(_enterprise_chunk, enterprises, carrier_ids, year, chunk, pool, window), enterprises)
+            conn.commit()
+            if TAG_STORAGE == "codes":
+                # 趁触发器暂停时整表转换，免去逐行触发
+                encode_tables(conn)
+        finally:
+            conn.rollback()
+            t1 = time.perf_counter()
+            _resume_maintenance(conn, saved)
+            print(f"  索引与触发器恢复：{time.perf_counter() - t1:.1f}s", flush=True)
+        _bump_versions(conn)
+        t1 = time.perf_counter()
+        rebuild_search_index(conn)
+        rebuild_rollups(conn)
+        print(f"  检索索引与汇总表重建：{time.perf_counter() - t1:.1f}s", flush=True)
+        if journal_mode is not None:
+            conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        clear_snapshots()
+        print(f"generate ok: {len(units)} 个单元，{residents} 名居民，{enterprises} 家企业，"
+              f"{time.perf_counter() - t0:.1f}s → "
+              f"{'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else os.getenv('DASHBOARD_DB', str(BASE / 'data' / 'dashboard.db'))}")
+    finally:
+        if pool is not None:
+            pool.terminate()
+        conn.close()
+
+
+def main(units=None, residents=3200, enterprises=519, resident_units=None, enterprise_units=None):
+    """参数供压测等脚本生成不同规模的数据（见 loadtest.py）；直接运行时为默认测试数据。"""
+    ensure_dirs()
+    conn = get_conn()
+    try:
+        exec_schema(conn)
+        # 旧库首次建出检索索引时先与现有数据对齐，否则 REPLACE 触发的删除会找不到索引行
+        rebuild_search_index(conn)
+        # 字典编码存储的旧库先还原为文字，测试数据按文字写入
+        decode_tables(conn)
+        seed_units(conn, units)
         seed_users(conn)
-        seed_residents(conn)
-        seed_enterprises(conn)
+        seed_residents(conn, n=residents, villages=resident_units)
+        seed_enterprises(conn, n=enterprises, units=enterprise_units)
         seed_dictionaries(conn)
         conn.commit()
+        if TAG_STORAGE == "codes":
+            encode_tables(conn)
+        rebuild_rollups(conn)
+        clear_snapshots()
         print(f"seed ok: {'MySQL dashboard 数据库' if DB_ENGINE == 'mysql' else os.getenv('DASHBOARD_DB', str(BASE / 'data' / 'dashboard.db'))}")
     finally:
         conn.close()
 
 
+def _parse_args():
+    parser = argparse.ArgumentParser(description="写入测试数据（不带子命令时为默认的小规模数据）")
+    sub = parser.add_subparsers(dest="command")
+    p_gen = sub.add_parser("generate", help="按参数生成大规模压测数据（清空居民 / 企业表）")
+    p_gen.add_argument("--residents", type=int, default=1_000_000, help="居民数，默认 1000000")
+    p_gen.add_argument("--enterprises", type=int, default=20_000, help="企业数，默认 20000")
+    p_gen.add_argument("--streets", type=int, default=10, help="街道数，默认 10（至少 2）")
+    p_gen.add_argument("--villages", type=int, default=12, help="每街道社区数，默认 12")
+    p_gen.add_argument("--grids", type=int, default=8, help="每社区网格数，默认 8")
+    p_gen.add_argument("--year", type=int, default=2026)
+    p_gen.add_argument("--workers", type=int, default=0, help="生成行的子进程数，默认 0（本进程生成）")
+    p_gen.add_argument("--chunk", type=int, default=CHUNK_ROWS, help=f"每块行数，默认 {CHUNK_ROWS}")
+    args = parser.parse_args()
+    if args.command == "generate":
+        if args.villages < 1 or args.grids < 1:
+            parser.error("--villages / --grids 至少为 1")
+        if args.chunk < 1 or args.workers < 0:
+            parser.error("--chunk 须大于 0，--workers 不能为负")
+    return args
+
+
 if __name__ == "__main__":
-    main()
+    args = _parse_args()
+    if args.command == "generate":
+        generate(residents=args.residents, enterprises=args.enterprises, streets=args.streets,
+                 villages=args.villages, grids=args.grids, year=args.year,
+                 workers=args.workers, chunk=args.chunk)
+    else:
+        main()
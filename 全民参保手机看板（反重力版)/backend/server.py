@@ -1,16 +1,52 @@
+import argparse
+import base64
+import hashlib
+import hmac
 import json
 import math
+import os
 import re
+import threading
+from collections import OrderedDict
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
+import bitmap_index
+import instrumentation
+import services_metrics
 from auth import issue_token, verify_token
-from db import get_conn
+from bootstrap_snapshots import (
+    ENABLED as SNAPSHOTS_ENABLED,
+    SNAPSHOT_DIR,
+    Snapshot,
+    SnapshotStore,
+    serialize,
+    snapshot_root,
+)
+from columnar_store import scope_view as columnar_view, store as columnar_store
+from compression import (
+    MIN_BYTES as COMPRESS_MIN_BYTES,
+    compress,
+    negotiate as negotiate_encoding,
+    supported_encodings,
+)
+from db import close_pool, connection, read_data_versions
+from instrumentation import span
+from metric_rollups import compute_metrics_rollup
+from org_tree import get_org_tree
+from tag_codes import get_codec
+from user_cache import get_user
 from services_metrics import (
+    METRIC_PARTS,
+    InvalidCursor,
     compute_age_metrics,
+    compute_all_metrics,
     compute_core_metrics,
+    compute_metrics_sql,
     compute_risk_metrics,
     compute_staff_metrics,
+    fetch_metric_rows,
     query_enterprises,
     query_residents,
     resolve_scope,
@@ -18,6 +54,17 @@ from services_metrics import (
 
 HOST = "0.0.0.0"
 PORT = 8787
+# 请求未带 year 时的年度（pre-fork 预热也按此年度装载）
+DEFAULT_YEAR = 2026
+# 长连接空闲超时（秒）：同一连接上两个请求之间最多等待这么久，0 = 每个响应后关闭连接
+KEEPALIVE_TIMEOUT = float(os.getenv("KEEPALIVE_TIMEOUT", "15"))
+# 指标计算引擎：kernel（单遍融合内核，默认）| sql（聚合下推到数据库）
+#             | rollup（读取按单元物化的汇总表）| columnar（进程内 NumPy 列式数据）
+#             | python（逐行参考实现）
+METRICS_ENGINE = os.getenv("METRICS_ENGINE", "kernel").strip().lower()
+if METRICS_ENGINE == "columnar" and not columnar_store.enable():
+    print("METRICS_ENGINE=columnar 需要 numpy（pip3 install numpy），已退回 kernel")
+    METRICS_ENGINE = "kernel"
 
 ROAD_COMMUNITY_MAP = {
     "九龙园区大道": "九龙园区社区",
@@ -44,8 +91,14 @@ STAFF_DETAIL_DEFS = [
 CONFIRMED_LOSS_TYPES = {"死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）"}
 
 
-def row_to_dict(row):
-    return dict(row) if row is not None else None
+def row_to_dict(row, table=None, codec=None):
+    """sqlite3.Row / CompatRow → dict；给出 table 与 codec 时把字典编码的标签列还原为文字。"""
+    if row is None:
+        return None
+    d = dict(row)
+    if codec is not None and codec.active:
+        codec.decode_row(table, d)
+    return d
 
 
 def _stable_hash(s):
@@ -400,14 +453,8 @@ def _enrich_bootstrap_payload(residents, enterprises, by_id):
 
 
 def _children_map(conn):
-    rows = conn.execute("SELECT id,parent_id,name,level FROM org_units").fetchall()
-    by_parent = {}
-    by_id = {}
-    for r in rows:
-        d = row_to_dict(r)
-        by_id[d["id"]] = d
-        by_parent.setdefault(d["parent_id"], []).append(d)
-    return by_parent, by_id
+    tree = get_org_tree(conn)
+    return tree.children, tree.by_id
 
 
 def _descendants(by_parent, root_id):
@@ -421,8 +468,8 @@ def _descendants(by_parent, root_id):
     return out
 
 
-def _map_resident(r):
-    d = row_to_dict(r)
+def _map_resident(r, codec=None):
+    d = row_to_dict(r, "residents", codec)
     age = int(d["age"])
     age_group = "16岁及以下" if age <= 16 else ("16-30岁" if age <= 30 else ("31-45岁" if age <= 45 else ("46-60岁" if age <= 60 else "60岁以上")))
     return {
@@ -464,8 +511,8 @@ def _map_resident(r):
     }
 
 
-def _map_enterprise(r):
-    d = row_to_dict(r)
+def _map_enterprise(r, codec=None):
+    d = row_to_dict(r, "enterprises", codec)
     return {
         "id": d["id"],
         "type": "企业",
@@ -502,7 +549,8 @@ def _identity_from_role(role):
 
 
 def _profile_payload(conn, user):
-    unit = row_to_dict(conn.execute("SELECT * FROM org_units WHERE id=?", [user["unit_id"]]).fetchone())
+    by_id = get_org_tree(conn).by_id
+    unit = by_id.get(user["unit_id"])
     role = user["role"]
     levels = ["district", "street", "village"] if role == "district_leader" else (["street", "village"] if role == "street_leader" else ["village"])
 
@@ -512,13 +560,13 @@ def _profile_payload(conn, user):
         street = unit["name"]
     elif unit["level"] == "village":
         village = unit["name"]
-        p = row_to_dict(conn.execute("SELECT * FROM org_units WHERE id=?", [unit["parent_id"]]).fetchone())
+        p = by_id.get(unit["parent_id"])
         street = p["name"] if p else None
     elif unit["level"] == "grid":
-        v = row_to_dict(conn.execute("SELECT * FROM org_units WHERE id=?", [unit["parent_id"]]).fetchone())
+        v = by_id.get(unit["parent_id"])
         if v:
             village = v["name"]
-            p = row_to_dict(conn.execute("SELECT * FROM org_units WHERE id=?", [v["parent_id"]]).fetchone())
+            p = by_id.get(v["parent_id"])
             street = p["name"] if p else None
 
     return {
@@ -533,7 +581,7 @@ def _profile_payload(conn, user):
     }
 
 
-def _build_bootstrap(conn, user, year):
+def _build_bootstrap(conn, user, year, with_ids=False):
     by_parent, by_id = _children_map(conn)
     root_id = user["unit_id"]
     root = by_id[root_id]
@@ -547,11 +595,12 @@ def _build_bootstrap(conn, user, year):
     else:
         id_list = list(visible_ids)
         marks = ','.join(['?'] * len(id_list))
-        residents = [_map_resident(r) for r in conn.execute(
+        codec = get_codec(conn)
+        residents = [_map_resident(r, codec) for r in conn.execute(
             f"SELECT * FROM residents WHERE year=? AND unit_id IN ({marks})",
             [year] + id_list,
         ).fetchall()]
-        enterprises = [_map_enterprise(e) for e in conn.execute(
+        enterprises = [_map_enterprise(e, codec) for e in conn.execute(
             f"SELECT * FROM enterprises WHERE year=? AND unit_id IN ({marks})",
             [year] + id_list,
         ).fetchall()]
@@ -649,7 +698,8 @@ def _build_bootstrap(conn, user, year):
             x["place"] = v["name"]
         current = sum(1 for x in vr if x["thisYearPaid"])
         target = max(round(len(vr) * 0.92), current)
-        return {"name": v["name"], "target": target, "current": current, "residents": vr, "enterprises": ve}
+        payload = {"name": v["name"], "target": target, "current": current, "residents": vr, "enterprises": ve}
+        return {"id": v["id"], **payload} if with_ids else payload
 
     streets = []
     district_name = "重庆市九龙坡区"
@@ -672,211 +722,713 @@ def _build_bootstrap(conn, user, year):
     return {"district": district_name, "streets": streets}
 
 
-class Handler(BaseHTTPRequestHandler):
-    def _json(self, code, data):
-        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Headers", "Authorization, Content-Type")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.end_headers()
-        self.wfile.write(body)
+# ── 路由分发 ───────────────────────────────────────────────────────────────────
+# 每个接口通过 @route 声明自己依赖的数据集，RequestContext 仅在接口首次访问时
+# 才加载对应数据集；字典、分页列表、bootstrap 等接口不再为用不到的全量数据买单。
+def _load_scope_table(ctx, table):
+    if not ctx.scope:
+        return []
+    marks = ",".join(["?"] * len(ctx.scope))
+    codec = get_codec(ctx.conn)
+    return [row_to_dict(r, table, codec) for r in ctx.conn.execute(
+        f"SELECT * FROM {table} WHERE year=? AND unit_id IN ({marks})",
+        [ctx.year] + ctx.scope,
+    ).fetchall()]
+
+
+DATASET_LOADERS = {
+    "residents": lambda ctx: _load_scope_table(ctx, "residents"),
+    "enterprises": lambda ctx: _load_scope_table(ctx, "enterprises"),
+    "resident_metric_rows": lambda ctx: fetch_metric_rows(ctx.conn, "residents", ctx.scope, ctx.year),
+    "enterprise_metric_rows": lambda ctx: fetch_metric_rows(ctx.conn, "enterprises", ctx.scope, ctx.year),
+}
 
-    def _body(self):
-        n = int(self.headers.get("Content-Length", "0"))
-        if n <= 0:
-            return {}
-        raw = self.rfile.read(n)
-        return json.loads(raw.decode("utf-8"))
 
-    def _unauth(self, msg="unauthorized"):
-        self._json(401, {"ok": False, "message": msg})
+class RequestContext:
+    """单次 /api/ 请求的上下文：连接、用户、年度、权限范围及按需加载的数据集。"""
 
-    def _auth_user(self):
-        auth = self.headers.get("Authorization", "")
-        if not auth.startswith("Bearer "):
-            return None
-        payload = verify_token(auth.split(" ", 1)[1])
-        if not payload:
+    def __init__(self, conn, user, qs, year, scope, datasets, etag=None, versions=None):
+        self.conn = conn
+        self.user = user
+        self.qs = qs
+        self.year = year
+        self.scope = scope
+        # 响应的 ETag；接口返回的不是当前版本数据时（如旧快照）应置为 None
+        self.etag = etag
+        # 计算 ETag 时读到的 {表名: 数据版本}；进程内快照据此判断是否须先刷新，内容才与 ETag 一致
+        self.versions = versions or {}
+        self._declared = set(datasets)
+        self._loaded = {}
+
+    def arg(self, name, default=""):
+        return self.qs.get(name, [default])[0]
+
+    def dataset(self, name):
+        if name not in self._declared:
+            raise KeyError(f"接口未声明数据集：{name}")
+        if name not in self._loaded:
+            with span("fetch"):
+                rows = self._loaded[name] = DATASET_LOADERS[name](self)
+            instrumentation.add_rows(len(rows))
+        return self._loaded[name]
+
+
+ROUTES = {}
+
+
+def route(path, datasets=(), versions=()):
+    """注册接口。versions 为响应所依赖的 data_versions 表名，声明后响应带 ETag、支持 304。"""
+    def deco(fn):
+        ROUTES[path] = (fn, tuple(datasets), tuple(versions))
+        return fn
+    return deco
+
+
+# ── ETag ──────────────────────────────────────────────────────────────────────
+# ETag = 哈希(代码版本, 路径与参数, 当前用户, 所依赖表的数据版本)。
+# 校验只需一次 data_versions 小表查询，命中时在任何计算之前返回 304。
+_CODE_TAG = hashlib.sha1(
+    b"".join(Path(f).read_bytes() for f in (__file__, services_metrics.__file__))
+).hexdigest()[:8]
+
+
+def _make_etag(path, qs, user, versions):
+    raw = json.dumps(
+        [_CODE_TAG, path, sorted(qs.items()),
+         [user["id"], user["username"], user["display_name"], user["role"], user["unit_id"]], versions],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _etag_matches(header, etag):
+    """If-None-Match 比较；忽略弱校验前缀与压缩编码后缀（"...-gzip" / "...-br"）。"""
+    if not header or not etag:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        for enc in supported_encodings():
+            if tag.endswith("-" + enc):
+                tag = tag[: -len(enc) - 1]
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def _compute_parts(parts, residents, enterprises):
+    calc = {
+        "core": lambda: compute_core_metrics(residents),
+        "age": lambda: compute_age_metrics(residents),
+        "staff": lambda: compute_staff_metrics(residents, enterprises),
+        "risk": lambda: compute_risk_metrics(residents, enterprises),
+    }
+    return {p: calc[p]() for p in parts}
+
+
+def _metrics(ctx, parts):
+    """按 METRICS_ENGINE 计算当前范围的指标，返回 {part: payload}。"""
+    with_enterprises = "staff" in parts or "risk" in parts
+    if METRICS_ENGINE == "sql":
+        with span("compute"):
+            return compute_metrics_sql(ctx.conn, ctx.scope, ctx.year, parts=parts)
+    if METRICS_ENGINE == "rollup":
+        with span("compute"):
+            return compute_metrics_rollup(ctx.conn, ctx.scope, ctx.year, parts=parts)
+    if METRICS_ENGINE == "python":
+        residents = ctx.dataset("residents")
+        enterprises = ctx.dataset("enterprises") if with_enterprises else []
+        with span("compute"):
+            return _compute_parts(parts, residents, enterprises)
+    if METRICS_ENGINE == "columnar":
+        # 列式视图直接代替行列表传给 compute_*_metrics；快照不落后于 ETag 所用的版本。
+        # 旧库缺少 data_versions 时无法判断列式数据是否过期，视图为 None，改走单遍内核
+        with span("compute"):
+            view = columnar_view(ctx.conn, ctx.scope, ctx.year, parts, ctx.versions)
+            if view is not None:
+                return _compute_parts(parts, view, view)
+    residents = ctx.dataset("resident_metric_rows")
+    enterprises = ctx.dataset("enterprise_metric_rows") if with_enterprises else ()
+    with span("compute"):
+        return compute_all_metrics(residents, enterprises, parts=parts, codec=get_codec(ctx.conn))
+
+
+_METRIC_DATASETS = ("residents", "enterprises", "resident_metric_rows", "enterprise_metric_rows")
+_METRIC_VERSIONS = ("org_units", "residents", "enterprises")
+
+
+@route("/api/metrics/core", datasets=_METRIC_DATASETS, versions=_METRIC_VERSIONS)
+def _api_metrics_core(ctx):
+    return 200, {"ok": True, "data": _metrics(ctx, ("core",))["core"]}
+
+
+@route("/api/metrics/age", datasets=_METRIC_DATASETS, versions=_METRIC_VERSIONS)
+def _api_metrics_age(ctx):
+    return 200, {"ok": True, "data": _metrics(ctx, ("age",))["age"]}
+
+
+@route("/api/metrics/staff", datasets=_METRIC_DATASETS, versions=_METRIC_VERSIONS)
+def _api_metrics_staff(ctx):
+    return 200, {"ok": True, "data": _metrics(ctx, ("staff",))["staff"]}
+
+
+@route("/api/metrics/risk", datasets=_METRIC_DATASETS, versions=_METRIC_VERSIONS)
+def _api_metrics_risk(ctx):
+    return 200, {"ok": True, "data": _metrics(ctx, ("risk",))["risk"]}
+
+
+@route("/api/metrics/all", datasets=_METRIC_DATASETS, versions=_METRIC_VERSIONS)
+def _api_metrics_all(ctx):
+    return 200, {"ok": True, "data": _metrics(ctx, METRIC_PARTS)}
+
+
+def _paging_args(ctx):
+    """列表分页参数：limit / offset（旧方式）、after（游标）；total=0 不计算总数，total=approx 允许近似总数。"""
+    total = ctx.arg("total", "1")
+    return {
+        "limit": int(ctx.arg("limit", "100")),
+        # 负偏移按 0 处理，与 SQLite 的 OFFSET 语义一致，位图 / SQL 两条路径结果相同
+        "offset": max(0, int(ctx.arg("offset", "0"))),
+        "after": ctx.arg("after"),
+        "with_total": "approx" if total == "approx" else total != "0",
+    }
+
+
+@route("/api/list/residents", versions=("org_units", "residents"))
+def _api_list_residents(ctx):
+    filters = {
+        "name": ctx.arg("name"),
+        "phone": ctx.arg("phone"),
+        "address": ctx.arg("address"),
+        "household": ctx.arg("household"),
+        "residence": ctx.arg("residence"),
+        "residence_detail": ctx.arg("residence_detail"),
+        "insured_place": ctx.arg("insured_place"),
+        "this_year_type": ctx.arg("this_year_type"),
+        "stock_change_type": ctx.arg("stock_change_type"),
+        "loss_reason": ctx.arg("loss_reason"),
+        "pause_flow": ctx.arg("pause_flow"),
+        "key_group": ctx.arg("key_group"),
+        "hardship_type": ctx.arg("hardship_type"),
+        "staff_big_type": ctx.arg("staff_big_type"),
+        "staff_detail_type": ctx.arg("staff_detail_type"),
+        "gender": ctx.arg("gender"),
+        **_paging_args(ctx),
+    }
+    try:
+        rows, total, next_cursor = query_residents(ctx.conn, ctx.scope, ctx.year, filters,
+                                                   version=ctx.versions.get("residents"))
+    except InvalidCursor as e:
+        return 400, {"ok": False, "message": str(e)}
+    codec = get_codec(ctx.conn)
+    items = [row_to_dict(r, "residents", codec) for r in rows]
+    return 200, {"ok": True, "total": total, "items": items, "next_cursor": next_cursor}
+
+
+@route("/api/list/enterprises", versions=("org_units", "enterprises"))
+def _api_list_enterprises(ctx):
+    filters = {
+        "name": ctx.arg("name"),
+        "contact_person": ctx.arg("contact_person"),
+        "address": ctx.arg("address"),
+        "risk": ctx.arg("risk"),
+        "staff_insured": ctx.arg("staff_insured"),
+        **_paging_args(ctx),
+    }
+    try:
+        rows, total, next_cursor = query_enterprises(ctx.conn, ctx.scope, ctx.year, filters,
+                                                     version=ctx.versions.get("enterprises"))
+    except InvalidCursor as e:
+        return 400, {"ok": False, "message": str(e)}
+    codec = get_codec(ctx.conn)
+    items = [row_to_dict(r, "enterprises", codec) for r in rows]
+    return 200, {"ok": True, "total": total, "items": items, "next_cursor": next_cursor}
+
+
+@route("/api/dictionary/filters")
+def _api_dictionary_filters(ctx):
+    rows = ctx.conn.execute(
+        "SELECT category, value FROM dictionaries "
+        "WHERE enabled=1 ORDER BY category, sort_order, value"
+    ).fetchall()
+    data = {}
+    for r in rows:
+        data.setdefault(r["category"], []).append(r["value"])
+    return 200, {"ok": True, "data": data}
+
+
+def _bootstrap_parts(conn, root_id, year):
+    return {"dashboard": serialize(_build_bootstrap(conn, {"unit_id": root_id}, year))}
+
+
+bootstrap_store = SnapshotStore(SNAPSHOT_DIR / "v1", _bootstrap_parts)
+
+
+def _snapshot_part(ctx, store, part):
+    """从快照读取当前用户根单元的某一部分；返回旧快照时去掉 ETag。"""
+    root_id = snapshot_root(get_org_tree(ctx.conn), ctx.user["unit_id"])
+    if not SNAPSHOTS_ENABLED:
+        return Snapshot(store.build_fn(ctx.conn, root_id, ctx.year).get(part), None, True)
+    snap = store.get(ctx.conn, root_id, ctx.year, part)
+    if not snap.fresh:
+        ctx.etag = None
+    return snap
+
+
+@route("/api/bootstrap", versions=_METRIC_VERSIONS)
+def _api_bootstrap(ctx):
+    profile = _profile_payload(ctx.conn, ctx.user)
+    dashboard = _snapshot_part(ctx, bootstrap_store, "dashboard").data
+    # dashboard 已是序列化好的 JSON 字节，直接拼接，避免对大块数据再做一次 loads/dumps
+    body = b'{"ok": true, "profile": ' + serialize(profile) + b', "dashboard": ' + dashboard + b"}"
+    return 200, body
+
+
+# ── bootstrap v2：层级 + 村居汇总，明细按村居游标分页 ─────────────────────────
+# 首屏只下发层级与各村居的计数器，居民 / 企业明细由 /api/v2/villages/* 按需分页拉取，
+# 首屏耗时不再随全区人口增长。村居归属沿用 _build_bootstrap 的推断结果。
+V2_RESIDENT_FLAGS = ("thisYearPaid", "lastYearPaid", "lastYearLocalPaid", "isHardship", "isCollege", "isPrimarySecondary")
+V2_RESIDENT_TALLIES = (
+    "gender", "ageGroup", "household", "residence", "thisYearType", "stockChangeType",
+    "pauseFlow", "keyGroup", "staffBigType", "staffDetailType",
+)
+V2_ENTERPRISE_FLAGS = ("staffInsured", "lastMonthStaffInsured")
+V2_ENTERPRISE_TALLIES = ("risk",)
+V2_PAGE_LIMIT = 50
+V2_PAGE_MAX = 500
+
+
+def _tally(records, flags, tallies):
+    out = {"flags": {f: 0 for f in flags}, "tallies": {f: {} for f in tallies}}
+    for r in records:
+        for f in flags:
+            if r.get(f):
+                out["flags"][f] += 1
+        for f in tallies:
+            v = r.get(f)
+            if v:
+                bucket = out["tallies"][f]
+                bucket[v] = bucket.get(v, 0) + 1
+    return out
+
+
+def _bootstrap_v2_parts(conn, root_id, year):
+    dashboard = _build_bootstrap(conn, {"unit_id": root_id}, year, with_ids=True)
+    parts = {}
+    streets = []
+    for st in dashboard["streets"]:
+        villages = []
+        for v in st["villages"]:
+            rs, es = v["residents"], v["enterprises"]
+            parts[f"{v['id']}.residents"] = serialize(rs)
+            parts[f"{v['id']}.enterprises"] = serialize(es)
+            villages.append({
+                "id": v["id"],
+                "name": v["name"],
+                "target": v["target"],
+                "current": v["current"],
+                "residentCount": len(rs),
+                "enterpriseCount": len(es),
+                "metrics": {
+                    "residents": _tally(rs, V2_RESIDENT_FLAGS, V2_RESIDENT_TALLIES),
+                    "enterprises": _tally(es, V2_ENTERPRISE_FLAGS, V2_ENTERPRISE_TALLIES),
+                },
+            })
+        streets.append({"name": st["name"], "villages": villages})
+    parts["summary"] = serialize({"district": dashboard["district"], "streets": streets})
+    return parts
+
+
+bootstrap_v2_store = SnapshotStore(SNAPSHOT_DIR / "v2", _bootstrap_v2_parts)
+
+# 已解析的村居明细（按快照版本缓存，翻页时不必每页重新解析整村 JSON）
+_v2_records = OrderedDict()
+_v2_records_lock = threading.Lock()
+_V2_RECORDS_CACHE = 16
+
+
+def _v2_parsed(key, data):
+    if key is None:
+        return json.loads(data)
+    with _v2_records_lock:
+        hit = _v2_records.get(key)
+        if hit is not None:
+            _v2_records.move_to_end(key)
+            return hit
+    records = json.loads(data)
+    with _v2_records_lock:
+        _v2_records[key] = records
+        while len(_v2_records) > _V2_RECORDS_CACHE:
+            _v2_records.popitem(last=False)
+    return records
+
+
+def _encode_cursor(version, offset):
+    return base64.urlsafe_b64encode(f"{version or ''}:{offset}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    version, _, offset = raw.rpartition(":")
+    # 偏移只接受非负十进制整数（int() 会放过 "-1"、"+1"、" 1"、"1_0"）
+    if not (offset.isascii() and offset.isdigit()):
+        raise ValueError(f"cursor 偏移无效：{offset!r}")
+    return version or None, int(offset)
+
+
+@route("/api/v2/bootstrap", versions=_METRIC_VERSIONS)
+def _api_bootstrap_v2(ctx):
+    profile = _profile_payload(ctx.conn, ctx.user)
+    snap = _snapshot_part(ctx, bootstrap_v2_store, "summary")
+    body = (
+        b'{"ok": true, "profile": ' + serialize(profile)
+        + b', "version": ' + serialize(snap.version)
+        + b', "dashboard": ' + snap.data + b"}"
+    )
+    return 200, body
+
+
+def _village_page(ctx, kind):
+    village_id = ctx.arg("village_id")
+    if not village_id:
+        return 400, {"ok": False, "message": "缺少 village_id"}
+    try:
+        limit = max(1, min(int(ctx.arg("limit", V2_PAGE_LIMIT)), V2_PAGE_MAX))
+        version, offset = _decode_cursor(ctx.arg("cursor")) if ctx.arg("cursor") else (None, 0)
+    except (ValueError, UnicodeDecodeError):
+        return 400, {"ok": False, "message": "limit 或 cursor 无效"}
+    part = f"{village_id}.{kind}"
+    root_id = snapshot_root(get_org_tree(ctx.conn), ctx.user["unit_id"])
+
+    if version is not None:
+        # 后续页沿用首页的快照版本，保证翻页期间数据一致
+        data = bootstrap_v2_store.get_version(root_id, ctx.year, version, part)
+        if data is None:
+            return 409, {"ok": False, "message": "数据已更新，请重新加载"}
+    else:
+        snap = _snapshot_part(ctx, bootstrap_v2_store, part)
+        data, version = snap.data, snap.version
+    if data is None:
+        return 404, {"ok": False, "message": "村居不存在或无权查看"}
+
+    records = _v2_parsed((root_id, ctx.year, version, part) if version else None, data)
+    page = records[offset:offset + limit]
+    fields = [f.strip() for f in ctx.arg("fields").split(",") if f.strip()]
+    if fields:
+        keep = ["id"] + [f for f in fields if f != "id"]
+        page = [{k: r[k] for k in keep if k in r} for r in page]
+    end = offset + len(page)
+    return 200, {
+        "ok": True,
+        "data": page,
+        "total": len(records),
+        "next_cursor": _encode_cursor(version, end) if end < len(records) else None,
+    }
+
+
+@route("/api/v2/villages/residents", versions=_METRIC_VERSIONS)
+def _api_village_residents(ctx):
+    return _village_page(ctx, "residents")
+
+
+@route("/api/v2/villages/enterprises", versions=_METRIC_VERSIONS)
+def _api_village_enterprises(ctx):
+    return _village_page(ctx, "enterprises")
+
+
+# ── 请求处理（与传输层无关）──────────────────────────────────────────────────
+# Handler（ThreadingHTTPServer）与 async_server.py（asyncio）共用：输入请求方法、目标、
+# 头部（需支持不区分大小写的 .get()）与请求体，输出 (状态码, [(头部名, 值)], 响应体)。
+def build_response(code, data, etag=None, accept_encoding="", content_type="application/json; charset=utf-8"):
+    """
+    data 为 dict 时序列化后发送；为 bytes 时视为已序列化的内容（默认 JSON）原样发送；
+    code 为 304 时只发送头部。客户端接受 gzip / br 时压缩较大的响应体。
+    """
+    if code == 304:
+        body = b""
+    elif isinstance(data, bytes):
+        body = data
+    else:
+        with span("serialize"):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    encoding = None
+    if code == 200 and len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding:
+            with span("compress"):
+                body = compress(body, encoding, cache_key=etag)
+    headers = []
+    if code != 304:
+        headers.append(("Content-Type", content_type))
+        headers.append(("Content-Length", str(len(body))))
+    if encoding:
+        headers.append(("Content-Encoding", encoding))
+    if etag:
+        # 不同编码是不同的表示，强 ETag 需带编码后缀
+        headers.append(("ETag", f'"{etag}-{encoding}"' if encoding else f'"{etag}"'))
+        headers.append(("Cache-Control", "private, no-cache"))
+    headers.append(("Vary", "Accept-Encoding, Authorization"))
+    headers.append(("Access-Control-Allow-Origin", "*"))
+    headers.append(("Access-Control-Allow-Headers", "Authorization, Content-Type, If-None-Match"))
+    headers.append(("Access-Control-Allow-Methods", "GET, POST, OPTIONS"))
+    headers.append(("Access-Control-Expose-Headers", "ETag"))
+    return code, headers, body
+
+
+def _unauth(msg="unauthorized"):
+    return 401, {"ok": False, "message": msg}
+
+
+def _auth_user(conn, headers):
+    auth = headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    payload = verify_token(auth.split(" ", 1)[1])
+    if not payload:
+        return None
+    return get_user(conn, payload["uid"])
+
+
+def _login(conn, data):
+    row = conn.execute(
+        "SELECT * FROM users WHERE username=? AND password=? AND enabled=1",
+        [data.get("username", ""), data.get("password", "")],
+    ).fetchone()
+    if not row:
+        return _unauth("用户名或密码错误")
+    user = row_to_dict(row)
+    token = issue_token(user["id"], user["role"], user["unit_id"])
+    return 200, {
+        "ok": True,
+        "token": token,
+        "user": {
+            "id": user["id"],
+            "username": user["username"],
+            "name": user["display_name"],
+            "role": user["role"],
+            "unit": get_org_tree(conn).unit_brief(user["unit_id"]),
+        },
+    }
+
+
+def _dispatch_get(conn, path, qs, headers):
+    with span("auth"):
+        user = _auth_user(conn, headers)
+    if not user:
+        return _unauth()
+
+    if path == "/api/auth/profile":
+        return 200, {
+            "ok": True,
+            "user": {
+                "id": user["id"],
+                "username": user["username"],
+                "name": user["display_name"],
+                "role": user["role"],
+                "unit": get_org_tree(conn).unit_brief(user["unit_id"]),
+            },
+        }
+
+    year = int(qs.get("year", [DEFAULT_YEAR])[0])
+    requested_unit_id = qs.get("unit_id", [None])[0]
+
+    with span("scope"):
+        scope = resolve_scope(conn, user, requested_unit_id)
+    if scope is None:
+        return 403, {"ok": False, "message": "无权查看该层级数据"}
+
+    handler = ROUTES.get(path)
+    if handler is None:
+        return 404, {"ok": False, "message": "not found"}
+    fn, datasets, tables = handler
+
+    etag = None
+    versions = None
+    if tables:
+        with span("etag"):
+            versions = read_data_versions(conn, tables)
+            if versions is not None:
+                etag = _make_etag(path, qs, user, versions)
+        if etag is not None and _etag_matches(headers.get("If-None-Match"), etag):
+            return 304, None, etag
+
+    ctx = RequestContext(conn, user, qs, year, scope, datasets, etag,
+                         dict(zip(tables, versions)) if versions is not None else None)
+    with span("handler"):
+        code, data = fn(ctx)
+    return code, data, ctx.etag if code == 200 else None
+
+
+def _dispatch(method, target, headers, body):
+    url = urlparse(target)
+    path = url.path
+    if method == "OPTIONS":
+        return 200, {"ok": True}
+
+    if method == "POST":
+        if path == "/api/auth/login":
+            data = json.loads(body.decode("utf-8")) if body else {}
+            with connection() as conn:
+                return _login(conn, data)
+        return 404, {"ok": False, "message": "not found"}
+
+    if path == "/api/health":
+        return 200, {"ok": True, "service": "dashboard-backend"}
+
+    if not path.startswith("/api/"):
+        return 404, {"ok": False, "message": "not found"}
+
+    # 一个请求只借一条连接：鉴权、范围解析与接口计算共用；响应在归还连接后再组装
+    with connection() as conn:
+        return _dispatch_get(conn, path, parse_qs(url.query), headers)
+
+
+# ── 运行指标（见 instrumentation.py）──────────────────────────────────────────
+METRICS_INTERNAL_PATH = "/api/metrics-internal"
+_FIXED_ROUTES = {"/api/health", "/api/auth/login", "/api/auth/profile"}
+
+
+def _route_label(path):
+    """埋点的路由标签：只用已注册的路径，其余归为 other，避免标签无限增长。"""
+    return path if path in ROUTES or path in _FIXED_ROUTES else "other"
+
+
+def _metrics_internal(headers):
+    if instrumentation.TOKEN and not hmac.compare_digest(
+        headers.get("Authorization", ""), f"Bearer {instrumentation.TOKEN}"
+    ):
+        return build_response(*_unauth())
+    return build_response(200, instrumentation.render(),
+                          content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def handle_request(method, target, headers, body=b""):
+    """处理一个 GET / POST / OPTIONS 请求，返回 (状态码, [(头部名, 值)], 响应体)。"""
+    path = urlparse(target).path
+    if path == METRICS_INTERNAL_PATH and method == "GET":
+        return _metrics_internal(headers)
+    instrumentation.begin(_route_label(path))
+    code, payload = 500, b""
+    try:
+        result = _dispatch(method, target, headers, body)
+        code, out, payload = build_response(*result, accept_encoding=headers.get("Accept-Encoding", ""))
+        return code, out, payload
+    finally:
+        instrumentation.finish(code, len(payload))
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 长连接：手机端下钻时的连续请求复用同一 TCP 连接。
+    # 每个响应都带 Content-Length（304 无响应体），客户端据此划分响应；
+    # 连接空闲超过 timeout 秒时 handle_one_request 读超时，随即关闭连接。
+    protocol_version = "HTTP/1.1" if KEEPALIVE_TIMEOUT > 0 else "HTTP/1.0"
+    timeout = KEEPALIVE_TIMEOUT if KEEPALIVE_TIMEOUT > 0 else None
+    # 头部与响应体分两次写出，关闭 Nagle，避免长连接上第二次写被延迟确认拖慢约 40ms
+    disable_nagle_algorithm = True
+
+    def _read_body(self):
+        """按 Content-Length 读出请求体（任何方法都读，否则残留字节会被当成下一个请求）。"""
+        if self.headers.get("Transfer-Encoding"):
+            # 分块上传的请求体不支持（前端与 Nginx 均带 Content-Length），拒绝并关闭连接
+            self.send_error(411, "Length Required")
             return None
-        conn = get_conn()
         try:
-            row = conn.execute("SELECT * FROM users WHERE id=? AND enabled=1", [payload["uid"]]).fetchone()
-            return row_to_dict(row)
-        finally:
-            conn.close()
+            n = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            self.send_error(400, "Bad Content-Length")
+            return None
+        return self.rfile.read(n) if n > 0 else b""
+
+    def _respond(self, method):
+        body = self._read_body()
+        if body is None:
+            return
+        code, headers, body = handle_request(method, self.path, self.headers, body)
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.close_connection:
+            # 客户端要求关闭（Connection: close / HTTP/1.0）时明确告知
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_error(self, format, *args):
+        # 长连接空闲超时是正常的关闭方式，不记入错误日志
+        if format.startswith("Request timed out"):
+            return
+        super().log_error(format, *args)
 
     def do_OPTIONS(self):
-        self._json(200, {"ok": True})
+        self._respond("OPTIONS")
 
     def do_POST(self):
-        path = urlparse(self.path).path
-        if path == "/api/auth/login":
-            data = self._body()
-            conn = get_conn()
-            try:
-                row = conn.execute(
-                    "SELECT * FROM users WHERE username=? AND password=? AND enabled=1",
-                    [data.get("username", ""), data.get("password", "")],
-                ).fetchone()
-                if not row:
-                    return self._unauth("用户名或密码错误")
-                user = row_to_dict(row)
-                token = issue_token(user["id"], user["role"], user["unit_id"])
-                unit = conn.execute("SELECT id,name,level FROM org_units WHERE id=?", [user["unit_id"]]).fetchone()
-                return self._json(
-                    200,
-                    {
-                        "ok": True,
-                        "token": token,
-                        "user": {
-                            "id": user["id"],
-                            "username": user["username"],
-                            "name": user["display_name"],
-                            "role": user["role"],
-                            "unit": row_to_dict(unit),
-                        },
-                    },
-                )
-            finally:
-                conn.close()
-
-        return self._json(404, {"ok": False, "message": "not found"})
+        self._respond("POST")
 
     def do_GET(self):
-        path = urlparse(self.path).path
-        qs = parse_qs(urlparse(self.path).query)
-
-        if path == "/api/health":
-            return self._json(200, {"ok": True, "service": "dashboard-backend"})
-
-        if path == "/api/auth/profile":
-            user = self._auth_user()
-            if not user:
-                return self._unauth()
-            conn = get_conn()
-            try:
-                unit = conn.execute("SELECT id,name,level FROM org_units WHERE id=?", [user["unit_id"]]).fetchone()
-                return self._json(
-                    200,
-                    {
-                        "ok": True,
-                        "user": {
-                            "id": user["id"],
-                            "username": user["username"],
-                            "name": user["display_name"],
-                            "role": user["role"],
-                            "unit": row_to_dict(unit),
-                        },
-                    },
-                )
-            finally:
-                conn.close()
-
-        if path.startswith("/api/"):
-            user = self._auth_user()
-            if not user:
-                return self._unauth()
-
-            year = int(qs.get("year", ["2026"])[0])
-            requested_unit_id = qs.get("unit_id", [None])[0]
-
-            conn = get_conn()
-            try:
-                scope = resolve_scope(conn, user, requested_unit_id)
-                if scope is None:
-                    return self._json(403, {"ok": False, "message": "无权查看该层级数据"})
-
-                if not scope:
-                    residents, enterprises = [], []
-                else:
-                    _marks = ','.join(['?'] * len(scope))
-                    residents = [row_to_dict(r) for r in conn.execute(
-                        f"SELECT * FROM residents WHERE year=? AND unit_id IN ({_marks})",
-                        [year] + scope,
-                    ).fetchall()]
-                    enterprises = [row_to_dict(r) for r in conn.execute(
-                        f"SELECT * FROM enterprises WHERE year=? AND unit_id IN ({_marks})",
-                        [year] + scope,
-                    ).fetchall()]
-
-                if path == "/api/metrics/core":
-                    return self._json(200, {"ok": True, "data": compute_core_metrics(residents)})
-
-                if path == "/api/metrics/age":
-                    return self._json(200, {"ok": True, "data": compute_age_metrics(residents)})
-
-                if path == "/api/metrics/staff":
-                    return self._json(200, {"ok": True, "data": compute_staff_metrics(residents, enterprises)})
-
-                if path == "/api/metrics/risk":
-                    return self._json(200, {"ok": True, "data": compute_risk_metrics(residents, enterprises)})
-
-                if path == "/api/list/residents":
-                    filters = {
-                        "name": qs.get("name", [""])[0],
-                        "phone": qs.get("phone", [""])[0],
-                        "address": qs.get("address", [""])[0],
-                        "household": qs.get("household", [""])[0],
-                        "residence": qs.get("residence", [""])[0],
-                        "residence_detail": qs.get("residence_detail", [""])[0],
-                        "insured_place": qs.get("insured_place", [""])[0],
-                        "this_year_type": qs.get("this_year_type", [""])[0],
-                        "stock_change_type": qs.get("stock_change_type", [""])[0],
-                        "loss_reason": qs.get("loss_reason", [""])[0],
-                        "pause_flow": qs.get("pause_flow", [""])[0],
-                        "key_group": qs.get("key_group", [""])[0],
-                        "hardship_type": qs.get("hardship_type", [""])[0],
-                        "staff_big_type": qs.get("staff_big_type", [""])[0],
-                        "staff_detail_type": qs.get("staff_detail_type", [""])[0],
-                        "gender": qs.get("gender", [""])[0],
-                        "limit": int(qs.get("limit", ["100"])[0]),
-                        "offset": int(qs.get("offset", ["0"])[0]),
-                    }
-                    rows, total = query_residents(conn, scope, year, filters)
-                    return self._json(200, {"ok": True, "total": total, "items": [row_to_dict(r) for r in rows]})
-
-                if path == "/api/list/enterprises":
-                    filters = {
-                        "name": qs.get("name", [""])[0],
-                        "contact_person": qs.get("contact_person", [""])[0],
-                        "address": qs.get("address", [""])[0],
-                        "risk": qs.get("risk", [""])[0],
-                        "staff_insured": qs.get("staff_insured", [""])[0],
-                        "limit": int(qs.get("limit", ["100"])[0]),
-                        "offset": int(qs.get("offset", ["0"])[0]),
-                    }
-                    rows, total = query_enterprises(conn, scope, year, filters)
-                    return self._json(200, {"ok": True, "total": total, "items": [row_to_dict(r) for r in rows]})
-
-                if path == "/api/dictionary/filters":
-                    rows = conn.execute(
-                        "SELECT category, value FROM dictionaries "
-                        "WHERE enabled=1 ORDER BY category, sort_order, value"
-                    ).fetchall()
-                    data = {}
-                    for r in rows:
-                        data.setdefault(r["category"], []).append(r["value"])
-                    return self._json(200, {"ok": True, "data": data})
-
-                if path == "/api/bootstrap":
-                    profile = _profile_payload(conn, user)
-                    dashboard = _build_bootstrap(conn, user, year)
-                    return self._json(200, {"ok": True, "profile": profile, "dashboard": dashboard})
-
-                return self._json(404, {"ok": False, "message": "not found"})
-            finally:
-                conn.close()
-
-        return self._json(404, {"ok": False, "message": "not found"})
+        self._respond("GET")
+
+
+def warmup():
+    """
+    预热进程内缓存：组织树、编解码表，以及已启用的列式数据 / 位图索引（默认年度）。
+    pre-fork 模式在 fork 之前调用，工作进程以写时复制的方式共享这些内存；
+    结束时关闭空闲连接，工作进程各自重新建立连接。
+    """
+    with connection() as conn:
+        get_org_tree(conn)
+        get_codec(conn)
+        for table in ("residents", "enterprises"):
+            if columnar_store.enabled:
+                columnar_store.table(conn, table, DEFAULT_YEAR)
+            bitmap_index.get_bitmaps(conn, table, DEFAULT_YEAR)
+    close_pool()
+
+
+def _serve_threaded(sock=None):
+    """ThreadingHTTPServer 服务；sock 为已在监听的 socket（pre-fork 模式由主进程创建）时直接使用。"""
+    if sock is None:
+        server = ThreadingHTTPServer((HOST, PORT), Handler)
+    else:
+        server = ThreadingHTTPServer((HOST, PORT), Handler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+    print(f"dashboard backend (pid={os.getpid()}) listening on http://{HOST}:{PORT}")
+    server.serve_forever()
 
 
 def run():
-    server = ThreadingHTTPServer((HOST, PORT), Handler)
-    print(f"dashboard backend listening on http://{HOST}:{PORT}")
-    server.serve_forever()
+    global PORT
+    parser = argparse.ArgumentParser(description="全民参保看板后端 API 服务")
+    parser.add_argument("--port", type=int, default=PORT, help=f"监听端口，默认 {PORT}")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="使用 asyncio 服务（有界线程池 + 排队上限，见 async_server.py）")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数，大于 1 时以 pre-fork 模式运行（见 prefork.py，需 Linux / macOS）")
+    args = parser.parse_args()
+    PORT = args.port
+    if args.use_async:
+        import async_server
+
+        def serve(sock=None):
+            async_server.run(HOST, PORT, handle_request, build_response, sock=sock)
+    else:
+        serve = _serve_threaded
+
+    if args.workers > 1:
+        if not hasattr(os, "fork"):
+            parser.error("--workers 需要 os.fork（Linux / macOS）")
+        import prefork
+
+        prefork.run(HOST, PORT, args.workers, serve, warmup=warmup)
+        return
+    serve()
 
 
 if __name__ == "__main__":
@@ -1,32 +1,28 @@
-from collections import Counter, defaultdict
+import base64
+import hashlib
+import json
+from collections import Counter
+
+import list_counts
+from db import DB_ENGINE, fetch_tuples
+from org_tree import get_org_tree
+from search_index import search_clause
+from tag_codes import PLAIN, get_codec
 
 
 def get_descendants(conn, unit_id: str):
-    rows = conn.execute("SELECT id, parent_id FROM org_units").fetchall()
-    by_parent = defaultdict(list)
-    for r in rows:
-        by_parent[r["parent_id"]].append(r["id"])
-    out = []
-    stack = [unit_id]
-    while stack:
-        cur = stack.pop()
-        out.append(cur)
-        stack.extend(by_parent.get(cur, []))
-    return out
+    return get_org_tree(conn).descendants(unit_id)
 
 
 def resolve_scope(conn, user, requested_unit_id=None):
-    allowed = set(get_descendants(conn, user["unit_id"]))
+    tree = get_org_tree(conn)
     scope = user["unit_id"]
     if requested_unit_id:
-        req_desc = set(get_descendants(conn, requested_unit_id))
         # only allow selecting self or descendants
-        if requested_unit_id in allowed:
-            scope = requested_unit_id
-            allowed = req_desc
-        else:
+        if requested_unit_id not in tree.descendant_set(user["unit_id"]):
             return None
-    return sorted(list(allowed if scope == user["unit_id"] else set(get_descendants(conn, scope))))
+        scope = requested_unit_id
+    return sorted(tree.descendant_set(scope))
 
 
 def _fetch_residents(conn, unit_ids, year):
@@ -45,14 +41,27 @@ def _fetch_enterprises(conn, unit_ids, year):
     return conn.execute(sql, [year] + unit_ids).fetchall()
 
 
-def compute_core_metrics(residents):
-    confirmed_losses = {"死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）"}
-    total_pop = len(residents)
-    done_total = sum(1 for r in residents if r["this_year_paid"] == 1)
-    done_staff = sum(1 for r in residents if r["this_year_paid"] == 1 and r["this_year_type"] == "职工保")
-    done_resident = sum(1 for r in residents if r["this_year_paid"] == 1 and r["this_year_type"] == "居民保")
+CONFIRMED_LOSSES = ("死亡", "辖区外参保", "停保", "转职工保（含灵活就业参保）")
+# (分组名, 下限, 上限)，两端均为闭区间；None 表示不设限。16 岁同时计入前两组，沿用原口径。
+AGE_GROUPS = [
+    ("16岁及以下", None, 16),
+    ("16-30岁", 16, 30),
+    ("31-45岁", 31, 45),
+    ("46-60岁", 46, 60),
+    ("60岁以上", 61, None),
+]
+PAUSE_FLOWS = ("转居民保", "申请停保", "跨区转出")
 
-    target_total = max(round(total_pop * 0.92), done_total)
+
+# ── 指标口径：由计数器组装接口返回结构 ─────────────────────────────────────────
+# 各计算引擎（逐行 / SQL 下推）只负责产出计数器，口径换算统一在这里完成，
+# 保证不同引擎的输出逐字节一致。
+def _core_payload(c):
+    done_total = c["done_total"]
+    done_staff = c["done_staff"]
+    done_resident = c["done_resident"]
+
+    target_total = max(round(c["total_pop"] * 0.92), done_total)
     target_staff = max(round(target_total * 0.42), done_staff)
     target_resident = max(target_total - target_staff, done_resident)
 
@@ -60,23 +69,8 @@ def compute_core_metrics(residents):
     gap_staff = max(target_staff - done_staff, 0)
     gap_resident = max(target_resident - done_resident, 0)
 
-    stock_mobilizable = sum(
-        1
-        for r in residents
-        if r["stock_change_type"] == "可动员"
-        and r["this_year_paid"] == 0
-        and r["stock_change_type"] not in confirmed_losses
-        and r["loss_reason"] not in confirmed_losses
-    )
-    increment_mobilizable = sum(
-        1
-        for r in residents
-        if r["this_year_paid"] == 0
-        and r["last_year_local_paid"] == 0
-        and r["stock_change_type"] not in confirmed_losses
-        and r["loss_reason"] not in confirmed_losses
-        and (r["household"] == "本区户籍" or r["residence"] == "本区居住")
-    )
+    stock_mobilizable = c["mobilizable_stock"]
+    increment_mobilizable = c["mobilizable_increment"]
     mobilizable_total = stock_mobilizable + increment_mobilizable
 
     return {
@@ -99,22 +93,13 @@ def compute_core_metrics(residents):
     }
 
 
-def compute_age_metrics(residents):
-    groups = [
-        ("16岁及以下", lambda a: a <= 16),
-        ("16-30岁", lambda a: 16 <= a <= 30),
-        ("31-45岁", lambda a: 31 <= a <= 45),
-        ("46-60岁", lambda a: 46 <= a <= 60),
-        ("60岁以上", lambda a: a > 60),
-    ]
-    total = max(len(residents), 1)
+def _age_payload(c):
+    total = max(c["total_pop"], 1)
     out = []
-    for name, fn in groups:
-        arr = [r for r in residents if fn(r["age"])]
-        cnt = len(arr)
-        insured = sum(1 for r in arr if r["this_year_paid"] == 1)
-        male = sum(1 for r in arr if r["gender"] == "男")
-        female = cnt - male
+    for i, (name, _, _) in enumerate(AGE_GROUPS):
+        cnt = c[f"age{i}_count"]
+        insured = c[f"age{i}_insured"]
+        male = c[f"age{i}_male"]
         out.append(
             {
                 "age_group": name,
@@ -122,21 +107,16 @@ def compute_age_metrics(residents):
                 "share": round(cnt * 100 / total, 1),
                 "insured_rate": round(insured * 100 / cnt, 1) if cnt else 0,
                 "male": male,
-                "female": female,
+                "female": cnt - male,
             }
         )
     return out
 
 
-def compute_staff_metrics(residents, enterprises):
-    staff_people = [r for r in residents if r["this_year_type"] == "职工保"]
-    total_staff_people = len(staff_people)
-    big_counter = Counter(r["staff_big_type"] for r in staff_people if r["staff_big_type"])
-    detail_counter = Counter(r["staff_detail_type"] for r in staff_people if r["staff_detail_type"])
-
-    units_total = len(enterprises)
-    units_insured = sum(1 for e in enterprises if e["staff_insured"] == 1)
-    units_last = sum(1 for e in enterprises if e["last_month_staff_insured"] == 1)
+def _staff_payload(c, staff_big, staff_detail):
+    units_total = c["units_total"]
+    units_insured = c["units_insured"]
+    units_last = c["units_last"]
 
     def mom(cur, last):
         if last == 0:
@@ -144,9 +124,9 @@ def compute_staff_metrics(residents, enterprises):
         return round((cur - last) * 100 / last, 1)
 
     return {
-        "staff_people_total": total_staff_people,
-        "staff_big": dict(big_counter),
-        "staff_detail": dict(detail_counter),
+        "staff_people_total": c["staff_people"],
+        "staff_big": dict(staff_big),
+        "staff_detail": dict(staff_detail),
         "units_total": units_total,
         "units_insured": units_insured,
         "units_uninsured": max(units_total - units_insured, 0),
@@ -157,69 +137,501 @@ def compute_staff_metrics(residents, enterprises):
     }
 
 
+def _risk_payload(c):
+    flows = {name: c[f"pause{i}"] for i, name in enumerate(PAUSE_FLOWS)}
+    return {"high_risk_enterprises": c["risk_high"], "mid_risk_enterprises": c["risk_mid"], "pause_flows": flows}
+
+
+# ── 逐行引擎（参考实现）──────────────────────────────────────────────────────
+# 各函数也接受列式视图（columnar_store.scope_view() 的返回值）代替行列表，此时直接给出向量化结果。
+def _columnar(rows, part):
+    metrics = getattr(rows, "columnar_metrics", None)
+    return None if metrics is None else metrics((part,))[part]
+
+
+def compute_core_metrics(residents):
+    hit = _columnar(residents, "core")
+    if hit is not None:
+        return hit
+    confirmed_losses = set(CONFIRMED_LOSSES)
+    c = {
+        "total_pop": len(residents),
+        "done_total": sum(1 for r in residents if r["this_year_paid"] == 1),
+        "done_staff": sum(1 for r in residents if r["this_year_paid"] == 1 and r["this_year_type"] == "职工保"),
+        "done_resident": sum(1 for r in residents if r["this_year_paid"] == 1 and r["this_year_type"] == "居民保"),
+        "mobilizable_stock": sum(
+            1
+            for r in residents
+            if r["stock_change_type"] == "可动员"
+            and r["this_year_paid"] == 0
+            and r["stock_change_type"] not in confirmed_losses
+            and r["loss_reason"] not in confirmed_losses
+        ),
+        "mobilizable_increment": sum(
+            1
+            for r in residents
+            if r["this_year_paid"] == 0
+            and r["last_year_local_paid"] == 0
+            and r["stock_change_type"] not in confirmed_losses
+            and r["loss_reason"] not in confirmed_losses
+            and (r["household"] == "本区户籍" or r["residence"] == "本区居住")
+        ),
+    }
+    return _core_payload(c)
+
+
+def compute_age_metrics(residents):
+    hit = _columnar(residents, "age")
+    if hit is not None:
+        return hit
+    c = {"total_pop": len(residents)}
+    for i, (_, lo, hi) in enumerate(AGE_GROUPS):
+        arr = [r for r in residents if (lo is None or r["age"] >= lo) and (hi is None or r["age"] <= hi)]
+        c[f"age{i}_count"] = len(arr)
+        c[f"age{i}_insured"] = sum(1 for r in arr if r["this_year_paid"] == 1)
+        c[f"age{i}_male"] = sum(1 for r in arr if r["gender"] == "男")
+    return _age_payload(c)
+
+
+def compute_staff_metrics(residents, enterprises):
+    hit = _columnar(residents, "staff")
+    if hit is not None:
+        return hit
+    staff_people = [r for r in residents if r["this_year_type"] == "职工保"]
+    big_counter = Counter(r["staff_big_type"] for r in staff_people if r["staff_big_type"])
+    detail_counter = Counter(r["staff_detail_type"] for r in staff_people if r["staff_detail_type"])
+    c = {
+        "staff_people": len(staff_people),
+        "units_total": len(enterprises),
+        "units_insured": sum(1 for e in enterprises if e["staff_insured"] == 1),
+        "units_last": sum(1 for e in enterprises if e["last_month_staff_insured"] == 1),
+    }
+    return _staff_payload(c, big_counter, detail_counter)
+
+
 def compute_risk_metrics(residents, enterprises):
-    high = [e for e in enterprises if e["risk"] == "高"]
-    mid = [e for e in enterprises if e["risk"] == "中"]
-    flows = {
-        "转居民保": sum(1 for r in residents if r["pause_flow"] == "转居民保"),
-        "申请停保": sum(1 for r in residents if r["pause_flow"] == "申请停保"),
-        "跨区转出": sum(1 for r in residents if r["pause_flow"] == "跨区转出"),
+    hit = _columnar(residents, "risk")
+    if hit is not None:
+        return hit
+    c = {
+        "risk_high": sum(1 for e in enterprises if e["risk"] == "高"),
+        "risk_mid": sum(1 for e in enterprises if e["risk"] == "中"),
+    }
+    for i, name in enumerate(PAUSE_FLOWS):
+        c[f"pause{i}"] = sum(1 for r in residents if r["pause_flow"] == name)
+    return _risk_payload(c)
+
+
+# ── SQL 下推引擎 ─────────────────────────────────────────────────────────────
+# 每张表一条 SUM(CASE ...) 聚合查询，数据库只回传几十个计数单元格，
+# 不再把整个范围的居民行搬进 Python。SQLite 与 MySQL 共用同一套 SQL。
+def _in_marks(values):
+    return ",".join(["?"] * len(values))
+
+
+_LOSS_FREE = (
+    f"stock_change_type NOT IN ({_in_marks(CONFIRMED_LOSSES)}) "
+    f"AND loss_reason NOT IN ({_in_marks(CONFIRMED_LOSSES)})"
+)
+
+
+def _resident_counter_defs(codec=PLAIN):
+    """居民表的可加计数器：(名称, 条件 SQL, 条件参数)；字典编码存储时参数为编码。"""
+    def enc(column, value):
+        return codec.encode("residents", column, value)
+
+    losses = [enc("stock_change_type", x) for x in CONFIRMED_LOSSES] + [enc("loss_reason", x) for x in CONFIRMED_LOSSES]
+    staff, resident = enc("this_year_type", "职工保"), enc("this_year_type", "居民保")
+    defs = [
+        ("total_pop", "1=1", []),
+        ("done_total", "this_year_paid=1", []),
+        ("done_staff", "this_year_paid=1 AND this_year_type=?", [staff]),
+        ("done_resident", "this_year_paid=1 AND this_year_type=?", [resident]),
+        ("mobilizable_stock", f"stock_change_type=? AND this_year_paid=0 AND {_LOSS_FREE}", [enc("stock_change_type", "可动员")] + losses),
+        (
+            "mobilizable_increment",
+            f"this_year_paid=0 AND last_year_local_paid=0 AND {_LOSS_FREE} AND (household=? OR residence=?)",
+            losses + [enc("household", "本区户籍"), enc("residence", "本区居住")],
+        ),
+        ("staff_people", "this_year_type=?", [staff]),
+    ]
+    for i, (_, lo, hi) in enumerate(AGE_GROUPS):
+        cond, params = [], []
+        if lo is not None:
+            cond.append("age>=?")
+            params.append(lo)
+        if hi is not None:
+            cond.append("age<=?")
+            params.append(hi)
+        age_cond = " AND ".join(cond)
+        defs.append((f"age{i}_count", age_cond, params))
+        defs.append((f"age{i}_insured", f"{age_cond} AND this_year_paid=1", params))
+        defs.append((f"age{i}_male", f"{age_cond} AND gender=?", params + ["男"]))
+    for i, name in enumerate(PAUSE_FLOWS):
+        defs.append((f"pause{i}", "pause_flow=?", [enc("pause_flow", name)]))
+    return defs
+
+
+def _enterprise_counter_defs(codec=PLAIN):
+    return [
+        ("units_total", "1=1", []),
+        ("units_insured", "staff_insured=1", []),
+        ("units_last", "last_month_staff_insured=1", []),
+        ("risk_high", "risk=?", [codec.encode("enterprises", "risk", "高")]),
+        ("risk_mid", "risk=?", [codec.encode("enterprises", "risk", "中")]),
+    ]
+
+
+RESIDENT_COUNTERS = _resident_counter_defs()
+ENTERPRISE_COUNTERS = _enterprise_counter_defs()
+COUNTER_NAMES = tuple(name for name, _, _ in RESIDENT_COUNTERS + ENTERPRISE_COUNTERS)
+METRIC_PARTS = ("core", "age", "staff", "risk")
+
+
+def metrics_from_counters(c, staff_big, staff_detail, parts=METRIC_PARTS):
+    """由完整计数器组装 {part: payload}；staff_big / staff_detail 需按首次出现顺序排列。"""
+    builders = {
+        "core": lambda: _core_payload(c),
+        "age": lambda: _age_payload(c),
+        "staff": lambda: _staff_payload(c, staff_big, staff_detail),
+        "risk": lambda: _risk_payload(c),
     }
-    return {"high_risk_enterprises": len(high), "mid_risk_enterprises": len(mid), "pause_flows": flows}
+    return {part: builders[part]() for part in METRIC_PARTS if part in parts}
+
+
+def counter_defs(codec):
+    """(居民计数器, 企业计数器, 职工保的存储值)，按编解码表缓存。"""
+    if not codec.active:
+        return RESIDENT_COUNTERS, ENTERPRISE_COUNTERS, "职工保"
+    hit = codec.cache.get("counter_defs")
+    if hit is None:
+        hit = codec.cache["counter_defs"] = (
+            _resident_counter_defs(codec),
+            _enterprise_counter_defs(codec),
+            codec.encode("residents", "this_year_type", "职工保"),
+        )
+    return hit
+
+
+def sum_case_columns(defs):
+    cols, params = [], []
+    for name, cond, cond_params in defs:
+        cols.append(f"SUM(CASE WHEN {cond} THEN 1 ELSE 0 END) AS {name}")
+        params.extend(cond_params)
+    return ", ".join(cols), params
+
+
+def _scan_key_sql():
+    """逐行引擎按 (unit_id, id) 顺序读到各行；分类计数的键顺序以此为准。"""
+    if DB_ENGINE == "mysql":
+        return "CONCAT(unit_id, CHAR(1), id)"
+    return "unit_id || char(1) || id"
+
+
+def ordered_counts(groups, key_index):
+    """按首次出现顺序合并分组计数，与逐行引擎中 Counter 的插入顺序一致。"""
+    counts, first = {}, {}
+    for g in groups:
+        key, n, seen = g[key_index], g[2], g[3]
+        if not key or not n:
+            continue
+        counts[key] = counts.get(key, 0) + n
+        first[key] = min(first.get(key, seen), seen)
+    return {k: counts[k] for k in sorted(counts, key=lambda k: first[k])}
+
+
+def compute_metrics_sql(conn, unit_ids, year, parts=METRIC_PARTS):
+    """SQL 下推版指标计算，返回 {part: payload}，内容与逐行引擎逐字节一致。"""
+    unit_ids = list(unit_ids)
+    counters = dict.fromkeys(COUNTER_NAMES, 0)
+    groups = []
+    if unit_ids:
+        codec = get_codec(conn)
+        resident_defs, enterprise_defs, staff_type = counter_defs(codec)
+        cols, params = sum_case_columns(resident_defs)
+        sql = (
+            f"SELECT staff_big_type, staff_detail_type, {cols}, "
+            f"MIN(CASE WHEN this_year_type=? THEN {_scan_key_sql()} END) AS staff_first "
+            f"FROM residents WHERE year=? AND unit_id IN ({_in_marks(unit_ids)}) "
+            "GROUP BY staff_big_type, staff_detail_type"
+        )
+        for r in conn.execute(sql, params + [staff_type, year] + unit_ids).fetchall():
+            for name, _, _ in resident_defs:
+                counters[name] += int(r[name] or 0)
+            if r["staff_people"]:
+                groups.append((
+                    codec.decode("residents", "staff_big_type", r["staff_big_type"]),
+                    codec.decode("residents", "staff_detail_type", r["staff_detail_type"]),
+                    int(r["staff_people"]),
+                    r["staff_first"],
+                ))
+
+        if "staff" in parts or "risk" in parts:
+            cols, params = sum_case_columns(enterprise_defs)
+            sql = f"SELECT {cols} FROM enterprises WHERE year=? AND unit_id IN ({_in_marks(unit_ids)})"
+            r = conn.execute(sql, params + [year] + unit_ids).fetchone()
+            for name, _, _ in enterprise_defs:
+                counters[name] = int(r[name] or 0)
+
+    return metrics_from_counters(counters, ordered_counts(groups, 0), ordered_counts(groups, 1), parts)
+
+
+# ── 单遍融合内核 ─────────────────────────────────────────────────────────────
+# 居民、企业各只遍历一次，同时填满 core / age / staff / risk 所需的全部计数器。
+# 行按 *_METRIC_COLUMNS 的列顺序以元组传入，循环内按位置解包，不做按名取值。
+RESIDENT_METRIC_COLUMNS = (
+    "this_year_paid", "this_year_type", "stock_change_type", "loss_reason", "last_year_local_paid",
+    "household", "residence", "age", "gender", "staff_big_type", "staff_detail_type", "pause_flow",
+)
+ENTERPRISE_METRIC_COLUMNS = ("staff_insured", "last_month_staff_insured", "risk")
+
 
+def _age_slots(age):
+    return tuple(i for i, (_, lo, hi) in enumerate(AGE_GROUPS) if (lo is None or age >= lo) and (hi is None or age <= hi))
 
-def query_residents(conn, unit_ids, year, filters):
+
+_AGE_SLOT_TABLE = [_age_slots(a) for a in range(151)]
+
+
+def fetch_metric_rows(conn, table, unit_ids, year):
+    """按内核所需列取回范围内的行（元组列表）。"""
+    if not unit_ids:
+        return []
+    columns = RESIDENT_METRIC_COLUMNS if table == "residents" else ENTERPRISE_METRIC_COLUMNS
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE year=? AND unit_id IN ({_in_marks(unit_ids)})"
+    return fetch_tuples(conn, sql, [year] + list(unit_ids))
+
+
+def compute_all_metrics(residents, enterprises=(), parts=METRIC_PARTS, codec=PLAIN):
+    """
+    单遍计算全部指标，返回 {part: payload}，内容与逐行引擎逐字节一致。
+    字典编码存储时行内是编码：口径常量先换成编码再比较，只在最后还原分类计数的键。
+    """
+    def enc(column, value):
+        return codec.encode("residents", column, value)
+
+    stock_losses = {enc("stock_change_type", x) for x in CONFIRMED_LOSSES}
+    loss_reasons = {enc("loss_reason", x) for x in CONFIRMED_LOSSES}
+    staff_type, resident_type = enc("this_year_type", "职工保"), enc("this_year_type", "居民保")
+    mobilizable = enc("stock_change_type", "可动员")
+    local_household, local_residence = enc("household", "本区户籍"), enc("residence", "本区居住")
+    risk_high_code = codec.encode("enterprises", "risk", "高")
+    risk_mid_code = codec.encode("enterprises", "risk", "中")
+    pause_index = {enc("pause_flow", name): i for i, name in enumerate(PAUSE_FLOWS)}
+    slot_table = _AGE_SLOT_TABLE
+    age_count = [0] * len(AGE_GROUPS)
+    age_insured = [0] * len(AGE_GROUPS)
+    age_male = [0] * len(AGE_GROUPS)
+    pause = [0] * len(PAUSE_FLOWS)
+    staff_big, staff_detail = {}, {}
+    total = done_total = done_staff = done_resident = 0
+    mob_stock = mob_increment = staff_people = 0
+
+    for paid, ytype, stock, loss, last_local, household, residence, age, gender, big, detail, flow in residents:
+        total += 1
+        if paid == 1:
+            done_total += 1
+            if ytype == staff_type:
+                done_staff += 1
+            elif ytype == resident_type:
+                done_resident += 1
+        elif paid == 0 and stock not in stock_losses and loss not in loss_reasons:
+            if stock == mobilizable:
+                mob_stock += 1
+            if last_local == 0 and (household == local_household or residence == local_residence):
+                mob_increment += 1
+        if ytype == staff_type:
+            staff_people += 1
+            if big:
+                staff_big[big] = staff_big.get(big, 0) + 1
+            if detail:
+                staff_detail[detail] = staff_detail.get(detail, 0) + 1
+        for g in (slot_table[age] if 0 <= age < len(slot_table) else _age_slots(age)):
+            age_count[g] += 1
+            if paid == 1:
+                age_insured[g] += 1
+            if gender == "男":
+                age_male[g] += 1
+        if flow:
+            i = pause_index.get(flow)
+            if i is not None:
+                pause[i] += 1
+
+    units_total = units_insured = units_last = risk_high = risk_mid = 0
+    for insured, last, risk in enterprises:
+        units_total += 1
+        if insured == 1:
+            units_insured += 1
+        if last == 1:
+            units_last += 1
+        if risk == risk_high_code:
+            risk_high += 1
+        elif risk == risk_mid_code:
+            risk_mid += 1
+
+    if codec.active:
+        staff_big = codec.decode_keys("residents", "staff_big_type", staff_big)
+        staff_detail = codec.decode_keys("residents", "staff_detail_type", staff_detail)
+    c = {
+        "total_pop": total, "done_total": done_total, "done_staff": done_staff, "done_resident": done_resident,
+        "mobilizable_stock": mob_stock, "mobilizable_increment": mob_increment, "staff_people": staff_people,
+        "units_total": units_total, "units_insured": units_insured, "units_last": units_last,
+        "risk_high": risk_high, "risk_mid": risk_mid,
+    }
+    for i in range(len(AGE_GROUPS)):
+        c[f"age{i}_count"] = age_count[i]
+        c[f"age{i}_insured"] = age_insured[i]
+        c[f"age{i}_male"] = age_male[i]
+    for i in range(len(PAUSE_FLOWS)):
+        c[f"pause{i}"] = pause[i]
+
+    return metrics_from_counters(c, staff_big, staff_detail, parts)
+
+
+# ── 列表分页 ───────────────────────────────────────────────────────────────────
+# 两种翻页方式：
+#   offset 模式（兼容旧客户端）：ORDER BY id LIMIT ? OFFSET ?；
+#   游标模式：传入上一页返回的 next_cursor 作为 after，按 id > 上页末行 id 续读，
+#   深页与首页代价相同。游标内含筛选条件哈希（防止换了条件继续用旧游标）与首页算出的总数，
+#   后续页不再执行 COUNT。
+PAGING_KEYS = ("limit", "offset", "after", "with_total")
+# 等值筛选的标签列（unit_tag_counts 按这些列维护分单元计数，供近似总数使用）
+RESIDENT_TAG_COLUMNS = (
+    "household", "residence", "residence_detail", "insured_place", "this_year_type", "stock_change_type",
+    "loss_reason", "pause_flow", "key_group", "hardship_type", "staff_big_type", "staff_detail_type", "gender",
+)
+ENTERPRISE_TAG_COLUMNS = ("risk", "staff_insured")
+TAG_COLUMNS = {"residents": RESIDENT_TAG_COLUMNS, "enterprises": ENTERPRISE_TAG_COLUMNS}
+
+
+class InvalidCursor(ValueError):
+    """after 游标无法解析，或与当前筛选条件不匹配。"""
+
+
+def filter_hash(table, unit_ids, year, filters):
+    norm = sorted((k, str(v)) for k, v in filters.items() if k not in PAGING_KEYS and v not in (None, ""))
+    raw = json.dumps([table, sorted(unit_ids), int(year), norm], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(last_id, fhash, total):
+    raw = json.dumps([last_id, fhash, total], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, fhash):
+    """返回 (last_id, total)；total 为 None 表示首页未计算总数。"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        last_id, token_hash, total = json.loads(raw.decode("utf-8"))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor("游标无效") from None
+    if token_hash != fhash:
+        raise InvalidCursor("筛选条件已变化，请从第一页重新加载")
+    return last_id, total
+
+
+def _tag_filters(table, filters):
+    """筛选条件全部是标签列时返回 {列: 值}，否则返回 None（无法用标签计数 / 列式数据回答）。"""
+    active = {k: v for k, v in filters.items() if k not in PAGING_KEYS and v not in (None, "")}
+    if table == "enterprises" and active.get("staff_insured") not in (None, 0, 1, "0", "1"):
+        active.pop("staff_insured")
+    if any(k not in TAG_COLUMNS[table] for k in active):
+        return None
+    return active
+
+
+def _rows_by_ids(conn, sql, params, ids):
+    """按 id 取本页行，并用原查询条件复核：位图快照落后于写入时，已不满足条件的行不会返回。"""
+    if not ids:
+        return []
+    return conn.execute(sql + f" AND id IN ({_in_marks(ids)}) ORDER BY id", params + list(ids)).fetchall()
+
+
+def _paginate(conn, table, unit_ids, year, sql, params, filters, fhash, version=None):
+    """
+    执行分页查询，返回 (rows, total, next_cursor)。
+    with_total：True 精确总数（走 list_counts 缓存），"approx" 允许近似总数，False 不计算（None）。
+    只有标签筛选且启用了位图索引（BITMAP_INDEX=1）时，本页 id 与精确总数直接由位图给出；
+    version 为该表已读到的数据版本（计算 ETag 时读取），位图快照比它旧时先重建。
+    """
+    import bitmap_index
+
+    limit = int(filters.get("limit", 100))
+    # 多取一行判断是否还有下一页；limit 为负（不限条数）时不生成游标
+    fetch = limit + 1 if limit >= 0 else limit
+    want_total = filters.get("with_total", True)
+    tags = _tag_filters(table, filters)
+    last_id, total = decode_cursor(filters["after"], fhash) if filters.get("after") else (None, None)
+    rows = None
+    if tags is not None:
+        offset = 0 if filters.get("after") else int(filters.get("offset", 0))
+        hit = bitmap_index.page(conn, table, unit_ids, year, tags, last_id, offset, fetch, version=version)
+        if hit is not None:
+            ids, matched = hit
+            rows = _rows_by_ids(conn, sql, params, ids)
+            if len(rows) != len(ids):
+                # 复核时有行已不满足条件：快照落后于写入，本页与总数改走 SQL
+                rows = None
+            elif total is None and want_total:
+                total = matched
+    if rows is None and filters.get("after"):
+        rows = conn.execute(sql + " AND id>? ORDER BY id LIMIT ?", params + [last_id, fetch]).fetchall()
+    elif rows is None:
+        rows = conn.execute(sql + " ORDER BY id LIMIT ? OFFSET ?", params + [fetch, filters.get("offset", 0)]).fetchall()
+    if total is None and want_total:
+        total = list_counts.count_total(
+            conn, table, unit_ids, year, sql, params, fhash,
+            tag_filters=tags, approx=want_total == "approx",
+        )
+    next_cursor = None
+    if 0 <= limit < len(rows):
+        rows = rows[:limit]
+        if rows:
+            next_cursor = encode_cursor(rows[-1]["id"], fhash, total)
+    return rows, total, next_cursor
+
+
+def query_residents(conn, unit_ids, year, filters, version=None):
     marks = ",".join(["?"] * len(unit_ids))
     sql = f"SELECT * FROM residents WHERE year=? AND unit_id IN ({marks})"
     params = [year] + list(unit_ids)
 
-    if filters.get("name"):
-        sql += " AND name LIKE ?"
-        params.append(f"%{filters['name']}%")
-    if filters.get("phone"):
-        sql += " AND phone LIKE ?"
-        params.append(f"%{filters['phone']}%")
-    if filters.get("address"):
-        sql += " AND (household_addr LIKE ? OR residence_addr LIKE ?)"
-        params.extend([f"%{filters['address']}%", f"%{filters['address']}%"])
-
-    # fixed tag groups
-    for k in [
-        "household", "residence", "residence_detail", "insured_place", "this_year_type", "stock_change_type",
-        "loss_reason", "pause_flow", "key_group", "hardship_type", "staff_big_type", "staff_detail_type", "gender",
-    ]:
+    # 子串检索：走 n-gram 索引预筛（见 search_index.py），结果与 LIKE '%x%' 一致
+    for k in ("name", "phone", "address"):
+        if filters.get(k):
+            clause, clause_params = search_clause(conn, "residents", k, filters[k])
+            sql += clause
+            params.extend(clause_params)
+
+    # fixed tag groups（字典编码存储时筛选值换成编码）
+    codec = get_codec(conn)
+    for k in RESIDENT_TAG_COLUMNS:
         if filters.get(k):
             sql += f" AND {k}=?"
-            params.append(filters[k])
+            params.append(codec.encode("residents", k, filters[k]))
 
-    rows = conn.execute(sql + " ORDER BY id LIMIT ? OFFSET ?", params + [filters.get("limit", 100), filters.get("offset", 0)]).fetchall()
-    total = conn.execute("SELECT COUNT(1) c FROM (" + sql + ")", params).fetchone()["c"]
-    return rows, total
+    return _paginate(conn, "residents", unit_ids, year, sql, params, filters,
+                     filter_hash("residents", unit_ids, year, filters), version)
 
 
-def query_enterprises(conn, unit_ids, year, filters):
+def query_enterprises(conn, unit_ids, year, filters, version=None):
     marks = ",".join(["?"] * len(unit_ids))
     sql = f"SELECT * FROM enterprises WHERE year=? AND unit_id IN ({marks})"
     params = [year] + list(unit_ids)
 
-    if filters.get("name"):
-        sql += " AND name LIKE ?"
-        params.append(f"%{filters['name']}%")
-    if filters.get("contact_person"):
-        sql += " AND contact_person LIKE ?"
-        params.append(f"%{filters['contact_person']}%")
-    if filters.get("address"):
-        sql += " AND address LIKE ?"
-        params.append(f"%{filters['address']}%")
-
-    for k in ["risk"]:
+    for k in ("name", "contact_person", "address"):
         if filters.get(k):
-            sql += f" AND {k}=?"
-            params.append(filters[k])
+            clause, clause_params = search_clause(conn, "enterprises", k, filters[k])
+            sql += clause
+            params.extend(clause_params)
+
+    if filters.get("risk"):
+        sql += " AND risk=?"
+        params.append(get_codec(conn).encode("enterprises", "risk", filters["risk"]))
     if filters.get("staff_insured") in [0, 1, "0", "1"]:
         sql += " AND staff_insured=?"
         params.append(int(filters["staff_insured"]))
 
-    rows = conn.execute(sql + " ORDER BY id LIMIT ? OFFSET ?", params + [filters.get("limit", 100), filters.get("offset", 0)]).fetchall()
-    total = conn.execute("SELECT COUNT(1) c FROM (" + sql + ")", params).fetchone()["c"]
-    return rows, total
+    return _paginate(conn, "enterprises", unit_ids, year, sql, params, filters,
+                     filter_hash("enterprises", unit_ids, year, filters), version)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tag_codes.py — 居民 / 企业标签列的字典编码存储（可选）
+
+household、stock_change_type、staff_detail_type、risk 等标签列在每一行都重复存放
+同样几个中文长字符串，而 dictionaries 表已经列出了每个分类的全部合法取值。
+字典编码模式下这些列改存对应的 dictionaries.id（十进制字符串，如 '17'；空串仍为空串），
+行宽、覆盖索引体积和指标内核里的比较代价随之下降：
+  - 查询：筛选值、指标口径常量先经 encode() 换成编码，再进入 SQL / 指标内核；
+  - 输出：行映射（server.row_to_dict / _map_resident）与分类计数的键经 decode() 还原，
+    接口返回的文字与文字存储模式逐字节一致。
+
+已编码的列记录在 tag_encodings 表中（空表 = 文字存储），编解码表按进程缓存，
+转换后需重启后端服务。转换 / 还原见 migrate_add_tag_codes.py；性别列受 CHECK 约束
+限制，保持文字。数据中出现而字典里没有的取值在转换时补进 dictionaries（enabled=0，
+不出现在筛选项中），保证转换可逆。
+"""
+import threading
+
+from db import DB_ENGINE
+
+# 可编码的标签列 → dictionaries 分类
+ENCODED_COLUMNS = {
+    "residents": {
+        "household": "居民户籍",
+        "residence": "居民居住",
+        "residence_detail": "居民居住细分",
+        "insured_place": "参保地",
+        "this_year_type": "今年参保类型",
+        "stock_change_type": "存量变化类型",
+        "loss_reason": "存量减员原因",
+        "pause_flow": "职工减员流向",
+        "key_group": "重点对象",
+        "hardship_type": "资助对象细类",
+        "staff_big_type": "职工参保大类",
+        "staff_detail_type": "职工参保细类",
+    },
+    "enterprises": {
+        "risk": "企业风险等级",
+    },
+}
+# 转换时补进字典的取值排在已有取值之后
+UNLISTED_SORT_ORDER = 999
+
+_ID_TEXT = "CAST(d.id AS CHAR)" if DB_ENGINE == "mysql" else "CAST(d.id AS TEXT)"
+
+# ── 建表 DDL（供迁移脚本使用，与 schema.sql / schema_mysql.sql 保持一致）────────
+_DDL_SQLITE = """
+CREATE TABLE IF NOT EXISTS tag_encodings (
+  table_name TEXT NOT NULL,
+  column_name TEXT NOT NULL,
+  category TEXT NOT NULL,
+  PRIMARY KEY (table_name, column_name)
+);
+"""
+
+_DDL_MYSQL = """
+CREATE TABLE IF NOT EXISTS tag_encodings (
+    table_name  VARCHAR(32) NOT NULL,
+    column_name VARCHAR(64) NOT NULL,
+    category    VARCHAR(64) NOT NULL,
+    PRIMARY KEY (table_name, column_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+"""
+
+DDL = _DDL_MYSQL if DB_ENGINE == "mysql" else _DDL_SQLITE
+
+
+def dictionary_upsert_sql():
+    """
+    写入字典取值且保持已有行的 id 不变（REPLACE 会删行重插、换掉 id，
+    编码存储的数据随之失配）。参数为 (category, value, sort_order)。
+    """
+    if DB_ENGINE == "mysql":
+        return (
+            "INSERT INTO dictionaries(category, value, sort_order) VALUES(?,?,?) "
+            "ON DUPLICATE KEY UPDATE sort_order=VALUES(sort_order), enabled=1"
+        )
+    return (
+        "INSERT INTO dictionaries(category, value, sort_order) VALUES(?,?,?) "
+        "ON CONFLICT(category, value) DO UPDATE SET sort_order=excluded.sort_order, enabled=1"
+    )
+
+
+class TagCodec:
+    """已编码列的编解码表；没有已编码列时各方法原样返回（文字存储）。"""
+
+    def __init__(self, columns=(), entries=()):
+        self.columns = frozenset(columns)
+        self.active = bool(self.columns)
+        # 供调用方缓存派生结果（如换成编码的指标计数器定义）
+        self.cache = {}
+        by_category = {}
+        for code, category, value in entries:
+            by_category.setdefault(category, []).append((str(code), value))
+        self._enc, self._dec, self._by_table = {}, {}, {}
+        for table, column in self.columns:
+            pairs = by_category.get(ENCODED_COLUMNS[table][column], [])
+            self._enc[(table, column)] = {value: code for code, value in pairs}
+            self._dec[(table, column)] = dec = {code: value for code, value in pairs}
+            self._by_table.setdefault(table, []).append((column, dec))
+
+    def encode(self, table, column, value):
+        """文字 → 存储值。列未编码时原样返回；字典中没有的取值也原样返回（不会匹配到任何编码行）。"""
+        m = self._enc.get((table, column))
+        if m is None:
+            return value
+        return m.get(value, value)
+
+    def decode(self, table, column, stored):
+        """存储值 → 文字。"""
+        m = self._dec.get((table, column))
+        if m is None or not stored:
+            return stored
+        return m.get(str(stored), stored)
+
+    def decode_row(self, table, d):
+        """把 dict 行中已编码的列原地还原为文字，返回 d。"""
+        for column, dec in self._by_table.get(table, ()):
+            v = d.get(column)
+            if v:
+                d[column] = dec.get(str(v), v)
+        return d
+
+    def decode_keys(self, table, column, counts):
+        """还原分类计数 {存储值: 数量} 的键，保持原有顺序。"""
+        if (table, column) not in self._dec:
+            return counts
+        return {self.decode(table, column, k): v for k, v in counts.items()}
+
+
+PLAIN = TagCodec()
+
+_codec = None
+_lock = threading.Lock()
+
+
+def load_codec(conn):
+    """读取 tag_encodings 与 dictionaries 构造编解码表；标记表不存在（旧库）时视为文字存储。"""
+    try:
+        rows = conn.execute("SELECT table_name, column_name FROM tag_encodings").fetchall()
+    except Exception:
+        return PLAIN
+    columns = {
+        (r["table_name"], r["column_name"]) for r in rows
+        if r["column_name"] in ENCODED_COLUMNS.get(r["table_name"], {})
+    }
+    if not columns:
+        return PLAIN
+    entries = [(r["id"], r["category"], r["value"]) for r in conn.execute("SELECT id, category, value FROM dictionaries").fetchall()]
+    return TagCodec(columns, entries)
+
+
+def get_codec(conn):
+    """进程级编解码表（首次调用时加载）。"""
+    global _codec
+    if _codec is None:
+        with _lock:
+            if _codec is None:
+                _codec = load_codec(conn)
+    return _codec
+
+
+def reset():
+    global _codec
+    with _lock:
+        _codec = None
+
+
+# ── 整表转换（migrate_add_tag_codes.py / seed_db.py 使用）────────────────────
+def encoded_columns(conn):
+    try:
+        rows = conn.execute("SELECT table_name, column_name FROM tag_encodings").fetchall()
+    except Exception:
+        return set()
+    return {(r["table_name"], r["column_name"]) for r in rows}
+
+
+def _register_values(conn, table, columns):
+    """把数据中出现、字典里没有的取值补进 dictionaries（enabled=0）。返回补入条数。"""
+    added = 0
+    for column in columns:
+        category = ENCODED_COLUMNS[table][column]
+        known = {r["value"] for r in conn.execute("SELECT value FROM dictionaries WHERE category=?", [category]).fetchall()}
+        values = [r["v"] for r in conn.execute(f"SELECT DISTINCT {column} AS v FROM {table} WHERE {column}<>''").fetchall()]
+        missing = sorted(v for v in values if v not in known)
+        conn.executemany(
+            "INSERT INTO dictionaries(category, value, sort_order, enabled) VALUES(?,?,?,0)",
+            [(category, v, UNLISTED_SORT_ORDER) for v in missing],
+        )
+        added += len(missing)
+    return added
+
+
+def encode_tables(conn):
+    """把尚未编码的标签列整表转换为字典编码（每张表一条 UPDATE），返回新编码的 [(表, 列)]。"""
+    conn.executescript(DDL)
+    done = encoded_columns(conn)
+    converted = []
+    for table, columns in ENCODED_COLUMNS.items():
+        todo = [c for c in columns if (table, c) not in done]
+        if not todo:
+            continue
+        _register_values(conn, table, todo)
+        sets = ", ".join(
+            f"{c} = CASE WHEN {c}='' THEN '' ELSE "
+            f"(SELECT {_ID_TEXT} FROM dictionaries d WHERE d.category=? AND d.value={table}.{c}) END"
+            for c in todo
+        )
+        conn.execute(f"UPDATE {table} SET {sets}", [columns[c] for c in todo])
+        conn.executemany(
+            "INSERT INTO tag_encodings(table_name, column_name, category) VALUES(?,?,?)",
+            [(table, c, columns[c]) for c in todo],
+        )
+        converted.extend((table, c) for c in todo)
+    conn.commit()
+    reset()
+    return converted
+
+
+def decode_tables(conn):
+    """把已编码的列整表还原为文字，返回还原的 [(表, 列)]。"""
+    done = encoded_columns(conn)
+    restored = []
+    for table in ENCODED_COLUMNS:
+        todo = sorted(c for t, c in done if t == table)
+        if not todo:
+            continue
+        sets = ", ".join(
+            f"{c} = CASE WHEN {c}='' THEN '' ELSE "
+            f"COALESCE((SELECT d.value FROM dictionaries d WHERE {_ID_TEXT}={table}.{c}), {c}) END"
+            for c in todo
+        )
+        conn.execute(f"UPDATE {table} SET {sets}")
+        conn.execute(
+            f"DELETE FROM tag_encodings WHERE table_name=? AND column_name IN ({','.join(['?'] * len(todo))})",
+            [table] + todo,
+        )
+        restored.extend((table, c) for c in todo)
+    conn.commit()
+    reset()
+    return restored
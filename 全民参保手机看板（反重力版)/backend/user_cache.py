@@ -0,0 +1,78 @@
+"""
+user_cache.py — 已登录用户的进程内缓存
+
+每个需要鉴权的请求都要按 token 中的 uid 查一次 users（SELECT * ... AND enabled=1）。
+这里按 uid 缓存查询结果（含“不存在 / 已停用”），有效期 AUTH_USER_CACHE_TTL 秒，
+命中时鉴权只剩一次字典查找。
+
+失效：users 上的触发器在每次变更时递增 data_versions 中 'users' 的版本号，
+按 AUTH_USER_CHECK_INTERVAL 探测（与 org_tree.py 相同），版本变化即清空缓存——
+停用或修改用户后至多一个探测间隔即生效，pre-fork 的各工作进程也是如此。
+本进程内修改 users 的代码可直接调用 invalidate()。
+每次清除都递增代数（_generation）；未命中时先记下代数再查库，写回前代数已变说明
+查询期间发生过失效，查到的可能是旧行，不再写入缓存。
+旧库尚未为 users 建版本触发器（执行 migrate_add_data_versions.py）时只靠 TTL 过期。
+
+相关环境变量：
+  AUTH_USER_CACHE_SIZE       缓存用户数，默认 1024，0 = 不缓存
+  AUTH_USER_CACHE_TTL        缓存有效期（秒），默认 30
+  AUTH_USER_CHECK_INTERVAL   版本探测间隔（秒），默认 1，0 = 每次都探测
+"""
+import os
+import threading
+import time
+
+from db import read_data_version
+from ttl_cache import TTLCache
+
+CHECK_INTERVAL = float(os.getenv("AUTH_USER_CHECK_INTERVAL", "1"))
+
+_MISSING = object()
+_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AUTH_USER_CACHE_TTL", "30")),
+)
+_lock = threading.Lock()
+_version = None
+_checked_at = 0.0
+_generation = 0
+
+
+def _check_version(conn):
+    global _version, _checked_at, _generation
+    now = time.monotonic()
+    if now - _checked_at < CHECK_INTERVAL:
+        return
+    version = read_data_version(conn, "users")
+    with _lock:
+        if version != _version:
+            _cache.clear()
+            _generation += 1
+            _version = version
+        _checked_at = now
+
+
+def get_user(conn, user_id):
+    """已启用用户的行（dict，各请求共享，不得修改）；不存在或已停用时返回 None。"""
+    if _cache.enabled:
+        _check_version(conn)
+    user = _cache.get(user_id, _MISSING)
+    if user is _MISSING:
+        generation = _generation
+        row = conn.execute("SELECT * FROM users WHERE id=? AND enabled=1", [user_id]).fetchone()
+        user = dict(row) if row is not None else None
+        with _lock:
+            if generation == _generation:
+                _cache.set(user_id, user)
+    return user
+
+
+def invalidate(user_id=None):
+    """清除某个用户（user_id 为 None 时清除全部）的缓存。"""
+    global _generation
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id)
+        _generation += 1